@@ -1,10 +1,13 @@
 import dash
 # https://dash.plotly.com/dash-core-components
-from dash import dcc, dash_table, html
+from dash import ctx, dcc, dash_table, html
 from dash.dash_table import FormatTemplate
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 from flask_caching import Cache
+from flask import Response, jsonify, request
+from flask_compress import Compress
 
 # https://dashcheatsheet.pythonanywhere.com/
 
@@ -16,68 +19,155 @@ import plotly.figure_factory as ff
 import pandas as pd
 import numpy as np
 
-from utilities.data import get_table
-from utilities.calculation import running_sum
+from utilities.dataset import load_dataset, source_counts
+from utilities.refresh import LAZY_STARTUP, DataRefresher
+from utilities.sql_engine import QUERY_ENGINE, load_sql_dataset
+from utilities.datatable import create_markdown_url
+from utilities.export import EXPORT_FORMATS, EXPORT_MAX_ROWS, export_chunks, export_filters, export_url
+from utilities.memo import FilterMemo, FilterSequencer, cache_config
+from utilities.metrics import CallbackMetrics
+from utilities.reduction import SCATTER_POINT_BUDGET
+from utilities.responses import compress_config, use_orjson
+from utilities.similar import SIMILAR_K
 
-from datetime import datetime, timedelta
+from datetime import datetime
+from uuid import uuid4
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.SLATE])
 server = app.server
-cache = Cache(app.server, config={
-    'CACHE_TYPE': 'filesystem',
-    'CACHE_DIR': 'cache-directory'
-})
+# Time, response size and row count of every callback declared below, served on /metrics
+metrics = CallbackMetrics()
+metrics.instrument(app)
+# Responses are encoded by orjson, then Brotli or gzip compressed above COMPRESS_MIN_SIZE bytes
+use_orjson()
+server.config.update(compress_config())
+metrics.instrument_compression(server, Compress())
+cache = Cache(app.server, config=cache_config())
 TIMEOUT = 60
 
 percentage = FormatTemplate.percentage(0)
 
-# Import data from postgresql
-filter_date = datetime.today() - timedelta(days=40)
-# raw data
-df_raw = get_table("master", max_scraped_date=filter_date.date())
-df_raw_daily_count = df_raw[['scraped_date', 'source', 'url']].groupby(by=['scraped_date', 'source'], axis=0,
-                                                                       as_index=False).count()
-# clean data
-df_clean_pro = get_table("master_clean_pro")
-df_clean_pro.sort_values('scraped_date', ascending=False, inplace=True)
-df_clean_pro_daily_count = df_clean_pro[['scraped_date', 'url']].groupby(by=['scraped_date'], axis=0,
-                                                                         as_index=False).count()
-df_clean_pro_daily_count['cumul_count'] = df_clean_pro_daily_count.apply(
-    lambda x: running_sum(df_clean_pro_daily_count, x.scraped_date), axis=1)
+# With QUERY_ENGINE=sql master_clean_pro stays in the database and every filter is answered there,
+# QUERY_ENGINE=duckdb answers the same queries from an embedded DuckDB over the loaded table
+if QUERY_ENGINE == 'duckdb':
+    from utilities.duck_engine import load_duck_dataset as load
+elif QUERY_ENGINE == 'sql':
+    load = load_sql_dataset
+else:
+    load = load_dataset
+
+# Import data from postgresql, then keep it current in the background. With LAZY_STARTUP the import
+# itself runs in the background and the layout is served before the data is there.
+if LAZY_STARTUP:
+    refresher = DataRefresher(None)
+    refresher.start(load)
+else:
+    refresher = DataRefresher(load())
+    refresher.start()
+
+
+@server.route('/refresh-status')
+def refresh_status():
+    version = refresher.dataset.version if refresher.ready else None
+    return jsonify(version=version, history=list(refresher.history))
+
+
+@server.route('/ready')
+def ready():
+    # Readiness probe: 503 until the data is loaded
+    if not refresher.ready:
+        return jsonify(ready=False), 503
+    return jsonify(ready=True, version=refresher.dataset.version)
+
+
+# Only the latest filter state of a browser session is computed, older ones are dropped
+sequencer = FilterSequencer(cache)
+# Filter-driven figures and tables are cached per normalized filter state and data version
+memoize = FilterMemo(cache,
+                     version=lambda: refresher.dataset.version,
+                     bounds=lambda: refresher.dataset.bounds,
+                     timeout=TIMEOUT,
+                     superseded=sequencer.superseded,
+                     record=metrics.observe_cache)
+
+
+@server.route('/cache-stats')
+def cache_stats():
+    # added up over every worker, as /metrics
+    return jsonify(metrics.cache_stats())
+
+
+@server.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@server.route('/export.<any(csv, parquet):fmt>')
+def export_rows(fmt):
+    # Rows of a filter state streamed as CSV or Parquet, never held whole in memory. Parameters: the filter
+    # state (see utilities.export.export_filters), columns=a,b,... and limit, capped at EXPORT_MAX_ROWS.
+    if not refresher.ready:
+        return jsonify(error='data not loaded yet'), 503
+    ds = refresher.dataset
+    try:
+        filters = export_filters(request.args, ds.bounds)
+        limit = max(0, min(int(request.args.get('limit', EXPORT_MAX_ROWS)), EXPORT_MAX_ROWS))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    columns = request.args['columns'].split(',') if request.args.get('columns') else ds.columns
+    unknown = [col for col in columns if col not in ds.columns]
+    if unknown:
+        return jsonify(error=f"unknown columns: {', '.join(unknown)}"), 400
+    return Response(export_chunks(ds.export(filters, columns, limit), columns, fmt),
+                    mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename=master_clean_pro.{fmt}'})
+
+
+# Columns never sent to datatable_ads
+datatable_hidden_columns = ['id',
+                            'comment',
+                            'circulation_date',
+                            'warranty_bool',
+                            'warranty_date',
+                            'vendor_type',
+                            'source',
+                            'first_hand',
+                            'condition',
+                            'options',
+                            'annonce_date',
+                            'engine_type',
+                            'bike_age',
+                            'dept_code',
+                            'localisation'
+                            ]
+
+
+def datatable_column(column):
+    # url cells hold markdown links, deal_score (1 - price / fair price) is shown as a percentage
+    if column == 'url':
+        return {'id': column, 'name': column, 'presentation': 'markdown'}
+    if column == 'deal_score':
+        return {'id': column, 'name': column, 'type': 'numeric', 'format': percentage}
+    return {'id': column, 'name': column}
 
 
-def create_markdown_url(url):
-    markdown = f"[View]({str(url)})"
-    return markdown
-
-
-df_clean_pro['url'] = df_clean_pro['url'].apply(lambda x: create_markdown_url(x))
 palette = {'red': '#EE553B',
            'green': '#00CC96'}
 
-dropdown_brand = df_clean_pro['brand'].sort_values(ascending=True).unique()
-dropdown_category = df_clean_pro['category'].sort_values(ascending=True).unique()
-dropdown_model = df_clean_pro['model'].value_counts()
-dropdown_model = dropdown_model[dropdown_model > 5].index
-dropdown_localisation = df_clean_pro['code_name'].sort_values(ascending=True).unique()
-
-
 
-def gen_fig_daily_spiders():
-    fig_daily_spiders = make_subplots(rows=len(df_raw.source.unique()), cols=1,
-                                      subplot_titles=tuple(df_raw.source.unique()))
+def gen_fig_daily_spiders(ds):
+    # One date x source matrix of the pre-grouped counts, staleness of every source in one comparison
+    counts, stale = source_counts(ds.df_raw_daily_count)
+    fig_daily_spiders = make_subplots(rows=len(counts.columns), cols=1,
+                                      subplot_titles=tuple(counts.columns))
 
-    for k, source in zip(range(1, len(df_raw.source.unique()) + 1), df_raw.source.unique()):
-        df_temp = df_raw_daily_count[df_raw_daily_count['source'] == source]
-
-        if df_temp['scraped_date'].max() < (datetime.today() - timedelta(days=2)).date():
-            color = palette['red']
-        else:
-            color = palette['green']
+    for k, source in enumerate(counts.columns, start=1):
+        df_temp = counts[source].dropna()
+        color = palette['red'] if stale[source] else palette['green']
 
         fig_daily_spiders.add_trace(
-            go.Bar(x=df_temp.scraped_date,
-                   y=df_temp.url,
+            go.Bar(x=df_temp.index,
+                   y=df_temp.to_numpy(),
                    name=source,
                    marker=dict(color=f'{color}')),
             row=k, col=1)
@@ -87,12 +177,13 @@ def gen_fig_daily_spiders():
                                     plot_bgcolor='rgba(0, 0, 0, 0)',
                                     paper_bgcolor='rgba(0, 0, 0, 0)')
     fig_daily_spiders.update_yaxes(showgrid=False)
-    fig_daily_spiders.update_xaxes(showgrid=False, range=[df_raw.scraped_date.min(), df_raw.scraped_date.max()])
+    fig_daily_spiders.update_xaxes(showgrid=False, range=[counts.index.min(), counts.index.max()])
 
     return fig_daily_spiders
 
 
-def gen_fig_daily_master_clean_count():
+def gen_fig_daily_master_clean_count(ds):
+    df_clean_pro_daily_count = ds.df_clean_pro_daily_count
     fig_daily_master_clean = make_subplots(specs=[[{"secondary_y": True}]])
 
     fig_daily_master_clean.add_trace(
@@ -135,8 +226,77 @@ def gen_fig_daily_master_clean_count():
     return fig_daily_master_clean
 
 
-def gen_correlation_matrix():
-    df_corr = df_clean_pro.drop(columns=['circulation_year']).corr()  # Generate correlation matrix
+def gen_fig_daily_master_clean_price_layout():
+    # Figures filled by their callback's trace data, see MERGE_TRACES
+    fig_daily_master_clean_price = make_subplots(specs=[[{"secondary_y": True}]])
+    fig_daily_master_clean_price.add_trace(
+        go.Bar(x=[],
+               y=[],
+               name="Daily average price",
+               marker=dict(color=palette['green'])),
+        secondary_y=False
+    )
+
+    fig_daily_master_clean_price.add_trace(
+        go.Scatter(x=[],
+                   y=[],
+                   name="Price moving average (30 days)",
+                   mode="lines",
+                   marker=dict(color=palette['red'])),
+        secondary_y=True
+    )
+
+    fig_daily_master_clean_price.update_xaxes(title_text="scraped date")
+
+    # Set y-axes titles
+    fig_daily_master_clean_price.update_yaxes(secondary_y=False, showgrid=False, color=palette['green'])
+    fig_daily_master_clean_price.update_yaxes(secondary_y=True, showgrid=False, color=palette['red'])
+
+    # plotly manual axis adjustments
+    fig_daily_master_clean_price.update_xaxes(range=[datetime(2021, 11, 1), datetime.today()], showgrid=False)
+    fig_daily_master_clean_price.update_layout(template='plotly_dark',
+                                               plot_bgcolor='rgba(0, 0, 0, 0)',
+                                               paper_bgcolor='rgba(0, 0, 0, 0)',
+                                               legend=dict(
+                                                   yanchor="top",
+                                                   y=0.99,
+                                                   xanchor="left",
+                                                   x=0.1,
+                                                   bgcolor='rgba(0, 0, 0, 0)'
+                                               ))
+
+    return fig_daily_master_clean_price
+
+
+def gen_fig_distsubplot_layout():
+    fig_distplot = make_subplots(rows=2, cols=2, subplot_titles=tuple(['price', 'bike_age', 'mileage', 'engine_size']))
+    for i in range(4):
+        fig_distplot.add_trace(go.Bar(x=[], y=[]), row=i // 2 + 1, col=i % 2 + 1)
+    fig_distplot.update_layout(showlegend=False,
+                               template='plotly_dark',
+                               plot_bgcolor='rgba(0, 0, 0, 0)',
+                               paper_bgcolor='rgba(0, 0, 0, 0)', )
+    # height=350)
+
+    fig_distplot.update_yaxes(showgrid=False)
+    return fig_distplot
+
+
+def gen_fig_distplot_layout(col):
+    fig_distplot = make_subplots(rows=1, cols=1, subplot_titles=tuple([col]))
+    fig_distplot.add_trace(go.Bar(x=[], y=[]), row=1, col=1)
+    fig_distplot.update_layout(showlegend=False,
+                               template='plotly_dark',
+                               plot_bgcolor='rgba(0, 0, 0, 0)',
+                               paper_bgcolor='rgba(0, 0, 0, 0)', )
+    # height=350)
+
+    fig_distplot.update_yaxes(showgrid=False)
+
+    return fig_distplot
+
+
+def gen_correlation_matrix(df_corr):
     mask = np.triu(np.ones_like(df_corr, dtype=bool))
     df_corr = df_corr[mask]
 
@@ -159,11 +319,13 @@ def gen_correlation_matrix():
 # Layout #
 ##########
 
+# The layout holds no data: the figures, dropdown options and slider ranges are filled by callbacks
+# once the data is loaded (see poll_data_version), so a page can be served before that
 card_scraping = \
     dbc.Card([
         dbc.CardBody([
             html.H3("📈️ Scraping spiders surveillance", className="card-title"),
-            dcc.Graph(id='fig_daily_spiders', figure=gen_fig_daily_spiders())
+            dcc.Graph(id='fig_daily_spiders')
         ])
     ])
 
@@ -172,8 +334,7 @@ card_daily_avg = \
         dbc.CardBody([
             html.H3("💽 Database surveillance", className="card-title"),
             html.H4("Database size after advanced cleaning", className="card-title"),
-            dcc.Graph(id='fig_daily_master_clean',
-                      figure=gen_fig_daily_master_clean_count())
+            dcc.Graph(id='fig_daily_master_clean')
         ])
     ])
 
@@ -184,64 +345,71 @@ card_dropdown = \
                 dbc.Col([
                     html.H3("🔍 Select Filters", className="card-title"),
                     html.Br(),
-                    dcc.Dropdown(dropdown_brand, id='brand-dropdown', placeholder='Select brand'),
+                    dcc.Dropdown([], id='brand-dropdown', placeholder='Select brand'),
                     html.Br(),
-                    dcc.Dropdown(dropdown_category, id='category-dropdown', placeholder='Select category'),
+                    dcc.Dropdown([], id='category-dropdown', placeholder='Select category'),
                     html.Br(),
-                    dcc.Dropdown(dropdown_model, id='model-dropdown', multi=True, placeholder='Select model(s)'),
+                    dcc.Dropdown([], id='model-dropdown', multi=True, placeholder='Select model(s)'),
                     html.Br(),
                 ]),
                 dbc.Col([
                     html.Br(),
                     html.Div("Select engine size range"),
-                    dcc.RangeSlider(df_clean_pro['engine_size'].min(),
-                                    df_clean_pro['engine_size'].max(),
+                    dcc.RangeSlider(0,
+                                    1800,
                                     10,
                                     value=[0, 1800],
                                     id='engine_size-slider',
+                                    updatemode='mouseup',
                                     marks=None,
                                     tooltip={"placement": "bottom", "always_visible": True}),
                     html.Br(),
                     html.Div("Select bike year range"),
-                    dcc.RangeSlider(df_clean_pro['circulation_year'].min(),
-                                    df_clean_pro['circulation_year'].max(),
+                    dcc.RangeSlider(2000,
+                                    2022,
                                     1,
                                     value=[2000, 2022],
                                     id='circulation_year-slider',
+                                    updatemode='mouseup',
                                     marks=None,
                                     tooltip={"placement": "bottom", "always_visible": True}),
                     html.Br(),
                     html.Div("Select bike price (€) range"),
-                    dcc.RangeSlider(df_clean_pro['price'].min(),
-                                    df_clean_pro['price'].max(),
+                    dcc.RangeSlider(500,
+                                    30000,
                                     1,
                                     value=[500, 30000],
                                     id='price-slider',
+                                    updatemode='mouseup',
                                     marks=None,
                                     tooltip={"placement": "bottom", "always_visible": True}),
                 ]),
                 dbc.Col([
                     html.Br(),
-                    dcc.Dropdown(dropdown_localisation, id='localisation-dropdown', placeholder='Select localisation'),
+                    dcc.Dropdown([], id='localisation-dropdown', placeholder='Select localisation'),
                     html.Br(),
                 ])
             ])
         ])
     ])
 
-card_market_price = \
-    dbc.Card([
+
+def card_market_price():
+    # built per page, the date axis ends today
+    return dbc.Card([
         dbc.CardBody([
             html.H3("💵 Market price overview (€)", className="card-title"),
-            dcc.Graph(id='fig_daily_master_clean_price')
+            dcc.Graph(id='fig_daily_master_clean_price', figure=gen_fig_daily_master_clean_price_layout()),
+            dcc.Store(id='fig_daily_master_clean_price-patch')
         ])
     ])
 
+
 card_corr_matrix = \
     dbc.Card([
         dbc.CardBody([
             html.H3("🧮 Correlation Matrix", className="card-title"),
-            dcc.Graph(id='fig_corr_matrix', figure=gen_correlation_matrix())
+            dcc.Graph(id='fig_corr_matrix')
         ])
     ])
 
@@ -249,7 +417,8 @@ card_3D_plot = \
     dbc.Card([
         dbc.CardBody([
             html.H3("💵 Bike price history (€)", className="card-title"),
-            dcc.Graph(id='fig_master_clean_price_3d')
+            dcc.Graph(id='fig_master_clean_price_3d'),
+            html.Div(id='scatter_3d_points', className="text-muted")
         ])
     ])
 
@@ -257,330 +426,303 @@ card_distsubplot = \
     dbc.Card([
         dbc.CardBody([
             html.H3("📊 Distribution", className="card-title"),
-            dcc.Graph(id='fig_distsubplot')
+            dcc.Graph(id='fig_distsubplot', figure=gen_fig_distsubplot_layout()),
+            dcc.Store(id='fig_distsubplot-patch')
         ])
     ])
 
 card_distplot_brand = \
     dbc.Card([
         dbc.CardBody([
-            dcc.Graph(id='fig_distplot_brand')
+            dcc.Graph(id='fig_distplot_brand', figure=gen_fig_distplot_layout('brand')),
+            dcc.Store(id='fig_distplot_brand-patch')
         ])
     ])
 
 card_distplot_category = \
     dbc.Card([
         dbc.CardBody([
-            dcc.Graph(id='fig_distplot_category')
+            dcc.Graph(id='fig_distplot_category', figure=gen_fig_distplot_layout('category')),
+            dcc.Store(id='fig_distplot_category-patch')
         ])
     ])
 
+datatable_style = dict(style_header={
+                           'backgroundColor': 'rgb(30, 30, 30)',
+                           'color': 'white'
+                       },
+                       style_data={
+                           'backgroundColor': 'rgb(50, 50, 50)',
+                           'color': 'white',
+                           'whiteSpace': 'normal',
+                           'height': 'auto',
+                       },
+                       style_cell={'fontSize': 12,
+                                   # 'font-family': 'sans-serif'
+                                   })
+
 card_datatable_ads = \
     dbc.Card([
         dbc.CardBody([
             dash_table.DataTable(id='datatable_ads',
                                  data=[],
-                                 sort_action='native',
+                                 sort_action='custom',
+                                 sort_mode='multi',
+                                 sort_by=[],
                                  page_current=0,
                                  page_size=20,
-                                 # page_action='custom',
+                                 page_action='custom',
                                  filter_action='custom',
                                  filter_query='',
                                  editable=False,
                                  row_deletable=False,
-                                 hidden_columns=['id',
-                                                 'comment',
-                                                 'circulation_date',
-                                                 'warranty_bool',
-                                                 'warranty_date',
-                                                 'vendor_type',
-                                                 'source',
-                                                 'first_hand',
-                                                 'condition',
-                                                 'options',
-                                                 'annonce_date',
-                                                 'engine_type',
-                                                 'bike_age',
-                                                 'dept_code',
-                                                 'localisation'
-                                                 ],
-                                 style_header={
-                                     'backgroundColor': 'rgb(30, 30, 30)',
-                                     'color': 'white'
-                                 },
-                                 style_data={
-                                     'backgroundColor': 'rgb(50, 50, 50)',
-                                     'color': 'white',
-                                     'whiteSpace': 'normal',
-                                     'height': 'auto',
-                                 },
-                                 style_cell={'fontSize': 12,
-                                             # 'font-family': 'sans-serif'
-                                             }
-                                 )
+                                 **datatable_style
+                                 ),
+            # the selected rows are downloaded from the export route, not copied out of the table
+            html.Div([html.A("⬇️ CSV", id='export-csv', href='', className="me-3"),
+                      html.A("⬇️ Parquet", id='export-parquet', href='')], className="mt-2")
         ])
     ])
 
-app.layout = html.Div([
-    html.H1('🏍️ Bike price project dashboard'),
-    dbc.Container([
-        card_scraping,
-        html.Br(),
-        card_daily_avg,
-        html.Br(),
-        card_dropdown,
-        html.Br(),
-        card_datatable_ads,
-        html.Br(),
-        card_market_price,
-        html.Br(),
-        card_3D_plot,
-        html.Br(),
-        dbc.Row([
-            dbc.Col([card_distsubplot,
-                     html.Br(),
-                     card_distplot_brand]),
-            dbc.Col([card_corr_matrix,
-                     html.Br(),
-                     card_distplot_category])
-        ]),
-    ], fluid=True)
-])
+card_similar_listings = \
+    dbc.Card([
+        dbc.CardBody([
+            html.H3("🔍 Similar listings", className="card-title"),
+            html.Div("Select a listing in the table or click a point of the 3D plot", id='similar_listings_reference',
+                     className="text-muted"),
+            dash_table.DataTable(id='similar_listings',
+                                 data=[],
+                                 editable=False,
+                                 row_deletable=False,
+                                 **datatable_style
+                                 )
+        ])
+    ])
 
 
-#############
-# Callbacks #
-#############
-def boolean_mask(brand=None, category=None, model=None, engine_size=None,
-                 circulation_year=None, price=None, localisation=None):
-    bool_lists = ((df_clean_pro['engine_size'] >= min(engine_size)) &
-                  (df_clean_pro['engine_size'] <= max(engine_size)) &
-                  (df_clean_pro['circulation_year'] >= min(circulation_year)) &
-                  (df_clean_pro['circulation_year'] <= max(circulation_year)) &
-                  (df_clean_pro['price'] >= min(price)) &
-                  (df_clean_pro['price'] <= max(price)))
-
-    if brand is not None:
-        bool_brand = df_clean_pro['brand'] == brand
-    else:
-        bool_brand = ~df_clean_pro['brand'].isnull()
+def serve_layout():
+    return html.Div([
+        html.H1('🏍️ Bike price project dashboard'),
+        html.Div("Loading data…", id='data-status', className="text-muted"),
+        # polled until the data is loaded, the static content follows the version seen at page load
+        dcc.Interval(id='ready-poll', interval=2000),
+        dcc.Store(id='data-version'),
+        dcc.Store(id='filter-state'),
+        # identifies the page, so that the filter states it replaced are not computed
+        dcc.Store(id='session-id', data=uuid4().hex),
+        dbc.Container([
+            card_scraping,
+            html.Br(),
+            card_daily_avg,
+            html.Br(),
+            card_dropdown,
+            html.Br(),
+            card_datatable_ads,
+            html.Br(),
+            card_market_price(),
+            html.Br(),
+            card_3D_plot,
+            html.Br(),
+            card_similar_listings,
+            html.Br(),
+            dbc.Row([
+                dbc.Col([card_distsubplot,
+                         html.Br(),
+                         card_distplot_brand]),
+                dbc.Col([card_corr_matrix,
+                         html.Br(),
+                         card_distplot_category])
+            ]),
+        ], fluid=True)
+    ])
 
-    if category is not None:
-        bool_category = df_clean_pro['category'] == category
-    else:
-        bool_category = ~df_clean_pro['category'].isnull()
 
-    if model is not None:
-        bool_model = df_clean_pro['model'].isin(model)
-    else:
-        bool_model = ~df_clean_pro['model'].isnull()
+app.layout = serve_layout
 
-    if localisation is not None:
-        bool_loc = df_clean_pro['code_name'] == localisation
-    else:
-        bool_loc = ~df_clean_pro['code_name'].isnull()
 
-    return bool_lists & bool_brand & bool_category & bool_model & bool_loc
+#############
+# Callbacks #
+#############
+def filter_options(filter_state, column):
+    # Dropdown options left by the other filters
+    if filter_state is None or sequencer.superseded(filter_state):
+        raise PreventUpdate
+    with metrics.phase('filter'):
+        return refresher.dataset.options({**filter_state, column: None}, column)
 
 
 @app.callback(
-    Output('category-dropdown', 'options'),
-    Input('brand-dropdown', 'value'),
-    Input('category-dropdown', 'value'),
-    Input('model-dropdown', 'value'),
-    Input('engine_size-slider', 'value'),
-    Input('circulation_year-slider', 'value'),
-    Input('price-slider', 'value'),
-    Input('localisation-dropdown', 'value'))
-def update_dd_category(brand, category, model, engine_size, circulation_year, price, localisation):
-    return df_clean_pro[boolean_mask(brand=brand,
-                                     category=None,
-                                     model=model,
-                                     engine_size=engine_size,
-                                     circulation_year=circulation_year,
-                                     price=price,
-                                     localisation=localisation)]['category'].unique()
+    Output('data-version', 'data'),
+    Output('ready-poll', 'disabled'),
+    Output('data-status', 'children'),
+    Input('ready-poll', 'n_intervals'))
+def poll_data_version(n_intervals):
+    if not refresher.ready:
+        raise PreventUpdate
+    return refresher.dataset.version, True, None
 
 
 @app.callback(
-    Output('model-dropdown', 'options'),
-    Input('brand-dropdown', 'value'),
-    Input('category-dropdown', 'value'),
-    Input('model-dropdown', 'value'),
-    Input('engine_size-slider', 'value'),
-    Input('circulation_year-slider', 'value'),
-    Input('price-slider', 'value'),
-    Input('localisation-dropdown', 'value'))
-def update_dd_model(brand, category, model, engine_size, circulation_year, price, localisation):
-    return df_clean_pro[boolean_mask(brand=brand,
-                                     category=category,
-                                     model=None,
-                                     engine_size=engine_size,
-                                     circulation_year=circulation_year,
-                                     price=price,
-                                     localisation=localisation)]['model'].unique()
+    Output('fig_daily_spiders', 'figure'),
+    Output('fig_daily_master_clean', 'figure'),
+    Input('data-version', 'data'))
+def update_static_figures(version):
+    if version is None:
+        raise PreventUpdate
+    ds = refresher.dataset
+    return (ds.cached('fig_daily_spiders', gen_fig_daily_spiders),
+            ds.cached('fig_daily_master_clean', gen_fig_daily_master_clean_count))
 
 
 @app.callback(
-    Output('brand-dropdown', 'options'),
-    Input('brand-dropdown', 'value'),
-    Input('category-dropdown', 'value'),
-    Input('model-dropdown', 'value'),
-    Input('engine_size-slider', 'value'),
-    Input('circulation_year-slider', 'value'),
-    Input('price-slider', 'value'),
-    Input('localisation-dropdown', 'value'))
-def update_dd_brand(brand, category, model, engine_size, circulation_year, price, localisation):
-    return df_clean_pro[boolean_mask(brand=None,
-                                     category=category,
-                                     model=model,
-                                     engine_size=engine_size,
-                                     circulation_year=circulation_year,
-                                     price=price,
-                                     localisation=localisation)]['brand'].unique()
+    Output('localisation-dropdown', 'options'),
+    Output('engine_size-slider', 'min'),
+    Output('engine_size-slider', 'max'),
+    Output('circulation_year-slider', 'min'),
+    Output('circulation_year-slider', 'max'),
+    Output('price-slider', 'min'),
+    Output('price-slider', 'max'),
+    Input('data-version', 'data'))
+def update_filter_ranges(version):
+    if version is None:
+        raise PreventUpdate
+    ds = refresher.dataset
+    ranges = [ds.bounds.get(col, (None, None)) for col in ['engine_size', 'circulation_year', 'price']]
+    return (ds.dropdown_localisation, *ranges[0], *ranges[1], *ranges[2])
 
 
 @app.callback(
-    Output('fig_daily_master_clean_price', 'figure'),
+    Output('filter-state', 'data'),
+    Input('data-version', 'data'),
     Input('brand-dropdown', 'value'),
     Input('category-dropdown', 'value'),
     Input('model-dropdown', 'value'),
     Input('engine_size-slider', 'value'),
     Input('circulation_year-slider', 'value'),
     Input('price-slider', 'value'),
-    Input('localisation-dropdown', 'value'))
-def gen_fig_daily_master_clean_price(brand, category, model, engine_size, circulation_year, price, localisation):
-    df_filtered = df_clean_pro[boolean_mask(brand, category, model, engine_size, circulation_year, price, localisation)]
-    df_clean_pro_daily_price = df_filtered[['scraped_date', 'price']].groupby(by=['scraped_date'], axis=0,
-                                                                              as_index=False).mean()
-    # mooving average
-    df_clean_pro_daily_price['SMA30'] = df_clean_pro_daily_price['price'].rolling(30).mean()
+    Input('localisation-dropdown', 'value'),
+    State('session-id', 'data'))
+def update_filter_state(version, brand, category, model, engine_size, circulation_year, price, localisation,
+                        session_id=None):
+    if version is None:
+        raise PreventUpdate
+    filter_state = dict(brand=brand,
+                        category=category,
+                        model=model,
+                        engine_size=engine_size,
+                        circulation_year=circulation_year,
+                        price=price,
+                        localisation=localisation)
+    # evaluate once, every other callback reads the stored rows
+    with metrics.phase('filter'):
+        n_rows = refresher.dataset.select(filter_state)
+    metrics.observe_rows(n_rows)
+    return sequencer.publish(filter_state, session_id)
 
-    fig_daily_master_clean_price = make_subplots(specs=[[{"secondary_y": True}]])
-    fig_daily_master_clean_price.add_trace(
-        go.Bar(x=df_clean_pro_daily_price['scraped_date'],
-               y=df_clean_pro_daily_price['price'],
-               name="Daily average price",
-               marker=dict(color=palette['green'])),
-        secondary_y=False
-    )
 
-    fig_daily_master_clean_price.add_trace(
-        go.Scatter(x=df_clean_pro_daily_price['scraped_date'],
-                   y=df_clean_pro_daily_price['SMA30'],
-                   name="Price moving average (30 days)",
-                   mode="lines",
-                   marker=dict(color=palette['red'])),
-        secondary_y=True
-    )
+@app.callback(
+    Output('category-dropdown', 'options'),
+    Input('filter-state', 'data'))
+def update_dd_category(filter_state):
+    return filter_options(filter_state, 'category')
 
-    fig_daily_master_clean_price.update_xaxes(title_text="scraped date")
 
-    # Set y-axes titles
-    fig_daily_master_clean_price.update_yaxes(secondary_y=False, showgrid=False, color=palette['green'])
-    fig_daily_master_clean_price.update_yaxes(secondary_y=True, showgrid=False, color=palette['red'])
+@app.callback(
+    Output('model-dropdown', 'options'),
+    Input('filter-state', 'data'))
+def update_dd_model(filter_state):
+    return filter_options(filter_state, 'model')
 
-    # plotly manual axis adjustments
-    fig_daily_master_clean_price.update_xaxes(range=[datetime(2021, 11, 1), datetime.today()], showgrid=False)
-    fig_daily_master_clean_price.update_layout(template='plotly_dark',
-                                               plot_bgcolor='rgba(0, 0, 0, 0)',
-                                               paper_bgcolor='rgba(0, 0, 0, 0)',
-                                               legend=dict(
-                                                   yanchor="top",
-                                                   y=0.99,
-                                                   xanchor="left",
-                                                   x=0.1,
-                                                   bgcolor='rgba(0, 0, 0, 0)'
-                                               ))
 
-    return fig_daily_master_clean_price
+@app.callback(
+    Output('brand-dropdown', 'options'),
+    Input('filter-state', 'data'))
+def update_dd_brand(filter_state):
+    return filter_options(filter_state, 'brand')
 
 
 @app.callback(
-    Output('fig_distsubplot', 'figure'),
-    Input('brand-dropdown', 'value'),
-    Input('category-dropdown', 'value'),
-    Input('model-dropdown', 'value'),
-    Input('engine_size-slider', 'value'),
-    Input('circulation_year-slider', 'value'),
-    Input('price-slider', 'value'),
-    Input('localisation-dropdown', 'value'))
-def update_distrib_subplot(brand, category, model, engine_size, circulation_year, price, localisation):
-    df_filtered = df_clean_pro[boolean_mask(brand, category, model, engine_size, circulation_year, price, localisation)]
-    fig_distplot = make_subplots(rows=2, cols=2, subplot_titles=tuple(['price', 'bike_age', 'mileage', 'engine_size']))
-    fig_distplot.add_trace(go.Histogram(x=df_filtered['price'], histfunc="count", nbinsx=50), row=1, col=1)
-    fig_distplot.add_trace(go.Histogram(x=df_filtered['bike_age'], histfunc="count", nbinsx=50), row=1, col=2)
-    fig_distplot.add_trace(go.Histogram(x=df_filtered['mileage'], histfunc="count", nbinsx=50), row=2, col=1)
-    fig_distplot.add_trace(go.Histogram(x=df_filtered['engine_size'], histfunc="count", nbinsx=50), row=2, col=2)
-    fig_distplot.update_layout(showlegend=False,
-                               template='plotly_dark',
-                               plot_bgcolor='rgba(0, 0, 0, 0)',
-                               paper_bgcolor='rgba(0, 0, 0, 0)', )
-    # height=350)
-
-    fig_distplot.update_yaxes(showgrid=False)
-    return fig_distplot
+    Output('fig_daily_master_clean_price-patch', 'data'),
+    Input('filter-state', 'data'))
+@memoize
+def gen_fig_daily_master_clean_price(filter_state):
+    # daily average and 30 days moving average, from the pre-aggregated price cube
+    with metrics.phase('aggregate'):
+        df_clean_pro_daily_price = refresher.dataset.daily_mean(filter_state, window=30)
+    days = df_clean_pro_daily_price['scraped_date'].to_numpy()
+    return [{'x': days, 'y': df_clean_pro_daily_price['price'].to_numpy()},
+            {'x': days, 'y': df_clean_pro_daily_price['SMA30'].to_numpy()}]
 
 
 @app.callback(
-    Output('fig_distplot_brand', 'figure'),
-    Input('brand-dropdown', 'value'),
-    Input('category-dropdown', 'value'),
-    Input('model-dropdown', 'value'),
-    Input('engine_size-slider', 'value'),
-    Input('circulation_year-slider', 'value'),
-    Input('price-slider', 'value'),
-    Input('localisation-dropdown', 'value'))
-def update_distrib_plot_brand(brand, category, model, engine_size, circulation_year, price, localisation):
-    df_filtered = df_clean_pro[boolean_mask(brand, category, model, engine_size, circulation_year, price, localisation)]
-    fig_distplot = make_subplots(rows=1, cols=1, subplot_titles=tuple(['brand']))
-    fig_distplot.add_trace(go.Histogram(x=df_filtered['brand'], histfunc="count", nbinsx=50), row=1, col=1)
-    fig_distplot.update_layout(showlegend=False,
-                               template='plotly_dark',
-                               plot_bgcolor='rgba(0, 0, 0, 0)',
-                               paper_bgcolor='rgba(0, 0, 0, 0)', )
-    # height=350)
+    Output('fig_corr_matrix', 'figure'),
+    Input('filter-state', 'data'))
+@memoize
+def update_corr_matrix(filter_state):
+    with metrics.phase('aggregate'):
+        df_corr = refresher.dataset.correlation_matrix(filter_state)
+    return gen_correlation_matrix(df_corr)
 
-    fig_distplot.update_yaxes(showgrid=False)
 
-    return fig_distplot
+@app.callback(
+    Output('fig_distsubplot-patch', 'data'),
+    Input('filter-state', 'data'))
+@memoize
+def update_distrib_subplot(filter_state):
+    # Binned here, only the bars are sent to the browser
+    ds = refresher.dataset
+    bars = []
+    for col in ['price', 'bike_age', 'mileage', 'engine_size']:
+        with metrics.phase('aggregate'):
+            centers, counts, widths = ds.histogram(filter_state, col, bins=50)
+        bars.append({'x': centers, 'y': counts, 'width': widths})
+    return bars
 
 
 @app.callback(
-    Output('fig_distplot_category', 'figure'),
-    Input('brand-dropdown', 'value'),
-    Input('category-dropdown', 'value'),
-    Input('model-dropdown', 'value'),
-    Input('engine_size-slider', 'value'),
-    Input('circulation_year-slider', 'value'),
-    Input('price-slider', 'value'),
-    Input('localisation-dropdown', 'value'))
-def update_distrib_plot_brand(brand, category, model, engine_size, circulation_year, price, localisation):
-    df_filtered = df_clean_pro[boolean_mask(brand, category, model, engine_size, circulation_year, price, localisation)]
-    fig_distplot = make_subplots(rows=1, cols=1, subplot_titles=tuple(['category']))
-    fig_distplot.add_trace(go.Histogram(x=df_filtered['category'], histfunc="count", nbinsx=50), row=1, col=1)
-    fig_distplot.update_layout(showlegend=False,
-                               template='plotly_dark',
-                               plot_bgcolor='rgba(0, 0, 0, 0)',
-                               paper_bgcolor='rgba(0, 0, 0, 0)', )
-    # height=350)
+    Output('fig_distplot_brand-patch', 'data'),
+    Input('filter-state', 'data'))
+@memoize
+def update_distrib_plot_brand(filter_state):
+    with metrics.phase('aggregate'):
+        counts = refresher.dataset.value_counts(filter_state, 'brand')
+    return [{'x': counts.index, 'y': counts.to_numpy()}]
 
-    fig_distplot.update_yaxes(showgrid=False)
 
-    return fig_distplot
+@app.callback(
+    Output('fig_distplot_category-patch', 'data'),
+    Input('filter-state', 'data'))
+@memoize
+def update_distrib_plot_category(filter_state):
+    with metrics.phase('aggregate'):
+        counts = refresher.dataset.value_counts(filter_state, 'category')
+    return [{'x': counts.index, 'y': counts.to_numpy()}]
+
+
+# These figures are built once per page and keep their layout in the browser: their callbacks send the
+# trace data only, merged into the displayed figure client-side (as dash.Patch does from Dash 2.9 on)
+MERGE_TRACES = """
+function(patch, figure) {
+    if (!patch || !figure) {
+        return window.dash_clientside.no_update;
+    }
+    return Object.assign({}, figure, {data: figure.data.map((trace, i) => Object.assign({}, trace, patch[i]))});
+}
+"""
+for graph_id in ['fig_daily_master_clean_price', 'fig_distsubplot', 'fig_distplot_brand', 'fig_distplot_category']:
+    app.clientside_callback(MERGE_TRACES,
+                            Output(graph_id, 'figure'),
+                            Input(f'{graph_id}-patch', 'data'),
+                            State(graph_id, 'figure'))
 
 
 @app.callback(
     Output('fig_master_clean_price_3d', 'figure'),
-    Input('brand-dropdown', 'value'),
-    Input('category-dropdown', 'value'),
-    Input('model-dropdown', 'value'),
-    Input('engine_size-slider', 'value'),
-    Input('circulation_year-slider', 'value'),
-    Input('price-slider', 'value'),
-    Input('localisation-dropdown', 'value'))
-def update_scatter_3d(brand, category, model, engine_size, circulation_year, price, localisation):
-    df_filtered = df_clean_pro[boolean_mask(brand, category, model, engine_size, circulation_year, price, localisation)]
+    Output('scatter_3d_points', 'children'),
+    Input('filter-state', 'data'))
+@memoize
+def update_scatter_3d(filter_state):
+    brand, category = filter_state['brand'], filter_state['category']
     if brand is None:
         color_col = 'brand'
     elif brand is not None:
@@ -589,11 +731,25 @@ def update_scatter_3d(brand, category, model, engine_size, circulation_year, pri
         elif category is not None:
             color_col = 'engine_size'
 
-    fig_master_clean_price_3d = px.scatter_3d(df_filtered,
+    # deal_score is shown on hover where the query engine scores the listings
+    ds = refresher.dataset
+    hover_data = {'deal_score': ':.0%'} if 'deal_score' in ds.columns else {}
+    # Every colour group keeps its share of the drawn points, a continuous colour is sampled uniformly
+    with metrics.phase('aggregate'):
+        df_sample, n_filtered = ds.sample(filter_state,
+                                          ['id', 'mileage', 'bike_age', 'price', 'model', color_col, *hover_data],
+                                          None if color_col == 'engine_size' else color_col,
+                                          SCATTER_POINT_BUDGET)
+    if df_sample[color_col].dtype == 'category':
+        # plotly express looks up a group for every category, including the ones filtered out
+        df_sample = df_sample.assign(**{color_col: df_sample[color_col].cat.remove_unused_categories()})
+    fig_master_clean_price_3d = px.scatter_3d(df_sample,
                                               x='mileage',
                                               y='bike_age',
                                               z='price',
                                               hover_name='model',
+                                              hover_data=hover_data,
+                                              custom_data=['id'],
                                               color=color_col,
                                               log_x=True,
                                               log_y=False,
@@ -605,27 +761,78 @@ def update_scatter_3d(brand, category, model, engine_size, circulation_year, pri
                                             plot_bgcolor='rgba(0, 0, 0, 0)',
                                             paper_bgcolor='rgba(0, 0, 0, 0)')
     fig_master_clean_price_3d.update_traces(marker_size=2)
-    return fig_master_clean_price_3d
+    return fig_master_clean_price_3d, f"Showing {len(df_sample):,} of {n_filtered:,} listings"
 
 
 @app.callback(
     Output('datatable_ads', 'data'),
     Output('datatable_ads', 'columns'),
-    Input('brand-dropdown', 'value'),
-    Input('category-dropdown', 'value'),
-    Input('model-dropdown', 'value'),
-    Input('engine_size-slider', 'value'),
-    Input('circulation_year-slider', 'value'),
-    Input('price-slider', 'value'),
-    Input('localisation-dropdown', 'value'),
+    Output('datatable_ads', 'page_current'),
+    Output('datatable_ads', 'page_count'),
+    Input('filter-state', 'data'),
     Input('datatable_ads', "page_current"),
-    Input('datatable_ads', "page_size"))
-def update_datatable_ads(brand, category, model, engine_size, circulation_year, price, localisation, page_current, page_size):
-    df_filtered = df_clean_pro[boolean_mask(brand, category, model, engine_size, circulation_year, price, localisation)]
-    columns = [{'id': x, 'name': x, 'presentation': 'markdown'} if x == 'url' else {'id': x, 'name': x} for x in
-               df_filtered.columns]
-    # return df_filtered.iloc[page_current * page_size:(page_current + 1) * page_size].to_dict('records'), [
-    return df_filtered.to_dict('records'), columns
+    Input('datatable_ads', "page_size"),
+    Input('datatable_ads', 'sort_by'),
+    Input('datatable_ads', 'filter_query'))
+@memoize
+def update_datatable_ads(filter_state, page_current, page_size, sort_by, filter_query):
+    ds = refresher.dataset
+    with metrics.phase('aggregate'):
+        df_page, page_current, page_count = ds.page(filter_state,
+                                                    sort_by,
+                                                    filter_query,
+                                                    page_current,
+                                                    page_size)
+    datatable_columns = [x for x in ds.columns if x not in datatable_hidden_columns]
+    columns = [datatable_column(x) for x in datatable_columns]
+    # markdown links are only built for the rows sent to the browser; the hidden id names the row of
+    # active_cell for the similar listings
+    df_page = df_page[datatable_columns + ['id']].assign(url=df_page['url'].map(create_markdown_url))
+    return df_page.to_dict('records'), columns, page_current, page_count
+
+
+@app.callback(
+    Output('export-csv', 'href'),
+    Output('export-parquet', 'href'),
+    Input('filter-state', 'data'))
+def update_export_links(filter_state):
+    if filter_state is None or sequencer.superseded(filter_state):
+        raise PreventUpdate
+    columns = [x for x in refresher.dataset.columns if x not in datatable_hidden_columns]
+    return export_url(filter_state, columns, 'csv'), export_url(filter_state, columns, 'parquet')
+
+
+def similar_listings(ds, listing_id):
+    with metrics.phase('aggregate'):
+        df_similar = ds.similar(listing_id, SIMILAR_K)
+    if not len(df_similar):
+        return [], [], f"Listing {listing_id} has no brand, category, mileage, age, engine size or price to compare"
+    datatable_columns = ['distance'] + [x for x in ds.columns if x not in datatable_hidden_columns]
+    columns = [datatable_column(x) for x in datatable_columns]
+    df_similar = df_similar[datatable_columns].assign(url=df_similar['url'].map(create_markdown_url),
+                                                      distance=df_similar['distance'].round(3))
+    brand, category = df_similar['brand'].iloc[0], df_similar['category'].iloc[0]
+    return (df_similar.to_dict('records'), columns,
+            f"{len(df_similar)} {brand} {category} listings nearest to listing {listing_id} by mileage, age, "
+            f"engine size and price")
+
+
+@app.callback(
+    Output('similar_listings', 'data'),
+    Output('similar_listings', 'columns'),
+    Output('similar_listings_reference', 'children'),
+    Input('datatable_ads', 'active_cell'),
+    Input('fig_master_clean_price_3d', 'clickData'),
+    prevent_initial_call=True)
+def update_similar_listings(active_cell, click_data):
+    # The listing picked last, in the table or on the 3D plot
+    if ctx.triggered_id == 'datatable_ads':
+        listing_id = (active_cell or {}).get('row_id')
+    else:
+        listing_id = (click_data or {'points': [{}]})['points'][0].get('customdata', [None])[0]
+    if listing_id is None:
+        raise PreventUpdate
+    return similar_listings(refresher.dataset, int(listing_id))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,45 @@
+import argparse
+import time
+
+from benchmarks.synthetic import gen_master_clean_pro
+from utilities.calculation import cumulative_count, daily_count, daily_mean, extend_daily_count, running_sum
+
+
+def timeit(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def running_sum_path(df):
+    # cumul_count as computed in app.py before utilities.calculation was vectorized
+    df_daily_count = df[['scraped_date', 'url']].groupby(by=['scraped_date'], axis=0, as_index=False).count()
+    df_daily_count['cumul_count'] = df_daily_count.apply(
+        lambda x: running_sum(df_daily_count, x.scraped_date), axis=1)
+    return df_daily_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Daily aggregates: running_sum apply vs cumsum/groupby')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, nargs='*', default=[330, 1000, 3000])
+    args = parser.parse_args()
+
+    print(f"{'days':>6}{'running_sum ms':>16}{'cumsum ms':>12}{'extend 1 day ms':>17}{'daily_mean ms':>15}")
+    for n_days in args.days:
+        df = gen_master_clean_pro(args.rows, n_days=n_days)
+        last_day = df['scraped_date'].max()
+        old, new = df[df['scraped_date'] < last_day], df[df['scraped_date'] >= last_day]
+
+        # the results are checked in tests/test_calculation.py
+        _, running_sum_ms = timeit(lambda: running_sum_path(df))
+        _, cumsum_ms = timeit(lambda: cumulative_count(daily_count(df)))
+        previous = cumulative_count(daily_count(old))
+        _, extend_ms = timeit(lambda: extend_daily_count(previous, new))
+        _, mean_ms = timeit(lambda: daily_mean(df))
+
+        print(f'{n_days:>6}{running_sum_ms:>16.0f}{cumsum_ms:>12.1f}{extend_ms:>17.1f}{mean_ms:>15.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import gen_master_clean_pro
+from utilities.dataset import merge_rows, prepare_clean_pro
+from utilities.fair_price import PriceModel, fit_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fair price model: fit and batch scoring throughput, refits on '
+                                                 'refresh vs a fit over every row')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--refreshes', type=int, default=10)
+    args = parser.parse_args()
+
+    df = prepare_clean_pro(gen_master_clean_pro(args.rows))
+    start = time.perf_counter()
+    model = PriceModel(df)
+    fit_s = time.perf_counter() - start
+    start = time.perf_counter()
+    deal_score = model.deal_score(df)
+    score_s = time.perf_counter() - start
+    n_fit = len(fit_rows(df))
+    print(f'fit    {n_fit} rows, {len(model.coefficients)} coefficients in {fit_s * 1000:.0f} ms '
+          f'({n_fit / fit_s / 1e6:.2f} M rows/s)')
+    print(f'score  {len(df)} rows in {score_s * 1000:.0f} ms ({len(df) / score_s / 1e6:.2f} M rows/s), '
+          f'deal_score p5 {np.nanpercentile(deal_score, 5):.2f}, p50 {np.nanpercentile(deal_score, 50):.2f}, '
+          f'p95 {np.nanpercentile(deal_score, 95):.2f}')
+
+    # refreshes re-reading the last two days, as DataRefresher does, with prices moving between reads
+    rng = np.random.default_rng(0)
+    days = np.sort(df['scraped_date'].unique())
+    for refresh in range(args.refreshes):
+        new_rows = prepare_clean_pro(df[df['scraped_date'] >= days[-2]])
+        new_rows = new_rows.assign(price=new_rows['price'] * rng.uniform(0.9, 1.1, len(new_rows)))
+        df = merge_rows(df, new_rows)
+        start = time.perf_counter()
+        model = model.extend(df, new_rows)
+        extend_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        fresh = PriceModel(df)
+        refit_ms = (time.perf_counter() - start) * 1000
+        assert np.allclose(model.fair_price(df), fresh.fair_price(df), rtol=1e-9, equal_nan=True), refresh
+        print(f'refresh {refresh}: {len(new_rows)} rows refitted in {extend_ms:.0f} ms, full fit {refit_ms:.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
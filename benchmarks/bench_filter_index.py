@@ -0,0 +1,57 @@
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import gen_master_clean_pro
+from utilities.filter_index import FilterIndex, scan_mask
+
+DEFAULT_SLIDERS = dict(engine_size=[0, 1800], circulation_year=[2000, 2022], price=[500, 30000])
+
+SCENARIOS = {
+    'default sliders': dict(**DEFAULT_SLIDERS),
+    'brand': dict(brand='YAMAHA', **DEFAULT_SLIDERS),
+    'brand + category': dict(brand='YAMAHA', category='roadster', **DEFAULT_SLIDERS),
+    'models': dict(model=['MODEL 1', 'MODEL 21', 'MODEL 41'], **DEFAULT_SLIDERS),
+    'localisation': dict(localisation='REGION 3', **DEFAULT_SLIDERS),
+    'narrow sliders': dict(engine_size=[600, 900], circulation_year=[2015, 2020], price=[5000, 9000]),
+    'everything': dict(category='roadster', localisation='REGION 3',
+                       engine_size=[600, 900], circulation_year=[2015, 2020], price=[5000, 9000]),
+}
+
+
+def timeit(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare boolean_mask full scans with the filter index')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    print(f'Generating {args.rows} synthetic rows')
+    df = gen_master_clean_pro(args.rows)
+
+    start = time.perf_counter()
+    index = FilterIndex(df)
+    print(f'Index built in {(time.perf_counter() - start) * 1000:.0f} ms\n')
+
+    print(f"{'scenario':<20}{'rows':>10}{'scan ms':>12}{'index ms':>12}{'speedup':>10}")
+    for name, filters in SCENARIOS.items():
+        expected = scan_mask(df, **filters).to_numpy()
+        assert (index.mask(**filters) == expected).all(), name
+
+        # one callback = build the mask and slice the frame
+        scan_ms = timeit(lambda: df[scan_mask(df, **filters)], args.repeat)
+        index_ms = timeit(lambda: df.iloc[index.rows(**filters)], args.repeat)
+        print(f'{name:<20}{expected.sum():>10}{scan_ms:>12.1f}{index_ms:>12.1f}{scan_ms / index_ms:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas.io.sql as psql
+from sqlalchemy import create_engine
+
+from benchmarks.synthetic import gen_master_clean_pro
+
+
+def read_whole(url, table):
+    # get_table before streaming: new engine, whole result materialized at once
+    engine = create_engine(url)
+    df = psql.read_sql(f"SELECT * FROM {table}", engine)
+    engine.dispose()
+    return df
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, elapsed, peak / 1024 ** 2, df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak memory of get_table on a generated SQLite table')
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--url', default=None, help='SQLAlchemy URL of an existing stand-in database')
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.sqlite')}"
+        print(f'Writing {args.rows} synthetic rows to {url}')
+        gen_master_clean_pro(args.rows).to_sql('master_clean_pro', create_engine(url), index=False, chunksize=50000)
+
+    os.environ['DATABASE_URL'] = url
+    from utilities.data import get_table
+
+    print(f"{'path':<12}{'seconds':>10}{'peak MB':>10}{'frame MB':>10}")
+    for name, func in [('read_sql', lambda: read_whole(url, 'master_clean_pro')),
+                       ('get_table', lambda: get_table('master_clean_pro', verbose=False))]:
+        df, elapsed, peak, frame = measure(func)
+        print(f'{name:<12}{elapsed:>10.1f}{peak:>10.0f}{frame:>10.0f}')
+        del df
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_filter_index import SCENARIOS, timeit
+from benchmarks.synthetic import gen_master_clean_pro
+from utilities.filter_index import FilterIndex, scan_mask
+from utilities.options import OptionIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dropdown options from the filtered rows vs the co-occurrence table')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    df = gen_master_clean_pro(args.rows)
+    index = FilterIndex(df)
+    start = time.perf_counter()
+    options = OptionIndex(index)
+    print(f'{options.n_combinations} combinations indexed in {(time.perf_counter() - start) * 1000:.0f} ms\n')
+
+    print(f"{'scenario':<20}{'column':<10}{'scan ms':>10}{'rows ms':>10}{'table ms':>10}  resolved")
+    for name, filters in SCENARIOS.items():
+        for column in ['brand', 'category', 'model']:
+            state = {**filters, column: None}
+            rows = index.rows(**state)
+            expected = np.sort(np.asarray(df[scan_mask(df, **state)][column].unique(), dtype=object))
+            assert list(index.distinct(column, rows)) == list(expected), (name, column)
+            result = options.options(state, column)
+            if result is not None:
+                assert list(result) == list(expected), (name, column)
+
+            # the callbacks before: a full scan then .unique(); rows: from the filter store's row positions
+            scan_ms = timeit(lambda: df[scan_mask(df, **state)][column].unique(), args.repeat)
+            rows_ms = timeit(lambda: index.distinct(column, rows), args.repeat)
+            table_ms = timeit(lambda: options.options(state, column), args.repeat)
+            print(f"{name:<20}{column:<10}{scan_ms:>10.1f}{rows_ms:>10.1f}{table_ms:>10.1f}  "
+                  f"{'table' if result is not None else 'rows'}")
+
+if __name__ == '__main__':
+    main()
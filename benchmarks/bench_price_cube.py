@@ -0,0 +1,37 @@
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_filter_index import SCENARIOS, timeit
+from benchmarks.synthetic import gen_master_clean_pro
+from utilities.calculation import daily_mean
+from utilities.cube import PriceCube
+from utilities.filter_index import FilterIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Daily mean price from raw rows vs the price cube')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    df = gen_master_clean_pro(args.rows)
+    index = FilterIndex(df)
+    start = time.perf_counter()
+    cube = PriceCube(df, index)
+    print(f'Cube of {cube.n_cells} cells built in {(time.perf_counter() - start) * 1000:.0f} ms\n')
+
+    print(f"{'scenario':<20}{'raw ms':>10}{'cube ms':>10}")
+    for name, filters in SCENARIOS.items():
+        expected = daily_mean(df.iloc[index.rows(**filters)])
+        result = cube.daily_mean(**filters)
+        assert np.allclose(expected['price'].to_numpy(float), result['price'], rtol=1e-5), name
+
+        raw_ms = timeit(lambda: daily_mean(df.iloc[index.rows(**filters)]), args.repeat)
+        cube_ms = timeit(lambda: cube.daily_mean(**filters), args.repeat)
+        print(f'{name:<20}{raw_ms:>10.1f}{cube_ms:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
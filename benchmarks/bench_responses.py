@@ -0,0 +1,61 @@
+import argparse
+import gzip
+import json
+import os
+import tempfile
+
+import brotli
+import numpy as np
+from plotly.io.json import to_json_plotly
+
+from benchmarks.bench_filter_index import SCENARIOS, timeit
+from benchmarks.suite import FILTER_DEFAULTS, callback_cases
+from benchmarks.synthetic import write_synthetic_db
+
+
+def same(a, b):
+    # Parsed JSON equality, float32 values being written with their shortest repr by orjson
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(same(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return isinstance(b, list) and len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) and isinstance(b, (int, float)):
+        return bool(np.isclose(a, b, rtol=1e-6))
+    return a == b
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Callback responses encoded by plotly's encoder and by orjson, "
+                                                 "and their size once Brotli or gzip compressed")
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--url', default=None, help='SQLAlchemy URL of an existing stand-in database instead')
+    parser.add_argument('--scenario', default='default sliders', choices=list(SCENARIOS))
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.update(DATABASE_URL=args.url or write_synthetic_db(args.rows), SNAPSHOT_DIR=tempfile.mkdtemp(),
+                      REFRESH_INTERVAL='0', LAZY_STARTUP='0', CACHE_BACKEND='lru')
+    import app
+    from utilities.responses import COMPRESS_BR_LEVEL, COMPRESS_LEVEL, to_json
+
+    per_state, static = callback_cases(app, app.refresher.dataset)
+    state = {**FILTER_DEFAULTS, **SCENARIOS[args.scenario]}
+    outputs = {name: func() for name, func in static.items()}
+    outputs.update({name: func(state) for name, func in per_state.items()})
+
+    print(f"{'callback':<34}{'plotly ms':>10}{'orjson ms':>10}{'bytes':>10}{'gzip':>9}{'br':>9}")
+    for name, output in outputs.items():
+        # shaped as Dash sends it back
+        response = {'multi': True, 'response': {'output': {'value': output}}}
+        expected, body = to_json_plotly(response), to_json(response)
+        assert same(json.loads(expected), json.loads(body)), name
+
+        plotly_ms = timeit(lambda: to_json_plotly(response), args.repeat)
+        orjson_ms = timeit(lambda: to_json(response), args.repeat)
+        data = body.encode()
+        print(f'{name:<34}{plotly_ms:>10.1f}{orjson_ms:>10.1f}{len(data):>10}'
+              f'{len(gzip.compress(data, COMPRESS_LEVEL)):>9}{len(brotli.compress(data, quality=COMPRESS_BR_LEVEL)):>9}')
+
+
+if __name__ == '__main__':
+    main()
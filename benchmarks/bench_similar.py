@@ -0,0 +1,68 @@
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import gen_master_clean_pro
+from utilities.dataset import merge_rows, prepare_clean_pro
+from utilities.similar import GROUP_COLUMNS, SIMILAR_COLUMNS, SimilarIndex, similar_rows
+
+
+def brute_force(df, rows, scale, listing_id, k):
+    # Distances to every row of the listing's group, the lookup before the trees
+    ids = df['id'].to_numpy()
+    position = np.flatnonzero(ids == listing_id)[0]
+    group = np.ones(len(rows), dtype=bool)
+    for col in GROUP_COLUMNS:
+        group &= df[col].to_numpy()[rows] == df[col].iloc[position]
+    candidates = rows[group & (ids[rows] != listing_id)]
+    values = np.column_stack([df[col].to_numpy(dtype=np.float64)[candidates] for col in SIMILAR_COLUMNS]) / scale
+    point = df[SIMILAR_COLUMNS].iloc[position].to_numpy(dtype=np.float64) / scale
+    return np.sort(np.sqrt(((values - point) ** 2).sum(axis=1)))[:k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Similar listings from the KD-trees vs a scan of the group')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--refreshes', type=int, default=10)
+    args = parser.parse_args()
+
+    df = prepare_clean_pro(gen_master_clean_pro(args.rows))
+    start = time.perf_counter()
+    index = SimilarIndex(df)
+    print(f'{len(index.groups)} trees built in {(time.perf_counter() - start) * 1000:.0f} ms')
+
+    rows = similar_rows(df)
+    listing_ids = df['id'].to_numpy()[np.random.default_rng(0).choice(rows, args.queries)]
+    tree_ms, scan_ms = [], []
+    for listing_id in listing_ids:
+        start = time.perf_counter()
+        result = index.similar(df, listing_id, args.k)
+        tree_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        expected = brute_force(df, rows, index.scale, listing_id, args.k)
+        scan_ms.append((time.perf_counter() - start) * 1000)
+        assert np.allclose(result['distance'].to_numpy(), expected), listing_id
+    print(f"query  trees p50 {np.percentile(tree_ms, 50):.2f} ms, p99 {np.percentile(tree_ms, 99):.2f} ms; "
+          f"scan p50 {np.percentile(scan_ms, 50):.2f} ms, p99 {np.percentile(scan_ms, 99):.2f} ms")
+
+    # refreshes re-reading the last two days, as DataRefresher does
+    days = np.sort(df['scraped_date'].unique())
+    for refresh in range(args.refreshes):
+        new_rows = prepare_clean_pro(df[df['scraped_date'] >= days[-2]])
+        df = merge_rows(df, new_rows)
+        start = time.perf_counter()
+        index = index.extend(df, new_rows)
+        extend_ms = (time.perf_counter() - start) * 1000
+        fresh = SimilarIndex(df, scale=index.scale)
+        for listing_id in listing_ids[:20]:
+            assert np.allclose(index.similar(df, listing_id, args.k)['distance'].to_numpy(),
+                               fresh.similar(df, listing_id, args.k)['distance'].to_numpy()), (refresh, listing_id)
+        segments = max(len(segments) for segments in index.groups.values())
+        print(f'refresh {refresh}: {len(new_rows)} rows in {extend_ms:.0f} ms, up to {segments} trees per group')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_filter_index import SCENARIOS
+from benchmarks.synthetic import write_synthetic_db
+
+FILTER_DEFAULTS = dict(brand=None, category=None, model=None, localisation=None)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def check(name, memory, sql):
+    # Both engines must give the same answer, up to the order of rows and options
+    if name == 'options':
+        assert sorted(map(str, memory)) == sorted(map(str, sql))
+    elif name == 'daily_mean':
+        assert np.allclose(memory['price'].to_numpy(), sql['price'].to_numpy(), rtol=1e-5)
+    elif name == 'histogram':
+        assert all(np.allclose(m, s) for m, s in zip(memory, sql))
+    elif name == 'value_counts':
+        assert memory.to_dict() == sql.to_dict()
+    elif name == 'correlation':
+        assert np.allclose(memory.to_numpy(), sql.to_numpy(), atol=1e-9, equal_nan=True)
+    elif name == 'sample':
+        assert memory[1] == sql[1] and abs(len(memory[0]) - len(sql[0])) <= 0.05 * len(memory[0]) + 50
+    elif name == 'page':
+        assert memory[1:] == sql[1:]
+        assert np.allclose(memory[0]['price'].to_numpy(dtype=float), sql[0]['price'].to_numpy(dtype=float))
+    else:
+        assert memory == sql
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check QUERY_ENGINE=sql or duckdb against the in-memory '
+                                                 '(pandas) engine and compare their latency')
+    parser.add_argument('--engine', choices=['sql', 'duckdb'], default='sql')
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--url', default=None, help='SQLAlchemy URL of an existing stand-in database instead')
+    parser.add_argument('--no-indexes', action='store_true', help='leave the database without the filter indexes')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    url = args.url or write_synthetic_db(args.rows)
+    os.environ.update(DATABASE_URL=url, SNAPSHOT_DIR=tempfile.mkdtemp())
+    from utilities.dataset import load_dataset
+    from utilities.sql_engine import create_indexes, load_sql_dataset
+
+    if args.engine == 'duckdb':
+        from utilities.duck_engine import load_duck_dataset as load_sql_dataset
+    elif not args.no_indexes:
+        create_indexes()
+    memory, memory_load_ms = timed(load_dataset)
+    sql, sql_load_ms = timed(load_sql_dataset)
+    print(f'load: memory {memory_load_ms:.0f} ms, {args.engine} {sql_load_ms:.0f} ms')
+    assert memory.version == sql.version and memory.bounds == sql.bounds
+
+    queries = {
+        'select': lambda ds, f: ds.select(f),
+        'options': lambda ds, f: ds.options({**f, 'model': None}, 'model'),
+        'daily_mean': lambda ds, f: ds.daily_mean(f),
+        'histogram': lambda ds, f: ds.histogram(f, 'price'),
+        'value_counts': lambda ds, f: ds.value_counts(f, 'brand'),
+        'correlation': lambda ds, f: ds.correlation_matrix(f),
+        'sample': lambda ds, f: ds.sample(f, ['mileage', 'bike_age', 'price', 'model', 'brand'], 'brand', 20000),
+        'page': lambda ds, f: ds.page(f, [{'column_id': 'price', 'direction': 'desc'}], '{mileage} < 50000', 3, 20),
+    }
+    print(f"{'query':<14}{'scenario':<20}{'memory ms':>11}{args.engine + ' ms':>10}")
+    for scenario, filters in SCENARIOS.items():
+        filters = {**FILTER_DEFAULTS, **filters}
+        for name, query in queries.items():
+            # median of fresh evaluations, the filter store would otherwise answer the memory engine
+            memory_ms, sql_ms = [], []
+            for _ in range(args.repeat):
+                memory.filter_store.clear()
+                expected, ms = timed(lambda: query(memory, filters))
+                memory_ms.append(ms)
+                result, ms = timed(lambda: query(sql, filters))
+                sql_ms.append(ms)
+            check(name, expected, result)
+            memory_ms, sql_ms = np.median(memory_ms), np.median(sql_ms)
+            print(f'{name:<14}{scenario:<20}{memory_ms:>11.1f}{sql_ms:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
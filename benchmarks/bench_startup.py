@@ -0,0 +1,92 @@
+import argparse
+import http.client
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.load_test import REPO
+from benchmarks.synthetic import write_synthetic_db
+
+
+def first_byte(port, path):
+    # Seconds until the status line and headers of `path` are back, None while the port is closed
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        elapsed = time.perf_counter() - start
+        response.read()
+        return response.status, elapsed
+    except OSError:
+        return None, None
+    finally:
+        connection.close()
+
+
+def wait_for(port, path, deadline, status=200):
+    while time.perf_counter() < deadline:
+        code, _ = first_byte(port, path)
+        if code == status:
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f'{path} did not answer {status} in time')
+
+
+def run(lazy, args, env):
+    env = dict(env, LAZY_STARTUP='1' if lazy else '0', WEB_CONCURRENCY='1', PORT=str(args.port),
+               REFRESH_INTERVAL='0', SNAPSHOT_DIR=tempfile.mkdtemp())
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:server'],
+                              cwd=REPO, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = start + args.boot_timeout
+        # time until the page is served at all, then until the data is ready
+        while True:
+            code, ttfb = first_byte(args.port, '/')
+            if code == 200:
+                break
+            if server.poll() is not None or time.perf_counter() > deadline:
+                raise RuntimeError('gunicorn did not come up')
+            time.sleep(0.05)
+        first_page_s = time.perf_counter() - start
+        wait_for(args.port, '/ready', deadline)
+        ready_s = time.perf_counter() - start
+        # lazy workers are replaced once the master has loaded the data
+        time.sleep(1)
+        wait_for(args.port, '/ready', deadline)
+
+        timings = {path: np.median([first_byte(args.port, path)[1] for _ in range(args.repeat)]) * 1000
+                   for path in ['/', '/_dash-layout']}
+        return first_page_s, ttfb * 1000, ready_s, timings
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time to first page, time to ready and TTFB at startup')
+    parser.add_argument('--rows', type=int, default=500_000, help='rows of the generated stand-in database')
+    parser.add_argument('--url', default=None, help='SQLAlchemy URL of an existing database instead')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--port', type=int, default=8092)
+    parser.add_argument('--boot-timeout', type=float, default=600)
+    args = parser.parse_args()
+
+    url = args.url or write_synthetic_db(args.rows)
+    env = dict(os.environ, DATABASE_URL=url, CACHE_BACKEND='lru')
+
+    print(f"{'startup':<8}{'first page s':>14}{'first TTFB ms':>15}{'ready s':>9}{'/ TTFB ms':>11}{'layout TTFB ms':>16}")
+    for lazy in [False, True]:
+        first_page_s, first_ttfb_ms, ready_s, timings = run(lazy, args, env)
+        print(f"{'lazy' if lazy else 'eager':<8}{first_page_s:>14.1f}{first_ttfb_ms:>15.0f}{ready_s:>9.1f}"
+              f"{timings['/']:>11.1f}{timings['/_dash-layout']:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
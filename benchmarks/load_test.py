@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+from benchmarks.synthetic import write_synthetic_db
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def process_tree(pid):
+    # pid and its children (the gunicorn workers)
+    pids = [pid]
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError):
+                pass
+    return pids
+
+
+def memory_mb(pids):
+    # RSS counts the shared pages once per process, PSS splits them between the processes sharing them
+    total = {'Rss': 0, 'Pss': 0}
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                for line in f:
+                    key, value = line.split(':', 1)
+                    if key in total:
+                        total[key] += int(value.split()[0])
+        except OSError:
+            pass
+    return {key.lower() + '_mb': value / 1024 for key, value in total.items()}
+
+
+def find_component(layout, component_id):
+    if isinstance(layout, dict):
+        if layout.get('props', {}).get('id') == component_id:
+            return layout['props']
+        return find_component(layout.get('props', {}).get('children'), component_id)
+    if isinstance(layout, list):
+        for child in layout:
+            found = find_component(child, component_id)
+            if found is not None:
+                return found
+    return None
+
+
+def request_bodies(base_url, n_states, seed=0):
+    # One body per (filter-driven callback, filter state); price bounds are drawn at random so the
+    # memoized results are rarely reused and the workers do the filtering work
+    layout = json.load(urllib.request.urlopen(f'{base_url}/_dash-layout'))
+    dependencies = json.load(urllib.request.urlopen(f'{base_url}/_dash-dependencies'))
+    options = find_component(layout, 'brand-dropdown')['options']
+    brands = [None] + [option['value'] if isinstance(option, dict) else option for option in options]
+    price = find_component(layout, 'price-slider')
+
+    rng = np.random.default_rng(seed)
+    bodies = []
+    for _ in range(n_states):
+        lo, hi = sorted(rng.uniform(price['min'], price['max'], 2).round())
+        state = {'brand': brands[rng.integers(len(brands))], 'category': None, 'model': None,
+                 'engine_size': [0, 10000], 'circulation_year': [1900, 2100], 'price': [lo, hi],
+                 'localisation': None}
+        for dependency in dependencies:
+            if [i['id'] for i in dependency['inputs']] != ['filter-state'] or dependency['state']:
+                continue
+            output = dependency['output']
+            if output.startswith('..'):
+                outputs = [dict(zip(['id', 'property'], o.split('.'))) for o in output.strip('.').split('...')]
+            else:
+                outputs = dict(zip(['id', 'property'], output.split('.')))
+            bodies.append(json.dumps({'output': output, 'outputs': outputs,
+                                      'inputs': [{'id': 'filter-state', 'property': 'data', 'value': state}],
+                                      'changedPropIds': ['filter-state.data'], 'state': []}).encode())
+    return bodies
+
+
+def load(base_url, bodies, clients, duration):
+    counts = [0] * clients
+    errors = [0] * clients
+    deadline = time.perf_counter() + duration
+
+    def client(k):
+        i = k
+        while time.perf_counter() < deadline:
+            request = urllib.request.Request(f'{base_url}/_dash-update-component', data=bodies[i % len(bodies)],
+                                             headers={'Content-Type': 'application/json'})
+            try:
+                urllib.request.urlopen(request, timeout=60).read()
+                counts[k] += 1
+            except Exception:
+                errors[k] += 1
+            i += clients
+
+    threads = [threading.Thread(target=client, args=(k,)) for k in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts), sum(errors)
+
+
+def run(n_workers, args, env):
+    port = args.port
+    base_url = f'http://127.0.0.1:{port}'
+    env = dict(env, WEB_CONCURRENCY=str(n_workers), PORT=str(port), REFRESH_INTERVAL='0')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:server'],
+                              cwd=REPO, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        start = time.perf_counter()
+        while True:
+            try:
+                urllib.request.urlopen(f'{base_url}/refresh-status', timeout=5)
+                break
+            except OSError:
+                if server.poll() is not None or time.perf_counter() - start > args.boot_timeout:
+                    raise RuntimeError(f'gunicorn with {n_workers} workers did not come up')
+                time.sleep(0.5)
+        boot_s = time.perf_counter() - start
+
+        bodies = request_bodies(base_url, args.states)
+        idle = memory_mb(process_tree(server.pid))
+        n_requests, n_errors = load(base_url, bodies, args.clients, args.duration)
+        loaded = memory_mb(process_tree(server.pid))
+        return {'workers': n_workers, 'boot_s': round(boot_s, 1),
+                'requests_per_s': round(n_requests / args.duration, 1), 'errors': n_errors,
+                'idle_rss_mb': round(idle['rss_mb']), 'idle_pss_mb': round(idle['pss_mb']),
+                'rss_mb': round(loaded['rss_mb']), 'pss_mb': round(loaded['pss_mb'])}
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Requests/sec and memory of the gunicorn deployment per worker count')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--rows', type=int, default=500_000, help='rows of the generated stand-in database')
+    parser.add_argument('--url', default=None, help='SQLAlchemy URL of an existing database instead')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--states', type=int, default=200, help='distinct filter states replayed')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--boot-timeout', type=float, default=600)
+    args = parser.parse_args()
+
+    url = args.url or write_synthetic_db(args.rows)
+    # fresh snapshot and cache directories, so every run loads and computes the same way
+    work_dir = tempfile.mkdtemp()
+    env = dict(os.environ, DATABASE_URL=url, SNAPSHOT_DIR=os.path.join(work_dir, 'snapshots'),
+               CACHE_BACKEND='lru')
+
+    print(f"{'workers':>8}{'boot s':>8}{'req/s':>8}{'errors':>8}{'idle RSS':>10}{'idle PSS':>10}"
+          f"{'RSS MB':>8}{'PSS MB':>8}")
+    for n_workers in args.workers:
+        result = run(n_workers, args, env)
+        print(f"{result['workers']:>8}{result['boot_s']:>8}{result['requests_per_s']:>8}{result['errors']:>8}"
+              f"{result['idle_rss_mb']:>10}{result['idle_pss_mb']:>10}{result['rss_mb']:>8}{result['pss_mb']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.bench_daily_aggregates import running_sum_path
+from benchmarks.bench_filter_index import SCENARIOS
+from benchmarks.load_test import REPO
+from benchmarks.synthetic import write_synthetic_db
+
+# Filter state of a scenario as published by update_filter_state
+FILTER_DEFAULTS = dict(brand=None, category=None, model=None, localisation=None)
+
+
+def measure(func, repeat, setup=None):
+    # Latency percentiles over `repeat` calls, then one more call under tracemalloc for the peak memory
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'p50_ms': float(np.percentile(timings, 50)), 'p90_ms': float(np.percentile(timings, 90)),
+            'p99_ms': float(np.percentile(timings, 99)), 'mean_ms': float(np.mean(timings)),
+            'peak_mb': peak / 1024 ** 2, 'repeat': repeat}
+
+
+def callback_cases(app, ds):
+    # Body of every callback, memoized ones unwrapped so each call computes
+    datatable_args = (0, 20, [{'column_id': 'price', 'direction': 'asc'}], '')
+    listing_id = int(ds.page({**FILTER_DEFAULTS, **SCENARIOS['default sliders']}, [], '', 0, 1)[0]['id'].iloc[0])
+    per_state = {
+        'update_filter_state': lambda state: app.update_filter_state(
+            ds.version, state['brand'], state['category'], state['model'], state['engine_size'],
+            state['circulation_year'], state['price'], state['localisation']),
+        'update_dd_category': app.update_dd_category,
+        'update_dd_model': app.update_dd_model,
+        'update_dd_brand': app.update_dd_brand,
+        'gen_fig_daily_master_clean_price': app.gen_fig_daily_master_clean_price.__wrapped__,
+        'update_corr_matrix': app.update_corr_matrix.__wrapped__,
+        'update_distrib_subplot': app.update_distrib_subplot.__wrapped__,
+        'update_distrib_plot_brand': app.update_distrib_plot_brand.__wrapped__,
+        'update_distrib_plot_category': app.update_distrib_plot_category.__wrapped__,
+        'update_scatter_3d': app.update_scatter_3d.__wrapped__,
+        'update_datatable_ads': lambda state: app.update_datatable_ads.__wrapped__(state, *datatable_args),
+    }
+    static = {
+        'poll_data_version': lambda: app.poll_data_version(0),
+        'update_filter_ranges': lambda: app.update_filter_ranges(ds.version),
+        'gen_fig_daily_spiders': lambda: app.gen_fig_daily_spiders(ds),
+        'gen_fig_daily_master_clean_count': lambda: app.gen_fig_daily_master_clean_count(ds),
+        'similar_listings': lambda: app.similar_listings(ds, listing_id),
+    }
+    return per_state, static
+
+
+def run_size(url, repeat, io_repeat):
+    # Runs in its own process: the app is imported against `url` and every number is for that table size
+    os.environ.update(DATABASE_URL=url, SNAPSHOT_DIR=tempfile.mkdtemp(), REFRESH_INTERVAL='0',
+                      LAZY_STARTUP='0', CACHE_BACKEND='lru')
+    from utilities.data import get_daily_count, get_table
+    from utilities.calculation import cumulative_count, daily_count, running_sum
+    from utilities.dataset import load_dataset
+    from utilities.filter_index import scan_mask
+
+    results = []
+
+    def record(case, name, scenario, stats):
+        results.append(dict(case=case, name=name, scenario=scenario, **stats))
+        print(f"  {name:<34}{scenario or '':<18}{stats['p50_ms']:>10.1f}{stats['p90_ms']:>10.1f}"
+              f"{stats['peak_mb']:>10.1f}", flush=True)
+
+    for table in ['master', 'master_clean_pro']:
+        record('io', 'get_table', table, measure(lambda: get_table(table, verbose=False), io_repeat))
+    record('io', 'get_daily_count', 'master', measure(lambda: get_daily_count('master', by='source'), io_repeat))
+    record('io', 'load_dataset', None, measure(load_dataset, io_repeat))
+
+    import app
+    ds = app.refresher.dataset
+    df = ds.df_clean_pro
+
+    for scenario, filters in SCENARIOS.items():
+        record('filter', 'filter_index.mask', scenario, measure(lambda: ds.filter_index.mask(**filters), repeat))
+        record('filter', 'scan_mask', scenario, measure(lambda: scan_mask(df, **filters), repeat))
+
+    last_day = ds.df_clean_pro_daily_count['scraped_date'].max()
+    record('aggregate', 'running_sum', 'one day',
+           measure(lambda: running_sum(ds.df_clean_pro_daily_count, last_day), repeat))
+    record('aggregate', 'running_sum', 'every day', measure(lambda: running_sum_path(df), io_repeat))
+    record('aggregate', 'cumulative_count', 'every day', measure(lambda: cumulative_count(daily_count(df)), repeat))
+
+    per_state, static = callback_cases(app, ds)
+    for name, func in static.items():
+        record('callback', name, None, measure(func, repeat))
+    for name, func in per_state.items():
+        for scenario, filters in SCENARIOS.items():
+            state = {**FILTER_DEFAULTS, **filters}
+            # the shared filter store is emptied so every call filters the rows again
+            record('callback', name, scenario, measure(lambda: func(state), repeat, setup=ds.filter_store.clear))
+
+    return {'clean_pro_rows': len(df), 'raw_daily_counts': len(ds.df_raw_daily_count),
+            'process_peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'results': results}
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    import pandas
+    return {'commit': commit, 'date': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pandas.__version__, 'machine': platform.machine(),
+            'cpus': os.cpu_count()}
+
+
+def regressions(report, baseline, tolerance, min_ms=1.0):
+    # Cases whose median latency grew by more than `tolerance` (and by at least min_ms) since the baseline
+    def key(size, result):
+        return size['rows'], result['case'], result['name'], result['scenario']
+
+    previous = {key(size, result): result for size in baseline['sizes'] for result in size['results']}
+    found = []
+    for size in report['sizes']:
+        for result in size['results']:
+            before = previous.get(key(size, result))
+            if before is None:
+                continue
+            if result['p50_ms'] > before['p50_ms'] * (1 + tolerance) and result['p50_ms'] - before['p50_ms'] > min_ms:
+                found.append((key(size, result), before['p50_ms'], result['p50_ms']))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency percentiles and peak memory of the data path and of '
+                                                 'every callback, on generated tables of several sizes')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000],
+                        help='master_clean_pro sizes, 10k to 10M')
+    parser.add_argument('--url', default=None, help='SQLAlchemy URL of an existing stand-in database instead')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--io-repeat', type=int, default=3, help='repeats of the database reads')
+    parser.add_argument('--out', default='benchmark.json')
+    parser.add_argument('--baseline', default=None, help='earlier --out file to compare the medians with')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        size = run_size(args.url, args.repeat, args.io_repeat)
+        with open(args.out, 'w') as f:
+            json.dump(size, f)
+        return
+
+    report = {'meta': metadata(), 'sizes': []}
+    for n_rows in ([None] if args.url else args.rows):
+        url = args.url or write_synthetic_db(n_rows)
+        print(f"{'':2}{'name':<34}{'scenario':<18}{'p50 ms':>10}{'p90 ms':>10}{'peak MB':>10}")
+        out = os.path.join(tempfile.mkdtemp(), 'size.json')
+        subprocess.run([sys.executable, '-m', 'benchmarks.suite', '--child', '--url', url, '--out', out,
+                        '--repeat', str(args.repeat), '--io-repeat', str(args.io_repeat)], cwd=REPO, check=True)
+        with open(out) as f:
+            size = json.load(f)
+        report['sizes'].append({'rows': size['clean_pro_rows'], **size})
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f'Report written to {args.out}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for (rows, case, name, scenario), before, after in found:
+            print(f'REGRESSION {rows} rows {case} {name} {scenario or ""}: {before:.1f} -> {after:.1f} ms')
+        sys.exit(1 if found else 0)
+
+
+if __name__ == '__main__':
+    main()
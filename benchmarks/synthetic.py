@@ -0,0 +1,89 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from sqlalchemy import create_engine
+
+BRANDS = ['YAMAHA', 'HONDA', 'KAWASAKI', 'SUZUKI', 'BMW', 'DUCATI', 'TRIUMPH', 'KTM', 'HARLEY-DAVIDSON',
+          'APRILIA', 'MOTO GUZZI', 'HUSQVARNA', 'ROYAL ENFIELD', 'MV AGUSTA', 'BENELLI', 'INDIAN', 'PIAGGIO',
+          'SYM', 'KYMCO', 'PEUGEOT']
+CATEGORIES = ['roadster', 'sportive', 'trail', 'custom', 'routiere', 'scooter', 'enduro', 'cross', 'supermotard',
+              'vintage']
+SOURCES = ['lacentrale', 'leboncoin', 'moto-occasion', 'motoplanete', 'paruvendu', 'autoscout24']
+N_MODELS = 1200
+N_CODE_NAMES = 13
+
+
+def gen_master_clean_pro(n_rows, n_days=330, seed=0):
+    rng = np.random.default_rng(seed)
+
+    model_brand = rng.integers(0, len(BRANDS), N_MODELS)
+    model_category = rng.integers(0, len(CATEGORIES), N_MODELS)
+    model_engine = rng.choice([50, 125, 300, 400, 500, 650, 700, 750, 800, 900, 1000, 1200, 1250, 1800], N_MODELS)
+    # Zipf-like popularity so a few models dominate, as on the real listing sites
+    popularity = 1 / np.arange(1, N_MODELS + 1) ** 0.9
+    model_ids = rng.choice(N_MODELS, n_rows, p=popularity / popularity.sum())
+
+    circulation_year = rng.integers(1985, 2023, n_rows)
+    bike_age = 2022 - circulation_year
+    mileage = np.round(rng.gamma(2.0, 6000, n_rows) * (1 + bike_age / 5))
+    engine_size = model_engine[model_ids]
+    price = np.round(np.clip(2000 + engine_size * 9 * np.exp(-bike_age / 9) * rng.lognormal(0, 0.25, n_rows)
+                             - mileage * 0.02, 300, 60000))
+
+    first_day = date(2021, 11, 1)
+    scraped_date = np.array([first_day + timedelta(days=int(d)) for d in range(n_days)], dtype=object)
+    days = scraped_date[rng.integers(0, n_days, n_rows)]
+
+    return pd.DataFrame({
+        'id': np.arange(n_rows),
+        'brand': np.array(BRANDS, dtype=object)[model_brand[model_ids]],
+        'category': np.array(CATEGORIES, dtype=object)[model_category[model_ids]],
+        'model': np.array([f'MODEL {k}' for k in range(N_MODELS)], dtype=object)[model_ids],
+        'engine_size': engine_size,
+        'circulation_year': circulation_year,
+        'bike_age': bike_age,
+        'mileage': mileage,
+        'price': price,
+        'code_name': np.array([f'REGION {k}' for k in range(N_CODE_NAMES)], dtype=object)[
+            rng.integers(0, N_CODE_NAMES, n_rows)],
+        'source': np.array(SOURCES, dtype=object)[rng.integers(0, len(SOURCES), n_rows)],
+        'url': np.array([f'https://example.com/ad/{k}' for k in range(n_rows)], dtype=object),
+        'scraped_date': days,
+    })
+
+
+def gen_master(n_rows, n_days=40, seed=0):
+    # Raw listings as scraped, every source, the last `n_days` days up to today. Sources are uneven
+    # and the raw fields are often missing, as before cleaning.
+    rng = np.random.default_rng(seed)
+    weights = np.array([30, 40, 10, 5, 5, 10], dtype=float)
+    today = date.today()
+    scraped_date = np.array([today - timedelta(days=int(d)) for d in range(n_days)], dtype=object)
+
+    brand = np.array(BRANDS + [None], dtype=object)[rng.integers(0, len(BRANDS) + 1, n_rows)]
+    price = np.round(rng.lognormal(8.8, 0.7, n_rows))
+    price[rng.random(n_rows) < 0.1] = np.nan
+    return pd.DataFrame({
+        'id': np.arange(n_rows),
+        'source': np.array(SOURCES, dtype=object)[rng.choice(len(SOURCES), n_rows, p=weights / weights.sum())],
+        'brand': brand,
+        'model': np.array([f'MODEL {k}' for k in range(N_MODELS)], dtype=object)[rng.integers(0, N_MODELS, n_rows)],
+        'price': price,
+        'url': np.array([f'https://example.com/raw/{k}' for k in range(n_rows)], dtype=object),
+        'scraped_date': scraped_date[rng.integers(0, n_days, n_rows)],
+    })
+
+
+def write_synthetic_db(n_rows, n_raw_rows=None, url=None):
+    # SQLite stand-in of the Postgres database holding both tables, returns its SQLAlchemy URL
+    if url is None:
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'synthetic.sqlite')}"
+    print(f'Writing {n_rows} synthetic rows to {url}')
+    engine = create_engine(url)
+    gen_master_clean_pro(n_rows).to_sql('master_clean_pro', engine, index=False, chunksize=50000)
+    gen_master(n_raw_rows or min(n_rows, 100_000)).to_sql('master', engine, index=False, chunksize=50000)
+    engine.dispose()
+    return url
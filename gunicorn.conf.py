@@ -0,0 +1,58 @@
+import gc
+import os
+import shutil
+import signal
+
+# The app, and the dataset it loads at import, is loaded once in the master and the workers are forked
+# from it, so N workers share one physical copy of the data instead of each loading its own
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+preload_app = True
+timeout = 120
+
+# Where the workers write their callback metrics, so a scrape served by any of them covers them all
+PROMETHEUS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+
+def freeze():
+    # Objects alive now are moved out of the cyclic collector's reach: a collection in a worker would
+    # otherwise write to their headers and unshare the pages holding them
+    gc.collect()
+    gc.freeze()
+
+
+def reload_workers(dataset):
+    # Called from the refresh thread: HUP hands the reload to the arbiter's main loop, which forks new workers
+    # from the master as it is now and gracefully stops the old ones
+    freeze()
+    os.kill(os.getpid(), signal.SIGHUP)
+
+
+def on_starting(server):
+    # Runs once in the master, before the first worker is forked: the figures of a previous run are dropped.
+    # The config module itself is executed again on every reload, the directory must outlive those.
+    if PROMETHEUS_MULTIPROC_DIR:
+        shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+        os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+
+
+def post_fork(server, worker):
+    from utilities.data import dispose_engine
+
+    dispose_engine()
+
+
+def child_exit(server, worker):
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def when_ready(server):
+    import app
+
+    # The refresh thread only runs in the master, workers pick up its dataset when they are replaced. With
+    # LAZY_STARTUP the first workers serve the skeleton until the initial load triggers the first reload.
+    app.refresher.on_swap = reload_workers
+    freeze()
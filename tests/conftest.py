@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from benchmarks.bench_filter_index import SCENARIOS
+from benchmarks.synthetic import gen_master_clean_pro, write_synthetic_db
+from utilities import data
+from utilities.dataset import prepare_clean_pro
+
+
+def with_nulls(df, fraction=0.01, seed=1):
+    # A few nulls in the filtered and fitted columns, as the scraped data holds
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    for col in ['brand', 'model', 'code_name', 'engine_size', 'mileage', 'price']:
+        rows = rng.random(len(df)) < fraction
+        df[col] = df[col].astype(object if df[col].dtype == object else np.float64)
+        df.loc[rows, col] = None if df[col].dtype == object else np.nan
+    return df
+
+
+@pytest.fixture(scope='session')
+def clean_pro():
+    return prepare_clean_pro(with_nulls(gen_master_clean_pro(20_000, n_days=60)))
+
+
+@pytest.fixture(params=list(SCENARIOS))
+def filters(request):
+    return SCENARIOS[request.param]
+
+
+def refreshed(df, days=2, price_factor=1.1):
+    # The rows a refresh reads again: the last `days` scraped days, prices moved in between
+    last_days = np.sort(df['scraped_date'].dropna().unique())[-days:]
+    new_rows = df[df['scraped_date'] >= last_days[0]]
+    return new_rows.assign(price=new_rows['price'] * price_factor)
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # A SQLite copy of both tables the app reads, with its own snapshot directory
+    url = write_synthetic_db(2_000, url=f"sqlite:///{tmp_path / 'synthetic.sqlite'}")
+    monkeypatch.setenv('DATABASE_URL', url)
+    monkeypatch.setattr(data, 'SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    monkeypatch.setattr(data, '_engine', None)
+    yield url
+    data.get_engine().dispose()
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+import pandas as pd
+
+from tests.conftest import refreshed
+from utilities.calculation import cumulative_count, daily_count, extend_daily_count, running_sum
+from utilities.dataset import merge_rows
+
+
+def refreshes(df):
+    # The last two days read again with some rows gone, then a new day
+    new_rows = refreshed(df).iloc[::2]
+    yield new_rows
+    df = merge_rows(df, new_rows)
+    last_day = df['scraped_date'].max()
+    yield df[df['scraped_date'] == last_day].assign(scraped_date=last_day + timedelta(days=1))
+
+
+def test_cumulative_count_matches_running_sum(clean_pro):
+    result = cumulative_count(daily_count(clean_pro))
+    expected = [running_sum(result, day) for day in result['scraped_date']]
+    assert result['cumul_count'].tolist() == expected
+    assert result['url'].sum() == clean_pro['url'].count()
+
+
+def test_extend_daily_count_matches_a_recount(clean_pro):
+    df = clean_pro
+    df_daily_count = cumulative_count(daily_count(df))
+    df_brand_count = daily_count(df, by='brand')
+    for new_rows in refreshes(df):
+        df = merge_rows(df, new_rows)
+        df_daily_count = extend_daily_count(df_daily_count, new_rows)
+        df_brand_count = extend_daily_count(df_brand_count, new_rows, by='brand')
+        pd.testing.assert_frame_equal(df_daily_count, cumulative_count(daily_count(df)))
+        pd.testing.assert_frame_equal(df_brand_count, daily_count(df, by='brand'))
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from tests.conftest import refreshed
+from utilities.correlation import CORRELATION_EXCLUDED, CorrelationStats
+from utilities.filter_index import scan_mask
+
+
+def with_bool(df):
+    return df.assign(is_pro=(df['mileage'] < df['mileage'].median()))
+
+
+def baseline(df):
+    # The matrix the app computed with DataFrame.corr() before the statistics were kept
+    return df.drop(columns=CORRELATION_EXCLUDED, errors='ignore').corr(numeric_only=True)
+
+
+def test_matrix_matches_dataframe_corr(clean_pro, filters):
+    df = with_bool(clean_pro)
+    stats = CorrelationStats(df)
+    assert 'is_pro' in stats.columns
+    pd.testing.assert_frame_equal(stats.matrix(), baseline(df), atol=1e-9)
+    mask = scan_mask(df, **filters)
+    pd.testing.assert_frame_equal(stats.matrix(np.flatnonzero(mask.to_numpy())), baseline(df[mask]), atol=1e-9)
+
+
+def test_extend_matches_a_rebuild(clean_pro):
+    df = with_bool(clean_pro)
+    new_rows = refreshed(df)
+    extended = pd.concat([df[df['scraped_date'] < new_rows['scraped_date'].min()], new_rows], ignore_index=True)
+    stats = CorrelationStats(df)
+    pd.testing.assert_frame_equal(stats.extend(extended, new_rows).matrix(), baseline(extended), atol=1e-9)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from utilities.calculation import daily_mean
+from utilities.cube import PriceCube
+from utilities.filter_index import FilterIndex, scan_mask
+
+# Slider ranges falling inside the cube bins, so that the rows of the cut bins are read from the index
+CUT_SLIDERS = {
+    'cut sliders': dict(engine_size=[612, 887], circulation_year=[2004, 2019], price=[5123, 9077]),
+    'cut price': dict(brand='YAMAHA', engine_size=[50, 1800], circulation_year=[1985, 2022], price=[2001, 20999]),
+    'reversed range': dict(engine_size=[887, 612], circulation_year=[2019, 2004], price=[9077, 5123]),
+    'single bin': dict(engine_size=[650, 660], circulation_year=[2010, 2010], price=[4010, 4090]),
+}
+
+
+@pytest.fixture(scope='module')
+def cube(clean_pro):
+    return PriceCube(clean_pro, FilterIndex(clean_pro))
+
+
+def assert_daily_mean(df, cube, filters):
+    expected = daily_mean(df.iloc[np.flatnonzero(scan_mask(df, **filters).to_numpy())])
+    result = cube.daily_mean(**filters)
+    assert list(result['scraped_date']) == list(expected['scraped_date'])
+    np.testing.assert_array_equal(result['count'], expected['count'])
+    np.testing.assert_allclose(result['sum'], expected['sum'], rtol=1e-12)
+    np.testing.assert_allclose(result['price'], expected['price'], rtol=1e-12)
+    np.testing.assert_allclose(result['SMA30'], expected['SMA30'], rtol=1e-12)
+
+
+def test_matches_the_filtered_rows(clean_pro, cube, filters):
+    assert_daily_mean(clean_pro, cube, filters)
+
+
+@pytest.mark.parametrize('name', list(CUT_SLIDERS))
+def test_matches_the_filtered_rows_when_sliders_cut_bins(clean_pro, cube, name):
+    filters = CUT_SLIDERS[name]
+    assert any(cube.classify_bins(col, filters[col])[1] for col in cube.bin_min)
+    assert_daily_mean(clean_pro, cube, filters)
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+from utilities import data
+
+
+def same_rows(df, expected):
+    # Row order and category sets depend on how the frame was assembled
+    df, expected = [frame.astype({col: object for col in frame.select_dtypes('category')})
+                    .sort_values('url').reset_index(drop=True) for frame in (df, expected)]
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+
+def scrape(days, moved=1.1):
+    # Appends a batch: the last scraped day again with prices moved, then `days` new days
+    engine = data.get_engine()
+    df = pd.read_sql('SELECT * FROM master_clean_pro', engine)
+    last_day = pd.Timestamp(df['scraped_date'].max())
+    rows = df[pd.to_datetime(df['scraped_date']) == last_day]
+    batches = [rows.assign(price=rows['price'] * moved, url=rows['url'] + '?again')]
+    for day in range(1, days + 1):
+        batches.append(rows.assign(scraped_date=str((last_day + timedelta(days=day)).date()),
+                                   url=rows['url'] + f'?day={day}'))
+    pd.concat(batches).to_sql('master_clean_pro', engine, index=False, if_exists='append')
+
+
+def test_snapshot_plus_delta_matches_the_database(database):
+    first = data.get_table_cached('master_clean_pro', verbose=False)
+    same_rows(first, data.get_table('master_clean_pro', verbose=False))
+    _, watermark, since = data.load_snapshot('master_clean_pro')
+    assert since is None
+
+    scrape(days=2)
+    df = data.get_table_cached('master_clean_pro', verbose=False)
+    same_rows(df, data.get_table('master_clean_pro', verbose=False))
+    assert data.load_snapshot('master_clean_pro')[1] == watermark + timedelta(days=2)
+
+
+def test_bounded_read_keeps_the_older_rows_in_the_snapshot(database):
+    data.get_table_cached('master_clean_pro', verbose=False)
+    scrape(days=1)
+    since = data.load_snapshot('master_clean_pro')[1] - timedelta(days=3)
+    df = data.get_table_cached('master_clean_pro', max_scraped_date=since, verbose=False)
+    same_rows(df, data.get_table('master_clean_pro', max_scraped_date=since, verbose=False))
+
+    snapshot, _, _ = data.load_snapshot('master_clean_pro')
+    same_rows(snapshot, data.get_table('master_clean_pro', verbose=False))
+    same_rows(data.get_table_cached('master_clean_pro', verbose=False),
+              data.get_table('master_clean_pro', verbose=False))
+
+
+def test_partial_snapshot_is_refilled_for_older_reads(database):
+    days = sorted(data.get_table('master_clean_pro', verbose=False)['scraped_date'].unique())
+    since = pd.Timestamp(days[-5]).date()
+    data.rebuild_snapshots(['master_clean_pro'], max_scraped_date=str(since))
+    assert data.load_snapshot('master_clean_pro')[2] == since
+
+    # reads within the snapshot are served from it, older ones refill it
+    same_rows(data.get_table_cached('master_clean_pro', max_scraped_date=days[-3], verbose=False),
+              data.get_table('master_clean_pro', max_scraped_date=days[-3], verbose=False))
+    assert data.load_snapshot('master_clean_pro')[2] == since
+    same_rows(data.get_table_cached('master_clean_pro', verbose=False),
+              data.get_table('master_clean_pro', verbose=False))
+    assert data.load_snapshot('master_clean_pro')[2] is None
+
+
+def test_dispose_engine_leaves_the_inherited_connections_open(database):
+    # As in a forked worker: a fresh pool, while the connections of the master stay usable
+    engine = data.get_engine()
+    with engine.connect() as connection:
+        pool = engine.pool
+        data.dispose_engine()
+        assert engine.pool is not pool
+        assert connection.execute(text('SELECT COUNT(*) FROM master')).scalar() > 0
+    assert data.get_engine() is engine
@@ -0,0 +1,54 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import gen_master
+from utilities import data
+from utilities.data import get_daily_count
+from utilities.dataset import extend_raw_daily_count, raw_daily_count_is_current, raw_min_date, source_counts
+
+
+def read_raw_daily_count(max_scraped_date=None):
+    return get_daily_count('master', by='source', max_scraped_date=max_scraped_date or raw_min_date())
+
+
+def scrape_master(n_rows, seed=1):
+    # Raw rows scraped today, appended to master
+    df = gen_master(n_rows, n_days=1, seed=seed)
+    df['id'] += 1_000_000
+    df.to_sql('master', data.get_engine(), index=False, if_exists='append')
+
+
+def test_source_counts_match_the_per_source_loop(database):
+    df_raw_daily_count = read_raw_daily_count()
+    # one source stopped scraping three days ago
+    source = df_raw_daily_count['source'].iloc[0]
+    today = date.today()
+    df_raw_daily_count = df_raw_daily_count[(df_raw_daily_count['source'] != source) |
+                                            (df_raw_daily_count['scraped_date'] < today - timedelta(days=2))]
+
+    counts, stale = source_counts(df_raw_daily_count, today)
+    # one bar chart per source and its colour, as gen_fig_daily_spiders drew them one source at a time
+    assert sorted(counts.columns) == sorted(df_raw_daily_count['source'].unique())
+    for name in df_raw_daily_count['source'].unique():
+        df_temp = df_raw_daily_count[df_raw_daily_count['source'] == name]
+        assert list(counts[name].dropna().index) == list(df_temp['scraped_date'])
+        np.testing.assert_array_equal(counts[name].dropna().to_numpy(), df_temp['url'].to_numpy())
+        assert stale[name] == (df_temp['scraped_date'].max() < today - timedelta(days=2)), name
+    assert stale[source] and stale.sum() == 1
+
+
+def test_extend_raw_daily_count_matches_a_fresh_count(database):
+    df_raw_daily_count = read_raw_daily_count()
+    last_day = df_raw_daily_count['scraped_date'].max()
+    # a refresh reads the counts again from the last day held on, as DataRefresher.refresh does
+    since = last_day - timedelta(days=1)
+    assert raw_daily_count_is_current(df_raw_daily_count, read_raw_daily_count(since), last_day)
+
+    scrape_master(300)
+    new_raw_daily_count = read_raw_daily_count(since)
+    assert not raw_daily_count_is_current(df_raw_daily_count, new_raw_daily_count, last_day)
+    extended = extend_raw_daily_count(df_raw_daily_count, new_raw_daily_count)
+    pd.testing.assert_frame_equal(extended, read_raw_daily_count())
+    assert raw_daily_count_is_current(extended, read_raw_daily_count(since), last_day)
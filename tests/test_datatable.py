@@ -0,0 +1,106 @@
+import operator
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utilities.datatable import SortIndex, parse_filter_query, query_page
+from utilities.dtypes import optimize_dtypes
+
+COMPARE = {'=': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt,
+           '>=': operator.ge}
+
+QUERIES = ['{price} >= 5000', '{price} lt 3000', '{price} = 2405', '{price} ne 2405', '{price} is blank',
+           '{mileage} <= 10000 && {engine_size} > 500', '{engine_size} ge 700 && {brand} is not blank',
+           '{brand} contains YA', '{brand} icontains ya', '{brand} scontains ya', '{brand} = SYM', '{brand} ieq sym',
+           '{brand} != SYM', '{brand} > K', '{brand} is blank', '{model} contains 1', '{model} = "MODEL 1"',
+           '{model} is not blank', '{code_name} ine "region 10"', '{url} contains ad/1',
+           '{scraped_date} datestartswith 2022-01', '{scraped_date} >= 2022-01-15', '{unknown} = 1', 'garbage']
+
+SORTS = [[{'column_id': 'price', 'direction': 'desc'}],
+         [{'column_id': 'brand', 'direction': 'asc'}, {'column_id': 'mileage', 'direction': 'desc'}],
+         [{'column_id': 'model', 'direction': 'desc'}, {'column_id': 'engine_size', 'direction': 'asc'},
+          {'column_id': 'scraped_date', 'direction': 'desc'}]]
+
+
+@pytest.fixture(params=['object', 'optimized'])
+def frame(request, clean_pro):
+    # The frame as generated, and with the dtypes the app loads it with (categories, float32, arrow strings)
+    df = clean_pro.head(5_000).reset_index(drop=True)
+    return df if request.param == 'object' else optimize_dtypes(df.copy(), 'master_clean_pro')
+
+
+def text(value):
+    return str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+
+
+def matches(cell, op, value, case_sensitive, numeric):
+    # One cell against one condition, as the DataTable filter reads: a null is blank and matches nothing else
+    if op in ('is blank', 'is not blank'):
+        return (pd.isna(cell) or str(cell) == '') == (op == 'is blank')
+    if pd.isna(cell):
+        return False
+    cell_text, value_text = str(cell), text(value)
+    if not case_sensitive:
+        cell_text, value_text = cell_text.lower(), value_text.lower()
+    if op == 'contains':
+        return value_text in cell_text
+    if op == 'datestartswith':
+        return cell_text.startswith(value_text)
+    if numeric and isinstance(value, float):
+        return COMPARE[op](float(cell), value)
+    return COMPARE[op](cell_text, value_text)
+
+
+def reference(df, filter_query, sort_by):
+    # Positions of the rows kept and sorted by plain pandas: one cell at a time, then a stable sort per column
+    # from the last one, nulls last ascending and first descending as the SQL engines order them
+    keep = np.ones(len(df), dtype=bool)
+    for column, op, value, case_sensitive in parse_filter_query(filter_query):
+        if column in df.columns:
+            numeric = pd.api.types.is_numeric_dtype(df[column])
+            keep &= [matches(cell, op, value, case_sensitive, numeric) for cell in df[column].astype(object)]
+    selected = df[keep]
+    for s in reversed(sort_by or []):
+        ascending = s['direction'] == 'asc'
+        selected = selected.sort_values(s['column_id'], ascending=ascending, kind='stable',
+                                        na_position='last' if ascending else 'first')
+    return selected.index.to_numpy()
+
+
+def test_filter_query_parts():
+    assert parse_filter_query('{brand} icontains "yam" && {price} >= 5000 && {comment} is blank') == [
+        ('brand', 'contains', 'yam', False), ('price', '>=', 5000.0, True), ('comment', 'is blank', None, True)]
+    assert parse_filter_query('{model} scontains 1 && {brand} ine `it\\`s` && {price} between 1') == [
+        ('model', 'contains', 1.0, True), ('brand', '!=', 'it`s', False)]
+
+
+def test_filter_query_matches_the_reference(frame):
+    rows = np.arange(len(frame))
+    sort_index = SortIndex(frame)
+    for filter_query in QUERIES:
+        expected = reference(frame, filter_query, None)
+        df_page, page_current, page_count = query_page(frame, rows, sort_index, None, filter_query, 0, len(frame))
+        np.testing.assert_array_equal(df_page.index.to_numpy(), expected, err_msg=filter_query)
+    assert len(reference(frame, '{model} contains 1', None)) > 0
+
+
+def test_sorting_and_paging_match_the_reference(frame):
+    rows = np.flatnonzero(frame['price'].isna().to_numpy() | (frame['mileage'] < 20_000).to_numpy())
+    sort_index = SortIndex(frame)
+    for sort_by in SORTS:
+        expected = reference(frame.iloc[rows], '{brand} is not blank', sort_by)
+        n_pages = -(-len(expected) // 25)
+        for page in [0, 1, n_pages - 1, n_pages, 1_000]:
+            df_page, page_current, page_count = query_page(frame, rows, sort_index, sort_by,
+                                                           '{brand} is not blank', page, 25)
+            # past the end, the last page is served
+            assert (page_current, page_count) == (min(page, n_pages - 1), n_pages)
+            np.testing.assert_array_equal(df_page.index.to_numpy(),
+                                          expected[page_current * 25:(page_current + 1) * 25], err_msg=str(sort_by))
+
+
+def test_nothing_left_serves_one_empty_page(frame):
+    df_page, page_current, page_count = query_page(frame, np.arange(len(frame)), SortIndex(frame), SORTS[0],
+                                                   '{price} < 0', 3, 25)
+    assert (len(df_page), page_current, page_count) == (0, 0, 1)
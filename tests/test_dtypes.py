@@ -0,0 +1,73 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import gen_master
+from utilities.dtypes import SCHEMAS, optimize_column, optimize_dtypes
+
+EXPECTED_KIND = {'category': lambda dtype: isinstance(dtype, pd.CategoricalDtype),
+                 'float': lambda dtype: dtype == np.float32,
+                 'string': lambda dtype: dtype == pd.StringDtype('pyarrow'),
+                 'date': lambda dtype: dtype == object}
+
+
+def as_loaded(clean_pro):
+    # master_clean_pro with every column of its schema, as read from the database
+    df = clean_pro.copy()
+    for col in ['localisation', 'dept_code', 'vendor_type', 'engine_type', 'condition']:
+        df[col] = np.where(np.arange(len(df)) % 7 == 0, None, [f'{col} {k % 5}' for k in range(len(df))])
+    return df
+
+
+def assert_same_values(df, expected):
+    for col in expected.columns:
+        values, expected_values = df[col].astype(object), expected[col].astype(object)
+        assert (values.isna() == expected_values.isna()).all(), col
+        present = expected_values.notna()
+        if pd.api.types.is_float_dtype(expected[col]) or pd.api.types.is_float_dtype(df[col]):
+            # float32 holds these prices, mileages and sizes exactly
+            np.testing.assert_array_equal(values[present].astype(np.float64),
+                                          expected_values[present].astype(np.float64), err_msg=col)
+        else:
+            assert list(values[present]) == list(expected_values[present]), col
+
+
+@pytest.mark.parametrize('table', list(SCHEMAS))
+def test_schema_dtypes_and_values(clean_pro, table):
+    df = as_loaded(clean_pro) if table == 'master_clean_pro' else gen_master(5_000)
+    optimized = optimize_dtypes(df.copy(), table)
+    for col, kind in SCHEMAS[table].items():
+        dtype = optimized[col].dtype
+        if kind == 'integer':
+            # float32 while nulls are present, see test_integer_columns for the widths
+            assert dtype == np.float32 if df[col].isna().any() else pd.api.types.is_signed_integer_dtype(dtype), col
+        else:
+            assert EXPECTED_KIND[kind](dtype), (col, dtype)
+    assert_same_values(optimized, df)
+    assert optimized.memory_usage(deep=True).sum() < df.memory_usage(deep=True).sum()
+
+
+def test_integer_columns(clean_pro):
+    # engine_size holds nulls, circulation_year and bike_age do not
+    assert clean_pro['engine_size'].isna().any()
+    assert optimize_column(clean_pro['engine_size'], 'integer').dtype == np.float32
+    assert optimize_column(clean_pro['circulation_year'], 'integer').dtype == np.int16
+    assert optimize_column(clean_pro['bike_age'], 'integer').dtype == np.int8
+    # other numeric columns are downcast as well
+    optimized = optimize_dtypes(clean_pro[['id', 'mileage']].assign(score=clean_pro['price'] / 3), 'master_clean_pro')
+    assert list(optimized.dtypes) == [np.int16, np.float32, np.float32]
+
+
+def test_scraped_date_is_factorized(clean_pro):
+    days = clean_pro['scraped_date'].where(np.arange(len(clean_pro)) % 50 > 0)
+    for series in [days, days.map(lambda day: None if pd.isna(day) else day.isoformat())]:
+        optimized = optimize_column(series, 'date')
+        assert optimized.dtype == object and optimized.index.equals(series.index)
+        present = optimized.notna()
+        assert (present == days.notna()).all()
+        assert list(optimized[present]) == list(days[present])
+        assert all(isinstance(day, date) for day in optimized[present])
+        # one object per distinct day
+        assert len({id(day) for day in optimized[present]}) == days.nunique()
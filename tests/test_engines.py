@@ -0,0 +1,119 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.bench_filter_index import SCENARIOS
+from utilities import data
+from utilities.dataset import load_dataset
+from utilities.duck_engine import load_duck_dataset
+from utilities.sql_engine import load_sql_dataset
+
+ENGINES = {'sql': load_sql_dataset, 'duckdb': load_duck_dataset}
+
+
+def states(dataset):
+    # The sliders over their whole range, as the app publishes them first, and the filter benchmark scenarios
+    return {'unfiltered': {col: list(bounds) for col, bounds in dataset.bounds.items()}, **SCENARIOS}
+
+
+@pytest.fixture(params=list(ENGINES))
+def datasets(request, database):
+    # The memory engine and one of the others over the same table, with a bool column as the scraper may add
+    engine = data.get_engine()
+    df = pd.read_sql('SELECT * FROM master_clean_pro', engine)
+    df['is_pro'] = df['mileage'] < df['mileage'].median()
+    df.to_sql('master_clean_pro', engine, index=False, if_exists='replace')
+    return load_dataset(), ENGINES[request.param]()
+
+
+def test_selection_and_options(datasets):
+    memory, other = datasets
+    for name, filters in states(memory).items():
+        assert other.select(filters) == memory.select(filters), name
+        for column in ['brand', 'category', 'model']:
+            assert list(other.options(filters, column)) == list(memory.options(filters, column)), (name, column)
+
+
+def test_aggregates(datasets):
+    memory, other = datasets
+    for name, filters in states(memory).items():
+        for column in ['price', 'mileage']:
+            for expected, value in zip(memory.histogram(filters, column), other.histogram(filters, column)):
+                np.testing.assert_allclose(value, expected, err_msg=f'{name} {column}')
+        expected = memory.value_counts(filters, 'brand')
+        assert other.value_counts(filters, 'brand').to_dict() == expected.to_dict(), name
+
+        expected, value = memory.daily_mean(filters), other.daily_mean(filters)
+        assert list(value['scraped_date']) == list(expected['scraped_date']), name
+        np.testing.assert_allclose(value['price'], expected['price'], rtol=1e-6, err_msg=name)
+
+
+def test_sample_quotas(datasets):
+    # Both engines keep as many rows of each group, the rows themselves are drawn differently. With more
+    # groups than the budget, both sample uniformly.
+    memory, other = datasets
+    for name, filters in states(memory).items():
+        for group_col, budget in [('brand', 300), ('category', 300), ('model', 1_000), ('model', 300), (None, 300)]:
+            expected, value = [dataset.sample(filters, ['id', 'brand', 'category', 'model'], group_col, budget)
+                               for dataset in (memory, other)]
+            assert value[1] == expected[1], name
+            assert len(value[0]) == len(expected[0]) <= budget, (name, group_col, budget)
+            if group_col is not None and memory.take(filters, [group_col])[group_col].nunique() < budget:
+                counts = [sample[group_col].astype(object).value_counts().to_dict()
+                          for sample in (value[0], expected[0])]
+                assert counts[0] == counts[1], (name, group_col, budget)
+
+
+def test_correlation_matrix(datasets):
+    memory, other = datasets
+    for name, filters in states(memory).items():
+        expected = memory.correlation_matrix(filters)
+        assert 'is_pro' in expected.columns
+        pd.testing.assert_frame_equal(other.correlation_matrix(filters).loc[expected.index, expected.columns],
+                                      expected, atol=1e-6, obj=name)
+
+
+def test_page_similar_and_export(datasets):
+    memory, other = datasets
+    sort_by = [{'column_id': 'price', 'direction': 'desc'}, {'column_id': 'id', 'direction': 'asc'}]
+    for name, filters in states(memory).items():
+        for page_current in [0, 3]:
+            expected, value = [dataset.page(filters, sort_by, '{brand} contains Y', page_current, 25)
+                               for dataset in (memory, other)]
+            assert list(value[0]['id']) == list(expected[0]['id']), name
+            assert value[1:] == expected[1:], name
+
+        columns = ['id', 'brand', 'price', 'scraped_date']
+        expected, value = [pd.concat(list(dataset.export(filters, columns, 10_000))) for dataset in (memory, other)]
+        assert sorted(value['id']) == sorted(expected['id']), name
+        assert list(value['scraped_date']) == sorted(value['scraped_date'], reverse=True), name
+
+    for listing_id in memory.df_clean_pro['id'].iloc[::400]:
+        expected, value = memory.similar(listing_id), other.similar(listing_id)
+        np.testing.assert_allclose(value['distance'], expected['distance'], rtol=1e-6)
+
+
+def test_duckdb_file_is_built_once(database):
+    dataset = load_duck_dataset()
+    files = glob.glob(os.path.join(data.SNAPSHOT_DIR, '*.duckdb'))
+    assert files == [dataset.path]
+    # a forked worker attaches the file read-only, where the builder wrote it
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            n = dataset.read('SELECT COUNT(*) AS n FROM master_clean_pro')['n'].iloc[0]
+            os.write(write, str(n).encode())
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    os.close(write)
+    assert int(os.read(read, 64)) == dataset.n_rows
+    assert dataset.con is None
+
+    # the previous generation stays for the workers still reading it, older ones are removed
+    newer = [load_duck_dataset().path for _ in range(3)]
+    assert sorted(glob.glob(os.path.join(data.SNAPSHOT_DIR, '*.duckdb'))) == sorted(newer[-2:])
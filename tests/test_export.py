@@ -0,0 +1,61 @@
+import io
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from tests.test_filter_index import RAW_DAILY_COUNT
+from utilities import dataset as dataset_module
+from utilities.dataset import Dataset
+from utilities.export import export_chunks, export_filters, export_url
+from utilities.filter_store import normalize_filters
+
+COLUMNS = ['id', 'brand', 'model', 'engine_size', 'price', 'mileage', 'scraped_date']
+
+
+def request_args(url):
+    return MultiDict(parse_qsl(urlsplit(url).query))
+
+
+def read_export(chunks, fmt):
+    data = b''.join(chunk.encode() if isinstance(chunk, str) else chunk for chunk in chunks)
+    return pd.read_csv(io.BytesIO(data)) if fmt == 'csv' else pd.read_parquet(io.BytesIO(data))
+
+
+def test_url_round_trip(clean_pro, filters):
+    bounds = Dataset(RAW_DAILY_COUNT, clean_pro.copy()).bounds
+    args = request_args(export_url(filters, COLUMNS, 'parquet', limit=10))
+    assert normalize_filters(export_filters(args, bounds)) == normalize_filters(filters)
+    assert args['columns'] == ','.join(COLUMNS) and args['limit'] == '10'
+
+    # sliders left out span the data, a slider given once is refused
+    assert export_filters(MultiDict(), bounds)['price'] == list(bounds['price'])
+    with pytest.raises(ValueError):
+        export_filters(MultiDict([('price', '1000')]), bounds)
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_export_round_trip(clean_pro, filters, fmt, monkeypatch):
+    # chunks small enough that they hold different categories and dtypes
+    monkeypatch.setattr(dataset_module, 'CHUNK_SIZE', 500)
+    dataset = Dataset(RAW_DAILY_COUNT, clean_pro.copy())
+    expected = dataset.take(filters, COLUMNS).reset_index(drop=True)
+    df = read_export(export_chunks(dataset.export(filters, COLUMNS, 10_000_000), COLUMNS, fmt), fmt)
+
+    assert list(df.columns) == COLUMNS
+    assert len(df) == len(expected)
+    np.testing.assert_array_equal(df['id'], expected['id'])
+    np.testing.assert_array_equal(df['brand'].astype(object), expected['brand'].astype(object))
+    np.testing.assert_allclose(df['price'], expected['price'].astype(np.float64), rtol=1e-6)
+    np.testing.assert_allclose(df['mileage'], expected['mileage'].astype(np.float64), rtol=1e-6)
+    assert list(df['scraped_date'].astype(str)) == list(expected['scraped_date'].astype(str))
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_empty_export_holds_the_columns(clean_pro, fmt):
+    dataset = Dataset(RAW_DAILY_COUNT, clean_pro.copy())
+    filters = export_filters(MultiDict([('brand', 'NO SUCH BRAND')]), dataset.bounds)
+    df = read_export(export_chunks(dataset.export(filters, COLUMNS, 100), COLUMNS, fmt), fmt)
+    assert list(df.columns) == COLUMNS and not len(df)
@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+import numpy as np
+
+from tests.conftest import refreshed
+from utilities.dataset import merge_rows
+from utilities.fair_price import PriceModel
+
+
+def next_day(df):
+    # A new scraped day, holding a model and a region the fit has not seen
+    last_day = df['scraped_date'].max()
+    new_rows = df[df['scraped_date'] == last_day].assign(scraped_date=last_day + timedelta(days=1))
+    new_rows.loc[new_rows.index[::7], 'model'] = 'NEW MODEL'
+    new_rows.loc[new_rows.index[::11], 'code_name'] = 'NEW REGION'
+    return new_rows
+
+
+def test_extend_matches_a_refit(clean_pro):
+    df = clean_pro
+    model = PriceModel(df)
+    for refresh in range(6):
+        new_rows = next_day(df) if refresh % 2 else refreshed(df, days=1 + refresh % 3)
+        df = merge_rows(df, new_rows)
+        model = model.extend(df, new_rows)
+        np.testing.assert_allclose(model.fair_price(df), PriceModel(df).fair_price(df), rtol=1e-9)
+    assert 'NEW MODEL' in model.levels['model']
+
+
+def test_extend_reaching_past_the_recent_days_refits(clean_pro):
+    model = PriceModel(clean_pro)
+    new_rows = refreshed(clean_pro, days=5)
+    df = merge_rows(clean_pro, new_rows)
+    extended = model.extend(df, new_rows)
+    np.testing.assert_allclose(extended.fair_price(df), PriceModel(df).fair_price(df), rtol=1e-9)
+    assert len(extended.recent) == 2
+
+
+def test_extend_replaces_a_reread_day_holding_no_fitted_row(clean_pro):
+    model = PriceModel(clean_pro)
+    new_rows = refreshed(clean_pro, days=2)
+    # the first re-read day only holds rows the fit leaves out
+    first_day = new_rows['scraped_date'].min()
+    new_rows.loc[new_rows['scraped_date'] == first_day, 'price'] = np.nan
+    df = merge_rows(clean_pro, new_rows)
+    extended = model.extend(df, new_rows)
+    np.testing.assert_allclose(extended.fair_price(df), PriceModel(df).fair_price(df), rtol=1e-9)
+
+    # a refresh holding no fitted row at all
+    new_rows = refreshed(df, days=1).assign(price=np.nan)
+    df = merge_rows(df, new_rows)
+    np.testing.assert_allclose(extended.extend(df, new_rows).fair_price(df), PriceModel(df).fair_price(df),
+                               rtol=1e-9)
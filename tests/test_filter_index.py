@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from tests.conftest import refreshed
+from utilities.dataset import Dataset
+from utilities.filter_index import FilterIndex, scan_mask
+from utilities.filter_store import normalize_filters
+
+RAW_DAILY_COUNT = pd.DataFrame({'scraped_date': [], 'source': [], 'url': []})
+
+
+def test_rows_match_the_full_scan(clean_pro, filters):
+    index = FilterIndex(clean_pro)
+    expected = np.flatnonzero(scan_mask(clean_pro, **filters).to_numpy())
+    np.testing.assert_array_equal(index.rows(**filters), expected)
+    np.testing.assert_array_equal(index.mask(**filters), scan_mask(clean_pro, **filters).to_numpy())
+
+
+def test_distinct_matches_the_selected_values(clean_pro, filters):
+    index = FilterIndex(clean_pro)
+    rows = index.rows(**filters)
+    for col in ['brand', 'category', 'model', 'code_name']:
+        np.testing.assert_array_equal(index.distinct(col, rows), np.sort(clean_pro[col].iloc[rows].unique()))
+
+
+def test_extend_matches_a_rebuild(clean_pro, filters):
+    dataset = Dataset(RAW_DAILY_COUNT, clean_pro.copy())
+    for _ in range(3):
+        dataset = dataset.extend(RAW_DAILY_COUNT, refreshed(dataset.df_clean_pro.drop(columns='deal_score')))
+    rebuilt = FilterIndex(dataset.df_clean_pro)
+    np.testing.assert_array_equal(dataset.filter_index.rows(**filters), rebuilt.rows(**filters))
+    assert dataset.bounds == rebuilt.bounds
+
+
+def test_repeated_models_select_each_row_once(clean_pro):
+    index = FilterIndex(clean_pro)
+    filters = dict(model=['MODEL 1', 'MODEL 21', 'MODEL 1'], engine_size=[0, 2000], circulation_year=[1980, 2030],
+                   price=[0, 1e6])
+    expected = np.flatnonzero(scan_mask(clean_pro, **filters).to_numpy())
+    np.testing.assert_array_equal(index.rows(**filters), expected)
+    # the same filter state with and without the repeat
+    assert normalize_filters(filters) == normalize_filters(dict(filters, model=['MODEL 21', 'MODEL 1']))
@@ -0,0 +1,52 @@
+import numpy as np
+
+from utilities.filter_index import FilterIndex, scan_mask
+from utilities.filter_store import FilterStore, filter_key
+
+
+class CountingIndex:
+    def __init__(self, df):
+        self.index = FilterIndex(df)
+        self.calls = 0
+
+    def rows(self, **filters):
+        self.calls += 1
+        return self.index.rows(**filters)
+
+
+def test_get_matches_the_full_scan(clean_pro, filters):
+    index = FilterIndex(clean_pro)
+    store = FilterStore(index.rows, index.bounds)
+    np.testing.assert_array_equal(store.get(filters), np.flatnonzero(scan_mask(clean_pro, **filters).to_numpy()))
+
+
+def test_equivalent_states_share_one_evaluation(clean_pro):
+    index = CountingIndex(clean_pro)
+    store = FilterStore(index.rows, index.index.bounds)
+    lo, hi = index.index.bounds['price']
+    states = [dict(model=['MODEL 1', 'MODEL 2'], price=[lo, hi], engine_size=[0, 2000], circulation_year=[1980, 2030]),
+              # model order, reversed sliders, sliders beyond the data range
+              dict(model=['MODEL 2', 'MODEL 1'], price=[hi, lo], engine_size=[2000, 0], circulation_year=[1970, 2040])]
+    assert filter_key(states[0], store.bounds) == filter_key(states[1], store.bounds)
+    first, second = store.get(states[0]), store.get(states[1])
+    assert index.calls == 1
+    assert first is second
+
+
+def test_evicts_past_max_entries_and_max_bytes(clean_pro):
+    index = CountingIndex(clean_pro)
+    store = FilterStore(index.rows, index.index.bounds, max_entries=3)
+    years = [[2000 + k, 2022] for k in range(5)]
+    for year in years:
+        store.get(dict(engine_size=[0, 2000], circulation_year=year, price=[0, 1e6]))
+    assert len(store.entries) == 3
+    assert store.n_bytes == sum(rows.nbytes for rows in store.entries.values())
+    # the oldest state was evicted and is evaluated again
+    store.get(dict(engine_size=[0, 2000], circulation_year=years[0], price=[0, 1e6]))
+    assert index.calls == 6
+
+    store = FilterStore(index.rows, index.index.bounds, max_bytes=1)
+    for year in years:
+        store.get(dict(engine_size=[0, 2000], circulation_year=year, price=[0, 1e6]))
+    # the latest entry is kept whatever its size
+    assert len(store.entries) == 1
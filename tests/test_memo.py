@@ -0,0 +1,84 @@
+import fakeredis
+import pytest
+from cachelib import RedisCache
+from dash.exceptions import PreventUpdate
+
+from utilities.memo import ByteLRUCache, FilterMemo, FilterSequencer
+from utilities.metrics import CallbackMetrics
+
+STATE = dict(brand='BRAND 1', engine_size=[0, 2000], circulation_year=[1980, 2030], price=[0, 1e6])
+
+
+@pytest.fixture
+def redis_caches():
+    # Two workers sharing one redis server
+    server = fakeredis.FakeServer()
+    return [RedisCache(host=fakeredis.FakeRedis(server=server), key_prefix='test:') for _ in range(2)]
+
+
+def memoized(cache, version, calls, sequencer=None):
+    metrics = CallbackMetrics()
+    memo = FilterMemo(cache, version=lambda: version[0], superseded=sequencer and sequencer.superseded,
+                      record=metrics.observe_cache)
+
+    @memo
+    def rows(filter_state, page):
+        calls.append(page)
+        return {'page': page, 'version': version[0]}
+
+    return metrics, rows
+
+
+def test_memo_is_shared_across_workers_until_the_version_changes(redis_caches):
+    version, calls = ['v1'], []
+    (metrics, rows), (other_metrics, other_rows) = [memoized(cache, version, calls) for cache in redis_caches]
+
+    assert rows(STATE, 0) == {'page': 0, 'version': 'v1'}
+    assert other_rows(dict(STATE, price=[1e6, 0]), 0) == {'page': 0, 'version': 'v1'}
+    assert other_rows(STATE, 1) == {'page': 1, 'version': 'v1'}
+    assert calls == [0, 1]
+    assert other_metrics.cache_stats() == {'rows': {'hits': 1, 'misses': 1, 'superseded': 0}}
+
+    version[0] = 'v2'
+    assert rows(STATE, 0) == {'page': 0, 'version': 'v2'}
+    assert calls == [0, 1, 0]
+    assert metrics.cache_stats() == {'rows': {'hits': 0, 'misses': 2, 'superseded': 0}}
+
+
+def test_superseded_states_are_dropped_in_every_worker(redis_caches):
+    version, calls = ['v1'], []
+    sequencers = [FilterSequencer(cache) for cache in redis_caches]
+    (metrics, rows), (other_metrics, other_rows) = [memoized(cache, version, calls, sequencer)
+                                                    for cache, sequencer in zip(redis_caches, sequencers)]
+
+    first = sequencers[0].publish(STATE, 'session-1')
+    latest = sequencers[1].publish(dict(STATE, brand='BRAND 2'), 'session-1')
+    other_session = sequencers[1].publish(STATE, 'session-2')
+    assert sequencers[1].superseded(first)
+    assert not sequencers[0].superseded(latest)
+
+    with pytest.raises(PreventUpdate):
+        other_rows(first, 0)
+    rows(latest, 0)
+    rows(other_session, 0)
+    assert calls == [0, 0]
+    assert other_metrics.cache_stats() == {'rows': {'hits': 0, 'misses': 0, 'superseded': 1}}
+
+
+def test_byte_lru_cache_stays_within_max_bytes():
+    cache = ByteLRUCache(max_bytes=4000)
+    for k in range(10):
+        assert cache.set(f'key-{k}', b'x' * 900)
+        assert cache.n_bytes <= cache.max_bytes
+    assert cache.n_bytes == sum(len(value) for _, value in cache.entries.values())
+    # the least recently used entries went first
+    assert list(cache.entries) == [f'key-{k}' for k in range(6, 10)]
+
+    cache.get('key-6')
+    cache.set('key-10', b'x' * 900)
+    assert cache.has('key-6') and not cache.has('key-7')
+
+    # a value larger than the whole cache is not stored, and does not evict the others
+    assert not cache.set('big', b'x' * 5000)
+    assert cache.get('big') is None
+    assert len(cache.entries) == 4
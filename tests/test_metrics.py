@@ -0,0 +1,49 @@
+import json
+import subprocess
+import sys
+
+from prometheus_client.parser import text_string_to_metric_families
+
+WORKER = '''
+import json
+import sys
+from utilities.metrics import CallbackMetrics
+
+metrics = CallbackMetrics()
+callback = metrics.dispatched(metrics.timed(lambda n: 'x' * n), 'update_rows')
+for n in range(int(sys.argv[1])):
+    callback(1000)
+    metrics.observe_cache('update_rows', 'hit' if n % 2 else 'miss')
+if len(sys.argv) > 2:
+    print(metrics.render().decode())
+    print(json.dumps(metrics.cache_stats()), file=sys.stderr)
+'''
+
+
+def samples(text, name):
+    return {tuple(sorted(sample.labels.items())): sample.value
+            for family in text_string_to_metric_families(text) for sample in family.samples if sample.name == name}
+
+
+def run(calls, render=False, env=None):
+    # Each call is a separate process, as gunicorn workers are; the cache stats come on stderr
+    args = [sys.executable, '-c', WORKER, str(calls)] + (['render'] if render else [])
+    return subprocess.run(args, env=env, check=True, capture_output=True, text=True)
+
+
+def test_single_process_renders_its_own_calls(monkeypatch):
+    monkeypatch.delenv('PROMETHEUS_MULTIPROC_DIR', raising=False)
+    text = run(3, render=True).stdout
+    assert samples(text, 'dash_callback_response_bytes_count') == {(('callback', 'update_rows'),): 3}
+
+
+def test_workers_are_added_up_in_multiprocess_mode(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+    run(2)
+    run(3)
+    result = run(4, render=True)
+    text = result.stdout
+    assert samples(text, 'dash_callback_response_bytes_count') == {(('callback', 'update_rows'),): 9}
+    assert samples(text, 'dash_callback_seconds_count')[(('callback', 'update_rows'), ('phase', 'total'))] == 9
+    # the even calls of each worker miss, the odd ones hit
+    assert json.loads(result.stderr) == {'update_rows': {'hits': 4, 'misses': 5, 'superseded': 0}}
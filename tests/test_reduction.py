@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from utilities.dataset import Dataset
+from utilities.filter_index import scan_mask
+from utilities.reduction import SCATTER_POINT_BUDGET, histogram, stratified_sample
+from tests.test_filter_index import RAW_DAILY_COUNT
+
+
+def kept_per_group(df, sample, group_col):
+    sizes = df[group_col].value_counts(dropna=False)
+    return sizes, sample[group_col].value_counts(dropna=False).reindex(sizes.index, fill_value=0)
+
+
+def test_each_group_keeps_its_share(clean_pro):
+    budget = 2_000
+    sample = stratified_sample(clean_pro, 'brand', budget)
+    sizes, kept = kept_per_group(clean_pro, sample, 'brand')
+    assert len(sample) <= budget
+    assert (kept >= 1).all() and (kept <= sizes).all()
+    # the row every group is given first moves each share by less than a row per group
+    share = sizes * budget / len(clean_pro)
+    assert (np.abs(kept - share) <= 1 + len(sizes) * sizes / len(clean_pro)).all()
+    assert len(sample) > budget - len(sizes)
+
+
+def test_small_groups_keep_a_row_within_the_budget(clean_pro):
+    # a quarter of the rows each get a model of their own, more groups than the smaller budgets have rows
+    one_off = 'ONE OFF ' + clean_pro['id'].astype(str)
+    df = clean_pro.assign(model=clean_pro['model'].where(clean_pro.index % 4 > 0, one_off))
+    for budget in [100, 2_000, 5_000, 10_000]:
+        sample = stratified_sample(df, 'model', budget)
+        assert budget - df['model'].nunique(dropna=False) <= len(sample) <= budget
+        if df['model'].nunique(dropna=False) < budget:
+            sizes, kept = kept_per_group(df, sample, 'model')
+            assert (kept >= 1).all()
+
+
+def test_sample_is_deterministic_and_uniform_without_groups(clean_pro):
+    sample = stratified_sample(clean_pro, 'brand', 1_000)
+    pd.testing.assert_frame_equal(sample, stratified_sample(clean_pro, 'brand', 1_000))
+    sample = stratified_sample(clean_pro, None, 1_000)
+    assert len(sample) == 1_000
+    pd.testing.assert_frame_equal(sample, stratified_sample(clean_pro.copy(), None, 1_000))
+    assert stratified_sample(clean_pro, 'brand', len(clean_pro)) is clean_pro
+
+
+def test_scatter_sample_stays_within_the_budget(clean_pro, filters):
+    # clean_pro holds SCATTER_POINT_BUDGET rows, a quarter of it is the budget that samples them
+    budget = SCATTER_POINT_BUDGET // 4
+    dataset = Dataset(RAW_DAILY_COUNT, clean_pro.copy())
+    for group_col in ['brand', 'category', 'model', None]:
+        df_sample, n_filtered = dataset.sample(filters, ['id', 'price', 'brand', 'category', 'model'], group_col,
+                                               budget)
+        assert len(df_sample) <= budget
+        assert n_filtered == int(scan_mask(clean_pro, **filters).sum())
+
+
+def test_histogram_matches_numpy(clean_pro):
+    for column in ['price', 'mileage', 'engine_size', 'bike_age']:
+        values = clean_pro[column].to_numpy(dtype=np.float64)
+        counts, edges = np.histogram(values[~np.isnan(values)], bins=50)
+        for given in [values, values.astype(np.float32), clean_pro[column]]:
+            centers, result, widths = histogram(given, bins=50)
+            np.testing.assert_array_equal(result, counts)
+            np.testing.assert_allclose(centers - widths / 2, edges[:-1], rtol=1e-6)
+            np.testing.assert_allclose(centers + widths / 2, edges[1:], rtol=1e-6)
+        assert result.sum() == clean_pro[column].notna().sum()
+
+    centers, counts, widths = histogram([np.nan, np.inf])
+    assert len(centers) == len(counts) == len(widths) == 0
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from tests.test_data import scrape
+from tests.test_engines import ENGINES
+from utilities import data
+from utilities.dataset import load_dataset
+from utilities.refresh import DataRefresher
+
+LOADERS = {'memory': load_dataset, **ENGINES}
+
+
+@pytest.fixture(params=list(LOADERS))
+def load(request, database):
+    return LOADERS[request.param]
+
+
+def n_rows():
+    return int(pd.read_sql('SELECT COUNT(*) AS n FROM master_clean_pro', data.get_engine())['n'].iloc[0])
+
+
+def test_new_day_is_swapped_in(load):
+    dataset = load()
+    swaps = []
+    refresher = DataRefresher(dataset, interval=0, on_swap=swaps.append)
+    scrape(days=1)
+
+    stats = refresher.refresh()
+    assert stats['swapped'] and refresher.dataset is not dataset
+    assert swaps == [refresher.dataset]
+    assert stats['clean_pro_rows'] == refresher.dataset.n_rows == n_rows()
+    last_days = [ds.max_scraped_date['master_clean_pro'] for ds in (dataset, refresher.dataset)]
+    assert (last_days[1] - last_days[0]).days == 1
+    # what /refresh-status serves
+    assert stats['version'] == refresher.dataset.version != dataset.version
+    assert list(refresher.history) == [stats]
+
+    fresh = load()
+    assert refresher.dataset.version == fresh.version
+    unfiltered = {col: list(bounds) for col, bounds in fresh.bounds.items()}
+    assert refresher.dataset.select(unfiltered) == fresh.select(unfiltered)
+
+    # nothing scraped since: the dataset is kept
+    swapped = refresher.dataset
+    stats = refresher.refresh()
+    assert not stats['swapped'] and refresher.dataset is swapped
+    assert swaps == [swapped]
+    assert len(refresher.history) == 2
+
+
+def test_current_data_is_not_swapped(load):
+    dataset = load()
+    swaps = []
+    refresher = DataRefresher(dataset, interval=0, on_swap=swaps.append)
+    for _ in range(2):
+        stats = refresher.refresh()
+        assert not stats['swapped'] and 'build_ms' not in stats
+        assert stats['version'] == dataset.version
+    assert refresher.dataset is dataset and swaps == []
+    assert [entry['swapped'] for entry in refresher.history] == [False, False]
@@ -0,0 +1,114 @@
+import json
+import math
+import re
+from datetime import date
+
+import numpy as np
+import orjson
+import pandas as pd
+import plotly.express as px
+import plotly.figure_factory as ff
+import plotly.graph_objs as go
+import plotly.io as pio
+import pytest
+from dash import html
+from plotly.subplots import make_subplots
+
+from utilities.dataset import load_dataset
+from utilities.responses import to_json, use_orjson
+
+DATETIME = re.compile(r'\d{4}-\d{2}-\d{2}([T ][\d:.]+)?$')
+
+
+def same(value, expected):
+    # Decoded JSON values, equal up to how a date is written and to float32 digits
+    if isinstance(expected, dict):
+        return isinstance(value, dict) and value.keys() == expected.keys() and all(
+            same(value[key], expected[key]) for key in expected)
+    if isinstance(expected, list):
+        return isinstance(value, list) and len(value) == len(expected) and all(map(same, value, expected))
+    if expected == 'NaT':
+        # plotly writes a missing datetime64 as a string the browser does not read as a date, to_json as null
+        return value is None
+    if isinstance(expected, str) and isinstance(value, str) and DATETIME.match(expected):
+        return pd.Timestamp(value) == pd.Timestamp(expected)
+    if isinstance(expected, float) and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return math.isclose(value, expected, rel_tol=1e-7)
+    return value == expected
+
+
+def assert_same_as_plotly(value):
+    assert same(json.loads(to_json(value)), json.loads(pio.json.to_json_plotly(value, engine='json')))
+
+
+@pytest.fixture
+def dataset(database):
+    return load_dataset()
+
+
+def callback_outputs(ds):
+    # What the app's callbacks return, built as they build it
+    filters = {col: list(bounds) for col, bounds in ds.bounds.items()}
+    daily_price = ds.daily_mean(filters, window=30)
+    days = daily_price['scraped_date'].to_numpy()
+    yield 'daily price', [{'x': days, 'y': daily_price['price'].to_numpy()},
+                          {'x': days, 'y': daily_price['SMA30'].to_numpy()}]
+    yield 'histograms', [dict(zip(['x', 'y', 'width'], ds.histogram(filters, col, bins=50)))
+                         for col in ['price', 'bike_age', 'mileage', 'engine_size']]
+    counts = ds.value_counts(filters, 'brand')
+    yield 'value counts', [{'x': counts.index, 'y': counts.to_numpy()}]
+
+    counts = ds.df_raw_daily_count.pivot(index='scraped_date', columns='source', values='url')
+    fig = make_subplots(rows=len(counts.columns), cols=1, subplot_titles=tuple(counts.columns))
+    for k, source in enumerate(counts.columns, start=1):
+        fig.add_trace(go.Bar(x=counts[source].dropna().index, y=counts[source].dropna().to_numpy()), row=k, col=1)
+    fig.update_xaxes(range=[counts.index.min(), counts.index.max()])
+    yield 'spiders figure', fig
+
+    df_corr = ds.correlation_matrix(filters)
+    df_corr = df_corr[np.triu(np.ones_like(df_corr, dtype=bool))]
+    yield 'correlation figure', ff.create_annotated_heatmap(
+        np.array(df_corr), x=list(df_corr.columns), y=list(df_corr.index),
+        annotation_text=np.around(np.array(df_corr), decimals=2))
+
+    df_sample, n_filtered = ds.sample(filters, ['id', 'mileage', 'bike_age', 'price', 'model', 'brand'], 'brand', 500)
+    fig = px.scatter_3d(df_sample.assign(brand=df_sample['brand'].astype(object)), x='mileage', y='bike_age',
+                        z='price', hover_name='model', custom_data=['id'], color='brand', log_x=True)
+    yield 'scatter figure', (fig, f'Showing {len(df_sample):,} of {n_filtered:,} listings')
+
+    sort_by = [{'column_id': 'price', 'direction': 'desc'}]
+    df_page, page_current, page_count = ds.page(filters, sort_by, None, 0, 50)
+    yield 'datatable page', (df_page.to_dict('records'), page_current, page_count)
+
+
+def test_callback_outputs_decode_as_with_plotly(dataset):
+    use_orjson()
+    for name, value in callback_outputs(dataset):
+        assert same(json.loads(to_json(value)), json.loads(pio.json.to_json_plotly(value, engine='json'))), name
+
+
+def test_values_decode_as_with_plotly():
+    assert_same_as_plotly({
+        'datetime64': np.array(['2021-11-01', '2021-11-02T10:30'], dtype='datetime64[ns]'),
+        'datetime64 days': np.array(['2021-11-01', 'NaT'], dtype='datetime64[D]'),
+        'dates': [date(2021, 11, 1), pd.Timestamp('2021-11-02 10:30'), pd.NaT],
+        'date objects': np.array([date(2021, 11, 1), None], dtype=object),
+        'nan': [np.nan, np.float32('nan'), np.array([1.5, np.nan]), pd.Series([np.nan, 2.0])],
+        'numbers': [np.int64(3), np.float32(0.1), np.array([0.1], dtype=np.float32), np.arange(10)[::2]],
+        'categorical index': pd.CategoricalIndex(['BRAND 1', 'BRAND 2']),
+        'datetime index': pd.DatetimeIndex(['2021-11-01', None]),
+        'datetime64 in a figure': go.Figure(go.Scatter(x=np.array(['2021-11-01', 'NaT'], dtype='datetime64[ns]'))),
+        'strided datetime64': np.array(['2021-11-01', 'NaT', 'NaT', '2021-11-02'], dtype='datetime64[s]')[::2],
+        'component': html.Div(['text', html.Span('child')], id='div'),
+    })
+
+
+def test_values_orjson_rejects_fall_back_to_plotly():
+    value = {'wide integer': 2 ** 70}
+    with pytest.raises(TypeError):
+        orjson.dumps(value)
+    use_orjson()
+    assert to_json(value) == pio.json.to_json_plotly(value, engine='json')
+
+    with pytest.raises(TypeError):
+        to_json({'object': object()})
@@ -0,0 +1,22 @@
+import numpy as np
+
+from tests.conftest import refreshed
+from utilities.dataset import merge_rows
+from utilities.similar import SIMILAR_K, SimilarIndex, similar_rows
+
+
+def test_extend_matches_a_rebuild(clean_pro):
+    df = clean_pro
+    index = SimilarIndex(df)
+    for refresh in range(10):
+        new_rows = refreshed(df, days=1 + refresh % 3)
+        df = merge_rows(df, new_rows)
+        index = index.extend(df, new_rows)
+    assert max(len(segments) for segments in index.groups.values()) > 1
+
+    # scale is fixed at the first load, a rebuild keeps it
+    rebuilt = SimilarIndex(df, scale=index.scale)
+    for listing_id in df['id'].to_numpy()[similar_rows(df)][::500]:
+        expected, value = rebuilt.similar(df, listing_id, SIMILAR_K), index.similar(df, listing_id, SIMILAR_K)
+        np.testing.assert_allclose(value['distance'], expected['distance'])
+        assert list(value['id']) == list(expected['id'])
@@ -1,2 +1,50 @@
+import pandas as pd
+
+
 def running_sum(df_daily_count, date):
-  return df_daily_count[df_daily_count.scraped_date <= date].url.sum()
\ No newline at end of file
+    # Cumulated count up to `date`, one full pass per call. Kept as the reference for cumulative_count.
+    return df_daily_count[df_daily_count.scraped_date <= date].url.sum()
+
+
+def daily_count(df, by=None):
+    # Rows per scraped_date (and per `by` column), in the `url` column as the figures expect
+    keys = ['scraped_date'] if by is None else ['scraped_date', by]
+    return df[keys + ['url']].groupby(by=keys, axis=0, as_index=False, observed=True, sort=True).count()
+
+
+def cumulative_count(df_daily_count):
+    df_daily_count = df_daily_count.sort_values('scraped_date', ignore_index=True)
+    df_daily_count['cumul_count'] = df_daily_count['url'].cumsum()
+    return df_daily_count
+
+
+def daily_mean(df, column='price', window=30):
+    # Daily mean of `column` and its moving average over `window` days, with the sum and count it comes from
+    df_daily = df[['scraped_date', column]].groupby(by=['scraped_date'], axis=0, sort=True)[column] \
+        .agg(['sum', 'count']).reset_index()
+    df_daily[column] = df_daily['sum'] / df_daily['count']
+    df_daily[f'SMA{window}'] = df_daily[column].rolling(window).mean()
+    return df_daily
+
+
+def replace_days(df_daily, df_new_daily):
+    # New daily rows replace every day from their first scraped_date on, as in Dataset.extend
+    if not len(df_new_daily):
+        return df_daily, len(df_daily)
+    kept = df_daily[df_daily['scraped_date'] < df_new_daily['scraped_date'].min()]
+    return pd.concat([kept, df_new_daily], ignore_index=True), len(kept)
+
+
+def extend_daily_count(df_daily_count, new_rows, by=None):
+    df_new_daily = daily_count(new_rows, by=by)
+    if by is not None:
+        return replace_days(df_daily_count, df_new_daily)[0]
+
+    df_daily_count, n_kept = replace_days(df_daily_count, df_new_daily)
+    if 'cumul_count' in df_daily_count.columns:
+        # only the new days need a cumulated count, starting from the last kept one
+        base = df_daily_count['cumul_count'].iloc[n_kept - 1] if n_kept else 0
+        df_daily_count.loc[n_kept:, 'cumul_count'] = base + df_daily_count['url'].iloc[n_kept:].cumsum()
+        df_daily_count['cumul_count'] = df_daily_count['cumul_count'].astype('int64')
+    return df_daily_count
+
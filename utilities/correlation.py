@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+
+# deal_score is refitted over every row on each refresh, per-day statistics of it would not stay current
+CORRELATION_EXCLUDED = ['circulation_year', 'deal_score']
+
+
+def correlation_columns(df):
+    # Columns of the correlation matrix, as df.drop(columns=['circulation_year']).corr() picked them: numbers
+    # and bools, the bools correlated as 0/1
+    return [col for col in df.select_dtypes(['number', 'bool']).columns if col not in CORRELATION_EXCLUDED]
+
+
+def moments(values, valid):
+    """
+    Sufficient statistics of a pairwise-complete Pearson correlation, all additive over rows.
+
+    values: (rows, columns) float array with nulls set to 0, valid: matching 0/1 array. For a column pair
+    (i, j), every statistic only counts the rows where both i and j are set.
+    """
+    return np.stack([valid.T @ valid,              # n
+                     values.T @ valid,             # sum of x_i
+                     (values * values).T @ valid,  # sum of x_i ** 2
+                     values.T @ values])           # sum of x_i * x_j
+
+
+def correlation_from_moments(stats):
+    n, sx, sxx, sxy = stats
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = n * sxy - sx * sx.T
+        var = n * sxx - sx * sx
+        corr = cov / np.sqrt(var * var.T)
+    return np.clip(corr, -1, 1)
+
+
+class CorrelationStats:
+    """
+    Correlation matrix of the numeric columns of df_clean_pro, answered from sufficient statistics.
+
+    The statistics are kept per scraped_date so a refresh only replaces the days it re-reads, the full
+    matrix adds up the days, and a filter selection computes the statistics of its rows in one pass
+    instead of a DataFrame.corr(). Values are shifted by a per-column constant, fixed at the first load,
+    to keep the sums of squares well conditioned.
+    """
+
+    def __init__(self, df, columns=None, shift=None, days=None, daily=None):
+        self.columns = columns if columns is not None else correlation_columns(df)
+        values = df[self.columns].to_numpy(dtype=np.float64)
+        if shift is None:
+            shift = np.nan_to_num(np.nanmedian(values, axis=0)) if len(values) else np.zeros(len(self.columns))
+        self.shift = shift
+        self.valid = ~np.isnan(values)
+        self.values = np.where(self.valid, values - shift, 0)
+
+        if daily is None:
+            days, daily = self._daily_moments(df)
+        self.days = days
+        self.daily = daily
+        self.total = daily.sum(axis=0)
+
+    def _daily_moments(self, df):
+        day_codes, days = pd.factorize(df['scraped_date'].to_numpy(), sort=True)
+        order = np.argsort(day_codes, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(day_codes, minlength=len(days)))])
+        valid = self.valid.astype(np.float64)
+        daily = np.zeros((len(days), 4, len(self.columns), len(self.columns)))
+        for k in range(len(days)):
+            rows = order[offsets[k]:offsets[k + 1]]
+            daily[k] = moments(self.values[rows], valid[rows])
+        return np.asarray(days), daily
+
+    def extend(self, df, new_rows):
+        # df and new_rows as in utilities.dataset.merge_rows
+        new = CorrelationStats(new_rows, self.columns, self.shift)
+        if not len(new.days):
+            return CorrelationStats(df, self.columns, self.shift, self.days, self.daily)
+        kept = self.days < new.days.min()
+        days = np.concatenate([self.days[kept], new.days])
+        daily = np.concatenate([self.daily[kept], new.daily])
+        return CorrelationStats(df, self.columns, self.shift, days, daily)
+
+    def matrix(self, rows=None):
+        # Correlation over every row, or over the row positions of a filter selection
+        if rows is None:
+            stats = self.total
+        else:
+            stats = moments(self.values[rows], self.valid[rows].astype(np.float64))
+        return pd.DataFrame(correlation_from_moments(stats), index=self.columns, columns=self.columns)
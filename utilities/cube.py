@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+from utilities.filter_index import CATEGORICAL_COLUMNS, NUMERIC_COLUMNS, selected_values
+
+# Bin width of each numeric filter dimension in the cube
+BIN_WIDTHS = {'engine_size': 50, 'circulation_year': 1, 'price': 250}
+
+
+class PriceCube:
+    """
+    Price sum and count per (scraped_date, brand, category, model, code_name, engine_size bin,
+    circulation_year bin, price bin), built from the rows indexed by a FilterIndex.
+
+    A filter state is answered by adding the cells whose bins lie entirely inside the slider ranges. Rows
+    of bins cut by a slider bound are read from the filter index instead, one narrow range per cut bin,
+    so the result is exactly the daily mean of the filtered rows. Dropdown selections matching fewer rows
+    than there are cells skip the cube and add up their rows.
+    """
+
+    def __init__(self, df, filter_index):
+        self.filter_index = filter_index
+        rows = filter_index.valid_rows
+
+        day_codes, self.days = pd.factorize(df['scraped_date'].to_numpy()[rows], sort=True)
+        self.day_codes = np.full(filter_index.n_rows, -1, dtype=np.int32)
+        self.day_codes[rows] = day_codes
+        self.values = df['price'].to_numpy(dtype=np.float64)
+
+        keys = {'day': day_codes}
+        for col in CATEGORICAL_COLUMNS:
+            keys[col] = filter_index.codes[col][rows]
+
+        self.bin_min = {}
+        self.bin_max = {}
+        self.origins = {}
+        for col in NUMERIC_COLUMNS:
+            values = filter_index.values[col][rows]
+            self.origins[col] = values.min() if len(values) else 0
+            bins = np.floor((values - self.origins[col]) / BIN_WIDTHS[col]).astype(np.int32)
+            n_bins = bins.max() + 1 if len(bins) else 0
+            # observed bounds of each bin, empty bins can never be cut by a slider
+            self.bin_min[col] = np.full(n_bins, np.inf)
+            self.bin_max[col] = np.full(n_bins, -np.inf)
+            np.minimum.at(self.bin_min[col], bins, values)
+            np.maximum.at(self.bin_max[col], bins, values)
+            keys[col] = bins
+
+        keys['sum'] = self.values[rows]
+        cells = pd.DataFrame(keys).groupby(['day'] + CATEGORICAL_COLUMNS + NUMERIC_COLUMNS, sort=False)['sum'] \
+            .agg(['sum', 'count']).reset_index()
+        self.cells = {col: cells[col].to_numpy() for col in cells.columns}
+        self.n_cells = len(cells)
+
+    def classify_bins(self, col, value_range):
+        lo, hi = min(value_range), max(value_range)
+        bin_min, bin_max = self.bin_min[col], self.bin_max[col]
+        inside = (bin_min >= lo) & (bin_max <= hi)
+        cut = ~inside & (bin_max >= lo) & (bin_min <= hi)
+        # narrow ranges holding the filtered rows of each cut bin
+        cut_ranges = [[max(lo, bin_min[b]), min(hi, bin_max[b])] for b in np.flatnonzero(cut)]
+        return inside, cut_ranges
+
+    def daily_sum_count(self, brand=None, category=None, model=None, engine_size=None,
+                        circulation_year=None, price=None, localisation=None):
+        filters = dict(brand=brand, category=category, model=model, engine_size=engine_size,
+                       circulation_year=circulation_year, price=price, localisation=localisation)
+        categorical = selected_values(brand=brand, category=category, model=model, localisation=localisation)
+
+        n_days = len(self.days)
+        # Selective dropdowns leave fewer rows than cube cells to add up, read those rows directly
+        estimate = min([sum(len(self.filter_index.postings[col].get(v, ())) for v in values)
+                        for col, values in categorical.items() if values is not None], default=self.n_cells)
+        if estimate * 4 < self.n_cells:
+            rows = self.filter_index.rows(**filters)
+            return (np.bincount(self.day_codes[rows], weights=self.values[rows], minlength=n_days),
+                    np.bincount(self.day_codes[rows], minlength=n_days))
+
+        keep = np.ones(self.n_cells, dtype=bool)
+        for col, values in categorical.items():
+            if values is not None:
+                codes = [self.filter_index.uniques[col][v] for v in values if v in self.filter_index.uniques[col]]
+                keep &= np.isin(self.cells[col], codes)
+
+        cut_rows = []
+        for col in NUMERIC_COLUMNS:
+            inside, cut_ranges = self.classify_bins(col, filters[col])
+            keep &= inside[self.cells[col]]
+            for cut_range in cut_ranges:
+                cut_rows.append(self.filter_index.rows(**{**filters, col: cut_range}))
+
+        sums = np.bincount(self.cells['day'][keep], weights=self.cells['sum'][keep], minlength=n_days)
+        counts = np.bincount(self.cells['day'][keep], weights=self.cells['count'][keep], minlength=n_days)
+
+        if cut_rows:
+            # a row can sit in cut bins of several dimensions, count it once
+            rows = np.unique(np.concatenate(cut_rows))
+            sums += np.bincount(self.day_codes[rows], weights=self.values[rows], minlength=n_days)
+            counts += np.bincount(self.day_codes[rows], minlength=n_days)
+
+        return sums, counts
+
+    def daily_mean(self, window=30, **filters):
+        # Same frame as utilities.calculation.daily_mean on the filtered rows
+        sums, counts = self.daily_sum_count(**filters)
+        days = counts > 0
+        df_daily = pd.DataFrame({'scraped_date': self.days[days], 'sum': sums[days], 'count': counts[days]})
+        df_daily['price'] = df_daily['sum'] / df_daily['count']
+        df_daily[f'SMA{window}'] = df_daily['price'].rolling(window).mean()
+        return df_daily
@@ -1,13 +1,28 @@
 import pandas as pd
 from dotenv import load_dotenv
+import argparse
 import os
+import time
+from datetime import timedelta
 import pandas.io.sql as psql
-from sqlalchemy import create_engine
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+from sqlalchemy import create_engine, text
 
+from utilities.dtypes import memory_report, memory_usage, optimize_column, optimize_dtypes
 
-def load_credentials():
-    load_dotenv()  # take environment variables from .env.
+load_dotenv()  # take environment variables from .env.
+
+# Local columnar copies of the tables, empty to always read from the database
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', 'snapshots')
+# Rows fetched per round trip when streaming a table
+CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', 50000))
+
+_engine = None
 
+
+def load_credentials():
     # Database settings
     username = os.environ.get('POSTGRES_USERNAME')
     password = os.environ.get('POSTGRES_PASSWORD')
@@ -22,20 +37,160 @@ def load_credentials():
             'database': database}
 
 
+def database_url():
+    # DATABASE_URL points the app at any SQLAlchemy database (a local SQLite or Postgres stand-in)
+    if os.environ.get('DATABASE_URL'):
+        return os.environ['DATABASE_URL']
+    env = load_credentials()
+    return f"postgresql://{env['username']}:{env['password']}@{env['hostname']}:{env['port']}/{env['database']}"
+
+
+def get_engine():
+    # One pooled engine per process, connections are reused across get_table calls
+    global _engine
+    if _engine is None:
+        _engine = create_engine(database_url(), pool_pre_ping=True)
+    return _engine
+
+
+def dispose_engine():
+    # Called in a forked worker: the pool inherited from the master is dropped without closing its
+    # connections, which the master's refresh thread keeps using, the worker opens its own on first use
+    if _engine is not None:
+        _engine.dispose(close=False)
+
+
+def concat_tables(frames):
+    # pd.concat falls back to object when categoricals have different categories, align them first
+    for col in frames[0].columns:
+        if all(col in df.columns and df[col].dtype.name == 'category' for df in frames):
+            categories = union_categoricals([df[col] for df in frames], sort_categories=True).categories
+            frames = [df.assign(**{col: df[col].cat.set_categories(categories)}) for df in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
 def get_table(table, max_scraped_date=None, verbose=True):
     if verbose:
         print(f'Importing {table} data from postgres db')
 
-    env = load_credentials()
-    engine = create_engine(
-        f"postgresql://{env['username']}:{env['password']}@{env['hostname']}:{env['port']}/{env['database']}")
     # sql_query = f"SELECT * FROM {table} ORDER BY scraped_date DESC LIMIT 1000"
     if max_scraped_date is not None:
-        max_scraped_date = f"'{max_scraped_date}'"
-        sql_query = f"SELECT * FROM {table} WHERE scraped_date > {max_scraped_date}"
+        sql_query = text(f"SELECT * FROM {table} WHERE scraped_date > :max_scraped_date")
+        params = {'max_scraped_date': max_scraped_date}
     else:
-        sql_query = f"SELECT * FROM {table}"
-    df = psql.read_sql(sql_query, engine)
-    engine.dispose()
+        sql_query = text(f"SELECT * FROM {table}")
+        params = {}
+
+    # Server-side cursor: rows arrive CHUNK_SIZE at a time and each chunk is shrunk (see utilities.dtypes)
+    # before the next one
+    chunks = []
+    before, after = 0, 0
+    with get_engine().connect().execution_options(stream_results=True) as connection:
+        for chunk in psql.read_sql(sql_query, connection, params=params, chunksize=CHUNK_SIZE):
+            if verbose:
+                before = before + memory_usage(chunk)
+            chunk = optimize_dtypes(chunk, table)
+            if verbose:
+                after = after + memory_usage(chunk)
+            chunks.append(chunk)
+    if not chunks:
+        return psql.read_sql(text(f"SELECT * FROM {table} WHERE 1 = 0"), get_engine())
+
+    df = concat_tables(chunks)
+    if verbose:
+        print(memory_report(before, after, df.dtypes).to_string())
+    return df
+
 
+def get_daily_count(table, by=None, max_scraped_date=None):
+    # Rows per scraped_date (and per `by` column) counted by the database, shaped as calculation.daily_count
+    keys = 'scraped_date' if by is None else f'scraped_date, {by}'
+    where = '' if max_scraped_date is None else 'WHERE scraped_date > :max_scraped_date'
+    sql_query = text(f"SELECT {keys}, COUNT(url) AS url FROM {table} {where} GROUP BY {keys} ORDER BY {keys}")
+    params = {} if max_scraped_date is None else {'max_scraped_date': max_scraped_date}
+    df = psql.read_sql(sql_query, get_engine(), params=params)
+    df['scraped_date'] = optimize_column(df['scraped_date'], 'date')
+    df['url'] = df['url'].astype('int64')
     return df
+
+
+def snapshot_path(table):
+    return os.path.join(SNAPSHOT_DIR, f'{table}.parquet')
+
+
+def load_snapshot(table):
+    # Returns the snapshot, the last scraped_date it holds and the date it holds rows after (None when it holds
+    # the whole table), (None, None, None) when there is none
+    path = snapshot_path(table)
+    if not SNAPSHOT_DIR or not os.path.exists(path):
+        return None, None, None
+    # memory_map only saves the read buffer, to_pandas still copies every column into the DataFrame
+    arrow_table = pq.read_table(path, memory_map=True)
+    metadata = arrow_table.schema.metadata or {}
+    if b'watermark' not in metadata:
+        return None, None, None
+    watermark = pd.Timestamp(metadata[b'watermark'].decode()).date()
+    since = pd.Timestamp(metadata[b'since'].decode()).date() if b'since' in metadata else None
+    return optimize_dtypes(arrow_table.to_pandas(), table), watermark, since
+
+
+def save_snapshot(table, df, since=None):
+    # `since` records that the snapshot only holds the rows scraped after that date
+    if not SNAPSHOT_DIR or not len(df):
+        return
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(arrow_table.schema.metadata or {})
+    metadata[b'watermark'] = str(df['scraped_date'].max()).encode()
+    if since is not None:
+        metadata[b'since'] = str(since).encode()
+    arrow_table = arrow_table.replace_schema_metadata(metadata)
+
+    # write aside then rename, so a reader never sees a partial file
+    path = snapshot_path(table)
+    pq.write_table(arrow_table, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def get_table_cached(table, max_scraped_date=None, verbose=True):
+    # Same result as get_table, read from the local snapshot plus the rows scraped since it was written.
+    # The snapshot keeps every row it was built with, the max_scraped_date filter only applies to the result.
+    if max_scraped_date is not None:
+        max_scraped_date = pd.Timestamp(max_scraped_date).date()
+    df, watermark, since = load_snapshot(table)
+    if df is not None and since is not None and (max_scraped_date is None or max_scraped_date < since):
+        # a partial snapshot (see --since) misses rows this read needs, it is refilled from the database
+        df = None
+    if df is None:
+        df = get_table(table, max_scraped_date=max_scraped_date, verbose=verbose)
+        save_snapshot(table, df, since=max_scraped_date)
+        return df
+
+    if verbose:
+        print(f'Importing {table} data from snapshot, delta since {watermark} from db')
+    # the last snapshot day is read again, it may have been scraped in several batches
+    delta = get_table(table, max_scraped_date=watermark - timedelta(days=1), verbose=False)
+    if len(delta):
+        df = concat_tables([df[df['scraped_date'] < delta['scraped_date'].min()], delta])
+    if len(delta) and delta['scraped_date'].max() > watermark:
+        save_snapshot(table, df, since=since)
+    if max_scraped_date is not None:
+        df = df[df['scraped_date'] > max_scraped_date].reset_index(drop=True)
+
+    return df
+
+
+def rebuild_snapshots(tables, max_scraped_date=None):
+    for table in tables:
+        start = time.perf_counter()
+        df = get_table(table, max_scraped_date=max_scraped_date)
+        save_snapshot(table, df, since=max_scraped_date)
+        print(f'{table}: {len(df)} rows written to {snapshot_path(table)} in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild the local table snapshots from the database')
+    parser.add_argument('tables', nargs='*', default=['master_clean_pro'])
+    parser.add_argument('--since', default=None, help='only keep rows scraped after this date (YYYY-MM-DD)')
+    args = parser.parse_args()
+    rebuild_snapshots(args.tables, max_scraped_date=args.since)
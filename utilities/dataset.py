@@ -0,0 +1,213 @@
+import numpy as np
+from datetime import datetime, timedelta
+
+from utilities.data import CHUNK_SIZE, concat_tables, get_daily_count, get_table_cached
+from utilities.calculation import cumulative_count, daily_count, extend_daily_count, replace_days
+from utilities.filter_index import FilterIndex
+from utilities.filter_store import FilterStore, normalize_filters
+from utilities.datatable import SortIndex, query_page
+from utilities.cube import PriceCube
+from utilities.correlation import CorrelationStats
+from utilities.options import OptionIndex
+from utilities.reduction import histogram, stratified_sample, value_counts
+from utilities.similar import SIMILAR_K, SimilarIndex
+from utilities.fair_price import PriceModel
+
+RAW_HISTORY_DAYS = 40
+
+
+def prepare_clean_pro(df):
+    return df.sort_values('scraped_date', ascending=False, ignore_index=True)
+
+
+def rows_from(df, date):
+    return int((df['scraped_date'] >= date).sum())
+
+
+def merge_rows(df, new_rows):
+    # New rows replace everything from their first scraped_date on, so a day scraped in several
+    # batches is re-read whole instead of being duplicated. The merged frame holds new_rows first, then
+    # the older rows kept. Every `extend(df, new_rows)` called by Dataset.extend gets this frame and the
+    # rows read by the refresh, and replaces the same days in what it derived from the rows.
+    return concat_tables([new_rows, df[df['scraped_date'] < new_rows['scraped_date'].min()]])
+
+
+def extend_raw_daily_count(df_raw_daily_count, new_raw_daily_count):
+    # master is only held as its counts per (scraped_date, source), over the last RAW_HISTORY_DAYS
+    df_raw_daily_count = replace_days(df_raw_daily_count, new_raw_daily_count)[0]
+    return df_raw_daily_count[df_raw_daily_count['scraped_date'] > raw_min_date()].reset_index(drop=True)
+
+
+def raw_daily_count_is_current(df_raw_daily_count, new_raw_daily_count, date):
+    # The counts read again from `date` on are the ones already held
+    held = df_raw_daily_count[df_raw_daily_count['scraped_date'] >= date]
+    return len(new_raw_daily_count) == len(held) and new_raw_daily_count['url'].sum() == held['url'].sum()
+
+
+def source_counts(df_raw_daily_count, today=None):
+    # Date x source matrix of the raw counts, and whether each source went without a scraped day over the
+    # last two days
+    counts = df_raw_daily_count.pivot(index='scraped_date', columns='source', values='url')
+    last_seen = counts.notna().iloc[::-1].idxmax()
+    stale = last_seen < (today or datetime.today().date()) - timedelta(days=2)
+    return counts, stale
+
+
+class Dataset:
+    """
+    Loaded tables plus every structure derived from them (daily counts, dropdown lists, indexes).
+
+    A Dataset is never modified once built: a refresh builds a new one with `extend` and the caller swaps
+    the reference, so a callback always sees frames and indexes from the same load.
+
+    The callbacks only go through the query methods below (filters are a filter state as published by
+    update_filter_state), which utilities.sql_engine.SqlDataset answers in the database instead.
+    """
+
+    def __init__(self, df_raw_daily_count, df_clean_pro, df_clean_pro_daily_count=None, correlation=None,
+                 similar_index=None, price_model=None):
+        # daily counts, correlation statistics, similarity trees and the price model are computed from the rows
+        # unless extend already carried them over. The raw master table is only known by its daily counts per source.
+        self.df_raw_daily_count = df_raw_daily_count
+
+        # Fair price of every listing, scored in one batch before the indexes below are built over the column
+        if price_model is None:
+            price_model = PriceModel(df_clean_pro)
+            df_clean_pro['deal_score'] = price_model.deal_score(df_clean_pro)
+        self.price_model = price_model
+        self.df_clean_pro = df_clean_pro
+        if df_clean_pro_daily_count is None:
+            df_clean_pro_daily_count = cumulative_count(daily_count(df_clean_pro))
+        self.df_clean_pro_daily_count = df_clean_pro_daily_count
+
+        self.dropdown_localisation = np.asarray(df_clean_pro['code_name'].sort_values(ascending=True).unique())
+
+        # Row index of the filters, built once instead of scanning df_clean_pro on every callback
+        self.filter_index = FilterIndex(df_clean_pro)
+        # Filtered rows shared by every filter-driven callback, evaluated once per distinct filter state
+        self.filter_store = FilterStore(self.filter_index.rows, self.filter_index.bounds)
+        # Dropdown options per combination of the categorical filters
+        self.option_index = OptionIndex(self.filter_index)
+        # Column ranks reused by the datatable_ads server-side sorting
+        self.sort_index = SortIndex(df_clean_pro)
+        # Daily price sums and counts answering the market price chart
+        self.price_cube = PriceCube(df_clean_pro, self.filter_index)
+        # Sufficient statistics of the correlation matrix
+        self.correlation = correlation if correlation is not None else CorrelationStats(df_clean_pro)
+        # KD-trees of the listings per brand and category, for the similar listings lookup
+        self.similar_index = similar_index if similar_index is not None else SimilarIndex(df_clean_pro)
+
+        self.max_scraped_date = {'master': df_raw_daily_count['scraped_date'].max(),
+                                 'master_clean_pro': df_clean_pro['scraped_date'].max()}
+        # Identifies the loaded data, identical across workers holding the same rows
+        self.version = f"{self.max_scraped_date['master_clean_pro']}:{len(df_clean_pro)}"
+        self.derived = {}
+
+    def cached(self, name, func):
+        # Figures and other values computed at most once per Dataset
+        if name not in self.derived:
+            self.derived[name] = func(self)
+        return self.derived[name]
+
+    def extend(self, new_raw_daily_count, new_clean_pro):
+        df_raw_daily_count = extend_raw_daily_count(self.df_raw_daily_count, new_raw_daily_count)
+
+        df_clean_pro = self.df_clean_pro
+        df_clean_pro_daily_count = self.df_clean_pro_daily_count
+        correlation = self.correlation
+        similar_index = self.similar_index
+        price_model = self.price_model
+        if len(new_clean_pro):
+            new_clean_pro = prepare_clean_pro(new_clean_pro)
+            df_clean_pro = merge_rows(df_clean_pro, new_clean_pro)
+            df_clean_pro_daily_count = extend_daily_count(df_clean_pro_daily_count, new_clean_pro)
+            correlation = correlation.extend(df_clean_pro, new_clean_pro)
+            similar_index = similar_index.extend(df_clean_pro, new_clean_pro)
+            # the refit moves every fair price, the whole merged frame is scored again
+            price_model = price_model.extend(df_clean_pro, new_clean_pro)
+            df_clean_pro['deal_score'] = price_model.deal_score(df_clean_pro)
+
+        return Dataset(df_raw_daily_count, df_clean_pro, df_clean_pro_daily_count, correlation, similar_index,
+                       price_model)
+
+    def is_current(self, new_raw_daily_count, new_clean_pro):
+        # True when the rows read again since the last scraped days are the ones already loaded
+        return (raw_daily_count_is_current(self.df_raw_daily_count, new_raw_daily_count,
+                                           self.max_scraped_date['master']) and
+                len(new_clean_pro) == rows_from(self.df_clean_pro, self.max_scraped_date['master_clean_pro']))
+
+    @property
+    def n_rows(self):
+        return len(self.df_clean_pro)
+
+    @property
+    def columns(self):
+        return list(self.df_clean_pro.columns)
+
+    @property
+    def bounds(self):
+        return self.filter_index.bounds
+
+    def select(self, filters):
+        # Evaluates the filters once for every callback reading them, returns the number of rows
+        return len(self.filter_store.get(filters))
+
+    def take(self, filters, columns):
+        rows = self.filter_store.get(filters)
+        return self.df_clean_pro.iloc[rows, [self.df_clean_pro.columns.get_loc(col) for col in columns]]
+
+    def options(self, filters, column):
+        # the rows are only read when a slider cuts through the combinations holding an option
+        options = self.option_index.options(filters, column)
+        if options is None:
+            options = self.filter_index.distinct(column, self.filter_store.get(filters))
+        return options
+
+    def daily_mean(self, filters, window=30):
+        return self.price_cube.daily_mean(window=window, **normalize_filters(filters))
+
+    def histogram(self, filters, column, bins=50):
+        return histogram(self.take(filters, [column])[column], bins=bins)
+
+    def value_counts(self, filters, column):
+        return value_counts(self.take(filters, [column])[column])
+
+    def correlation_matrix(self, filters):
+        rows = self.filter_store.get(filters)
+        # an unfiltered selection is answered from the running totals
+        if len(rows) == len(self.filter_index.valid_rows):
+            rows = None
+        return self.correlation.matrix(rows)
+
+    def sample(self, filters, columns, group_col, budget):
+        # Returns at most `budget` rows of the selection and the size of the selection
+        df = self.take(filters, columns)
+        return stratified_sample(df, group_col, budget), len(df)
+
+    def page(self, filters, sort_by, filter_query, page_current, page_size):
+        return query_page(self.df_clean_pro, self.filter_store.get(filters), self.sort_index, sort_by,
+                          filter_query, page_current, page_size)
+
+    def similar(self, listing_id, k=SIMILAR_K):
+        # The k listings nearest to listing_id in its brand and category, nearest first; not filtered
+        return self.similar_index.similar(self.df_clean_pro, listing_id, k)
+
+    def export(self, filters, columns, limit):
+        # At most `limit` selected rows, newest first, as frames of CHUNK_SIZE rows copied out one at a time.
+        # The generator holds this Dataset, a refresh swapping it does not change an export under way.
+        rows = self.filter_store.get(filters)[:limit]
+        positions = [self.df_clean_pro.columns.get_loc(col) for col in columns]
+        for start in range(0, len(rows), CHUNK_SIZE):
+            yield self.df_clean_pro.iloc[rows[start:start + CHUNK_SIZE], positions]
+
+
+def raw_min_date():
+    return (datetime.today() - timedelta(days=RAW_HISTORY_DAYS)).date()
+
+
+def load_dataset():
+    # raw data, counted by the database
+    df_raw_daily_count = get_daily_count("master", by='source', max_scraped_date=raw_min_date())
+    # clean data
+    df_clean_pro = prepare_clean_pro(get_table_cached("master_clean_pro"))
+    return Dataset(df_raw_daily_count, df_clean_pro)
@@ -0,0 +1,152 @@
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+# DataTable filter_query parts look like `{price} >= 5000`, `{brand} icontains "yam"` or `{comment} is blank`
+FILTER_PART = re.compile(r'^\s*\{(?P<column>[^}]+)\}\s+(?P<operator>is blank|is not blank|\S+)(?:\s+(?P<value>.+?))?\s*$')
+
+OPERATORS = {'eq': '=', '=': '=',
+             'ne': '!=', '!=': '!=',
+             'lt': '<', '<': '<',
+             'le': '<=', '<=': '<=',
+             'gt': '>', '>': '>',
+             'ge': '>=', '>=': '>=',
+             'contains': 'contains',
+             'datestartswith': 'datestartswith',
+             'is blank': 'is blank',
+             'is not blank': 'is not blank'}
+
+
+def create_markdown_url(url):
+    markdown = f"[View]({str(url)})"
+    return markdown
+
+
+def parse_value(value):
+    if value is None:
+        return None
+    if len(value) > 1 and value[0] == value[-1] and value[0] in ("'", '"', '`'):
+        return value[1:-1].replace('\\' + value[0], value[0])
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def parse_filter_query(filter_query):
+    # Returns a list of (column, operator, value, case_sensitive)
+    conditions = []
+    if not filter_query:
+        return conditions
+
+    for part in filter_query.split(' && '):
+        match = FILTER_PART.match(part)
+        if match is None:
+            continue
+        operator = match.group('operator')
+        case_sensitive = True
+        # `i`/`s` prefixes select case (in)sensitive flavours of the same operator
+        if operator not in OPERATORS and operator[0] in ('i', 's') and operator[1:] in OPERATORS:
+            case_sensitive = operator[0] == 's'
+            operator = operator[1:]
+        if operator not in OPERATORS:
+            continue
+        conditions.append((match.group('column'), OPERATORS[operator], parse_value(match.group('value')),
+                           case_sensitive))
+    return conditions
+
+
+def value_text(value):
+    # `{model} contains 1` is parsed as 1.0, compare strings against what the user typed
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def condition_mask(series, operator, value, case_sensitive=True):
+    if operator == 'is blank':
+        return (series.isnull() | (series.astype(str) == '')).to_numpy()
+    if operator == 'is not blank':
+        return ~condition_mask(series, 'is blank', None)
+    # a null matches no other condition, as in the SQL the other query engines run
+    return value_mask(series, operator, value, case_sensitive) & series.notna().to_numpy()
+
+
+def value_mask(series, operator, value, case_sensitive):
+    if operator in ('contains', 'datestartswith'):
+        strings = series.astype(str)
+        if operator == 'datestartswith':
+            return strings.str.startswith(value_text(value)).to_numpy()
+        return strings.str.contains(value_text(value), case=case_sensitive, regex=False).to_numpy()
+
+    values = series.to_numpy()
+    if isinstance(value, float) and not pd.api.types.is_numeric_dtype(series):
+        value = value_text(value)
+    if isinstance(value, str):
+        values = series.astype(str).to_numpy()
+        if not case_sensitive:
+            values, value = np.char.lower(values.astype(str)), value.lower()
+
+    if operator == '=':
+        return values == value
+    if operator == '!=':
+        return values != value
+    if operator == '<':
+        return values < value
+    if operator == '<=':
+        return values <= value
+    if operator == '>':
+        return values > value
+    return values >= value
+
+
+def apply_filter_query(df, rows, filter_query):
+    for column, operator, value, case_sensitive in parse_filter_query(filter_query):
+        if column not in df.columns or len(rows) == 0:
+            continue
+        keep = condition_mask(df[column].iloc[rows], operator, value, case_sensitive)
+        rows = rows[np.asarray(keep, dtype=bool)]
+    return rows
+
+
+class SortIndex:
+    """
+    Per-column sort ranks of a frame, computed lazily with one sorted factorize per column and reused for
+    every page request. Sorting a filtered row set is then a lexsort of small integer ranks.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.ranks = {}
+        self.lock = threading.Lock()
+
+    def rank(self, column):
+        with self.lock:
+            if column not in self.ranks:
+                # Dense ranks so that ties fall through to the next sort column, nulls sort last
+                rank, uniques = pd.factorize(self.df[column], sort=True)
+                rank = rank.astype(np.int64)
+                rank[rank == -1] = len(uniques)
+                self.ranks[column] = rank
+            return self.ranks[column]
+
+    def sort(self, rows, sort_by):
+        sort_by = [s for s in (sort_by or []) if s['column_id'] in self.df.columns]
+        if not sort_by or len(rows) == 0:
+            return rows
+        # np.lexsort uses the last key as primary
+        keys = [self.rank(s['column_id'])[rows] * (1 if s['direction'] == 'asc' else -1) for s in reversed(sort_by)]
+        return rows[np.lexsort(keys)]
+
+
+def query_page(df, rows, sort_index, sort_by, filter_query, page_current, page_size):
+    rows = apply_filter_query(df, rows, filter_query)
+    rows = sort_index.sort(rows, sort_by)
+
+    page_count = max(1, -(-len(rows) // page_size))
+    page_current = min(page_current or 0, page_count - 1)
+    page_rows = rows[page_current * page_size:(page_current + 1) * page_size]
+
+    return df.iloc[page_rows], page_current, page_count
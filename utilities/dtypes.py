@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+# How each column is stored once loaded:
+#   category: low-cardinality strings, one code per row instead of one Python string
+#   integer:  narrowest integer type holding the values (float32 while nulls are present)
+#   float:    float32
+#   date:     datetime.date objects, one shared object per distinct day
+#   string:   Arrow-backed strings, held in one buffer instead of one Python object per row, which also
+#             keeps the pages of a preloaded dataset shared between forked workers
+SCHEMAS = {
+    'master': {'source': 'category',
+               'url': 'string',
+               'scraped_date': 'date'},
+    'master_clean_pro': {'brand': 'category',
+                         'category': 'category',
+                         'model': 'category',
+                         'code_name': 'category',
+                         'source': 'category',
+                         'localisation': 'category',
+                         'dept_code': 'category',
+                         'vendor_type': 'category',
+                         'engine_type': 'category',
+                         'condition': 'category',
+                         'engine_size': 'integer',
+                         'circulation_year': 'integer',
+                         'bike_age': 'integer',
+                         'mileage': 'float',
+                         'price': 'float',
+                         'url': 'string',
+                         'scraped_date': 'date'},
+}
+
+
+def optimize_column(series, kind):
+    if kind == 'category':
+        return series.astype('category')
+    if kind == 'integer':
+        if series.notnull().all():
+            return pd.to_numeric(series, downcast='integer')
+        return series.astype(np.float32)
+    if kind == 'float':
+        return series.astype(np.float32)
+    if kind == 'string':
+        return series.astype('string[pyarrow]')
+    if kind == 'date':
+        # Postgres returns dates, stand-ins without a date type return ISO strings
+        present = series.notna().to_numpy()
+        if present.any() and isinstance(series.iloc[present.argmax()], str):
+            series = pd.to_datetime(series).dt.date
+        codes, uniques = pd.factorize(series)
+        values = np.asarray(uniques, dtype=object).take(codes)
+        values[codes == -1] = None
+        return pd.Series(values, index=series.index, name=series.name)
+    return series
+
+
+def optimize_dtypes(df, table):
+    schema = SCHEMAS.get(table, {})
+    for col in df.columns:
+        if col in schema:
+            df[col] = optimize_column(df[col], schema[col])
+        elif pd.api.types.is_float_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='float')
+        elif pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+def memory_usage(df):
+    return df.memory_usage(index=False, deep=True)
+
+
+def memory_report(before, after, dtypes):
+    # before/after: bytes per column, dtypes: resulting dtype per column
+    report = pd.DataFrame({'dtype': dtypes.astype(str),
+                           'before_mb': before / 1024 ** 2,
+                           'after_mb': after / 1024 ** 2})
+    report.loc['total'] = ['', report['before_mb'].sum(), report['after_mb'].sum()]
+    return report.round(2)
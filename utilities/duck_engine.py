@@ -0,0 +1,168 @@
+import glob
+import os
+import re
+import threading
+from uuid import uuid4
+
+import duckdb
+import pandas as pd
+
+from utilities import data
+from utilities.data import CHUNK_SIZE, get_daily_count, get_table_cached
+from utilities.dataset import extend_raw_daily_count, merge_rows, prepare_clean_pro, raw_min_date
+from utilities.fair_price import PriceModel
+from utilities.sql_engine import TABLE, SqlDataset
+
+# Threads DuckDB runs one query on, in each worker process: the cores are split between the gunicorn workers
+DUCKDB_THREADS = int(os.environ.get('DUCKDB_THREADS',
+                                    max(1, (os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY', 1)))))
+# Blocks of the DuckDB file each worker keeps in memory (e.g. '512MB'), empty for DuckDB's default
+DUCKDB_MEMORY_LIMIT = os.environ.get('DUCKDB_MEMORY_LIMIT', '')
+
+# `:name` parameters as written for SQLAlchemy, `::` casts excluded
+PARAMETER = re.compile(r'(?<![:\w]):(\w+)')
+
+
+def bind(sql, params=None):
+    # `:name` parameters as DuckDB's `$name`
+    params = params or {}
+    names = set(PARAMETER.findall(sql))
+
+    def parameter(match):
+        # a list parameter (the selected models) is matched as a DuckDB list
+        name = match.group(1)
+        return f'(SELECT UNNEST(${name}))' if isinstance(params.get(name), list) else f'${name}'
+
+    return PARAMETER.sub(parameter, sql), {name: params[name] for name in names}
+
+
+def dates(df):
+    # DATE columns come back as datetime64, the other engines hold datetime.date
+    for col in df.select_dtypes('datetime').columns:
+        df[col] = df[col].dt.date
+    return df
+
+
+def frame_kind(dtype):
+    # as utilities.sql_engine.column_kind, for a DataFrame column
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'bool'
+    return 'number' if pd.api.types.is_numeric_dtype(dtype) else None
+
+
+class DuckDataset(SqlDataset):
+    """
+    SqlDataset answered by an embedded DuckDB instead of the database server.
+
+    master_clean_pro is loaded from the local snapshot as for the memory engine and copied into DuckDB's
+    columnar storage, where the queries run vectorized over DUCKDB_THREADS threads. (Scanning the frame
+    in place avoids the copy but sniffs the object columns again on every query, several times slower.)
+
+    The copy is written once, by the process building the Dataset (the preloading gunicorn master), to a
+    DuckDB file in SNAPSHOT_DIR. Every process then opens it read-only on first use, since DuckDB's threads
+    never cross a fork: the file sits once in the page cache and each worker only holds the blocks it
+    reads, up to DUCKDB_MEMORY_LIMIT. Without SNAPSHOT_DIR each process builds an in-memory copy of its own.
+    """
+
+    def __init__(self, df_raw_daily_count, df_clean_pro, price_model=None):
+        # deal_score is scored on the frame, as Dataset does, before the copy into DuckDB
+        if price_model is None:
+            price_model = PriceModel(df_clean_pro)
+            df_clean_pro['deal_score'] = price_model.deal_score(df_clean_pro)
+        self.price_model = price_model
+        self.df_clean_pro = df_clean_pro
+        self.lock = threading.Lock()
+        self.con = None
+        self.pid = None
+        self.path = write_duck_file(df_clean_pro) if data.SNAPSHOT_DIR else None
+        super().__init__(df_raw_daily_count)
+        self.close()
+
+    def connection(self):
+        if self.pid != os.getpid():
+            config = {'threads': DUCKDB_THREADS}
+            if DUCKDB_MEMORY_LIMIT:
+                config['memory_limit'] = DUCKDB_MEMORY_LIMIT
+            if self.path is not None:
+                self.con = duckdb.connect(self.path, read_only=True, config=config)
+            else:
+                self.con = duckdb.connect(config=config)
+                copy_table(self.con, self.df_clean_pro)
+            self.pid = os.getpid()
+        return self.con
+
+    def close(self):
+        with self.lock:
+            if self.con is not None and self.pid == os.getpid():
+                self.con.close()
+            self.con, self.pid = None, None
+
+    def read(self, sql, params=None):
+        sql, params = bind(sql, params)
+        with self.lock:
+            return dates(self.connection().execute(sql, params).df())
+
+    def read_chunks(self, sql, params=None):
+        # A cursor of its own, so that a slow reader does not hold the lock every other query waits on
+        sql, params = bind(sql, params)
+        with self.lock:
+            cursor = self.connection().cursor()
+        try:
+            cursor.execute(sql, params)
+            while True:
+                df = cursor.fetch_df_chunk(max(1, CHUNK_SIZE // duckdb.__standard_vector_size__))
+                if not len(df):
+                    break
+                yield dates(df)
+        finally:
+            cursor.close()
+
+    def schema(self):
+        return {col: frame_kind(dtype) for col, dtype in self.df_clean_pro.dtypes.items()}
+
+    def floor(self, expression):
+        return f'FLOOR({expression})'
+
+    def position(self, haystack, needle):
+        return f'STRPOS({haystack}, {needle})'
+
+    def quote(self, column):
+        if column not in self.columns:
+            raise KeyError(column)
+        return '"' + column.replace('"', '""') + '"'
+
+    def extend(self, new_raw_daily_count, new_clean_pro):
+        df_raw_daily_count = extend_raw_daily_count(self.df_raw_daily_count, new_raw_daily_count)
+        df_clean_pro = self.df_clean_pro
+        price_model = self.price_model
+        if len(new_clean_pro):
+            new_clean_pro = prepare_clean_pro(new_clean_pro)
+            df_clean_pro = merge_rows(df_clean_pro, new_clean_pro)
+            price_model = price_model.extend(df_clean_pro, new_clean_pro)
+            df_clean_pro['deal_score'] = price_model.deal_score(df_clean_pro)
+        return DuckDataset(df_raw_daily_count, df_clean_pro, price_model)
+
+
+def copy_table(con, df_clean_pro):
+    con.register('df_clean_pro', df_clean_pro)
+    con.execute(f"CREATE TABLE {TABLE} AS SELECT * FROM df_clean_pro")
+    con.unregister('df_clean_pro')
+
+
+def write_duck_file(df_clean_pro):
+    # A new file per Dataset: the workers of the previous one keep reading theirs until they are replaced.
+    # Older files have no reader left and are removed.
+    os.makedirs(data.SNAPSHOT_DIR, exist_ok=True)
+    path = os.path.join(data.SNAPSHOT_DIR, f'{TABLE}-{uuid4().hex}.duckdb')
+    with duckdb.connect(path, config={'threads': DUCKDB_THREADS}) as con:
+        copy_table(con, df_clean_pro)
+    files = sorted(glob.glob(os.path.join(data.SNAPSHOT_DIR, f'{TABLE}-*.duckdb')), key=os.path.getmtime)
+    for old in files[:-2]:
+        os.remove(old)
+    return path
+
+
+def load_duck_dataset():
+    df_raw_daily_count = get_daily_count("master", by='source', max_scraped_date=raw_min_date())
+    df_clean_pro = prepare_clean_pro(get_table_cached("master_clean_pro"))
+    return DuckDataset(df_raw_daily_count, df_clean_pro)
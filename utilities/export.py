@@ -0,0 +1,115 @@
+import io
+import os
+from urllib.parse import urlencode
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utilities.filter_store import FILTER_KEYS
+
+# Rows one export may return, a larger `limit` is cut down to it
+EXPORT_MAX_ROWS = int(os.environ.get('EXPORT_MAX_ROWS', 1_000_000))
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+SLIDERS = ['engine_size', 'circulation_year', 'price']
+
+
+def export_filters(args, bounds):
+    """
+    Filter state of an export request, shaped as published by update_filter_state: `model` and the
+    sliders are repeated parameters (model=A&model=B, price=1000&price=5000), the others single values.
+    A slider left out spans `bounds`, as the sliders do on page load. Raises ValueError for a slider that
+    is not two numbers.
+    """
+    filters = {}
+    for key in FILTER_KEYS:
+        values = [value for value in args.getlist(key) if value != '']
+        if not values:
+            filters[key] = list(bounds[key]) if key in SLIDERS and key in bounds else None
+        elif key == 'model':
+            filters[key] = values
+        elif key in SLIDERS:
+            if len(values) != 2:
+                raise ValueError(f'{key} takes two values, got {len(values)}')
+            filters[key] = [float(value) for value in values]
+        else:
+            filters[key] = values[0]
+    return filters
+
+
+def export_url(filters, columns=None, fmt='csv', limit=None):
+    # Link to the export of a filter state, see export_filters
+    params = [(key, value) for key in FILTER_KEYS if filters.get(key) is not None
+              for value in (filters[key] if isinstance(filters[key], list) else [filters[key]])]
+    if columns:
+        params.append(('columns', ','.join(columns)))
+    if limit is not None:
+        params.append(('limit', limit))
+    return f'/export.{fmt}?{urlencode(params)}'
+
+
+def csv_chunks(chunks, columns):
+    # The header, then one block of lines per chunk
+    yield pd.DataFrame(columns=columns).to_csv(index=False)
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=False)
+
+
+class StreamSink(io.RawIOBase):
+    # Write-only file for the Parquet writer: the bytes written since the last `take` are handed to the
+    # response, tell() keeps counting them since the footer refers to the row groups by offset
+    def __init__(self):
+        super().__init__()
+        self.buffers = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffers.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data, self.buffers = b''.join(self.buffers), []
+        return data
+
+
+def export_type(arrow_type):
+    # One type per column for every row group, whatever dtypes a chunk came with (downcast integers,
+    # categoricals, a column holding only nulls)
+    if pa.types.is_dictionary(arrow_type):
+        return export_type(arrow_type.value_type)
+    if pa.types.is_integer(arrow_type):
+        return pa.int64()
+    if pa.types.is_floating(arrow_type):
+        return pa.float64()
+    if pa.types.is_null(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pa.string()
+    return arrow_type
+
+
+def parquet_chunks(chunks, columns):
+    # One row group per chunk, sent as soon as it is written; the schema is fixed by the first chunk
+    sink, writer = StreamSink(), None
+    for chunk in chunks:
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            schema = pa.schema([field.with_type(export_type(field.type)) for field in table.schema])
+            writer = pq.ParquetWriter(sink, schema)
+        writer.write_table(table.cast(schema))
+        yield sink.take()
+    if writer is None:
+        # nothing selected: a file holding the columns only
+        writer = pq.ParquetWriter(sink, pa.schema([(col, pa.string()) for col in columns]))
+    writer.close()
+    yield sink.take()
+
+
+def export_chunks(chunks, columns, fmt):
+    return csv_chunks(chunks, columns) if fmt == 'csv' else parquet_chunks(chunks, columns)
@@ -0,0 +1,158 @@
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import solve
+from scipy.sparse import csr_matrix
+
+# Penalty on the brand, model and code_name effects: a model seen on few listings is priced close to its brand
+FAIR_PRICE_RIDGE = float(os.environ.get('FAIR_PRICE_RIDGE', 5.0))
+
+CATEGORICAL_FEATURES = ['brand', 'model', 'code_name']
+NUMERIC_FEATURES = ['engine_size', 'bike_age', 'mileage']
+# intercept, log engine size, age, age squared, log mileage
+N_NUMERIC = 5
+
+
+def numeric_features(df, rows):
+    engine_size, bike_age, mileage = (df[col].to_numpy(dtype=np.float64)[rows] for col in NUMERIC_FEATURES)
+    return np.column_stack([np.ones(len(rows)), np.log1p(engine_size), bike_age, bike_age ** 2, np.log1p(mileage)])
+
+
+def fit_rows(df):
+    # Positions of the rows the model learns from: every feature set and a positive price
+    # column by column, a notna over the mixed frame copies it into one object block first
+    valid = df['price'].to_numpy(dtype=np.float64) > 0
+    for col in CATEGORICAL_FEATURES:
+        valid &= df[col].notna().to_numpy()
+    for col in NUMERIC_FEATURES:
+        valid &= df[col].to_numpy(dtype=np.float64) >= 0
+    return np.flatnonzero(valid)
+
+
+def n_features(levels):
+    return N_NUMERIC + sum(len(values) for values in levels.values())
+
+
+def feature_codes(df, col, levels):
+    # Position of each value among the levels of col, -1 for a missing or unseen value
+    return pd.Categorical(df[col], categories=levels[col]).codes
+
+
+def normal_equations(codes, numeric, log_price, levels):
+    # X'X and X'y of some rows, X holding their numeric features and a one in the column of their brand,
+    # model and code_name; y is log(price)
+    offsets = np.cumsum([N_NUMERIC] + [len(levels[col]) for col in CATEGORICAL_FEATURES])[:-1]
+    n = len(log_price)
+    indices = np.column_stack([np.tile(np.arange(N_NUMERIC), (n, 1))] +
+                              [col_codes + offset for col_codes, offset in zip(codes, offsets)])
+    data = np.column_stack([numeric, np.ones((n, len(CATEGORICAL_FEATURES)))])
+    width = indices.shape[1]
+    x = csr_matrix((data.ravel(), indices.ravel(), np.arange(0, n * width + 1, width)), shape=(n, n_features(levels)))
+    return (x.T @ x).toarray(), x.T @ log_price
+
+
+def daily_normal_equations(df, rows, levels):
+    # Normal equations of the rows before the last two scraped days, and of each of these days
+    if not len(rows):
+        n = n_features(levels)
+        return (np.zeros((n, n)), np.zeros(n)), {}
+    # features gathered once, each day then takes its part
+    codes = [pd.Categorical(df[col].to_numpy()[rows], categories=levels[col]).codes for col in CATEGORICAL_FEATURES]
+    numeric = numeric_features(df, rows)
+    log_price = np.log(df['price'].to_numpy(dtype=np.float64)[rows])
+    dates = df['scraped_date'].to_numpy()[rows]
+
+    def part(mask):
+        return normal_equations([col_codes[mask] for col_codes in codes], numeric[mask], log_price[mask], levels)
+
+    recent = dates >= dates.max() - timedelta(days=1)
+    return part(~recent), {day: part(dates == day) for day in pd.unique(dates[recent])}
+
+
+def pad(stats, levels, old_levels):
+    # Normal equations computed with old_levels, laid out for levels: the values appended to brand, model
+    # or code_name get zero rows and columns at the end of their column's block
+    xtx, xty = stats
+    if len(xty) == n_features(levels):
+        return stats
+    offsets = np.cumsum([N_NUMERIC] + [len(levels[col]) for col in CATEGORICAL_FEATURES])[:-1]
+    index = np.concatenate([np.arange(N_NUMERIC)] + [offset + np.arange(len(old_levels[col]))
+                                                     for col, offset in zip(CATEGORICAL_FEATURES, offsets)])
+    padded_xtx, padded_xty = np.zeros((n_features(levels),) * 2), np.zeros(n_features(levels))
+    padded_xtx[np.ix_(index, index)] = xtx
+    padded_xty[index] = xty
+    return padded_xtx, padded_xty
+
+
+class PriceModel:
+    """
+    Fair price of a listing: log(price) fitted by ridge least squares on its brand, model and code_name
+    (one effect per value) and on its engine size, age and mileage. deal_score is 1 - price / fair price,
+    above 0 for a listing cheaper than its fair price.
+
+    The fit only keeps the normal equations X'X and X'y, which add up over rows: the days before the last
+    two are summed once, the last two are kept per day since a refresh reads them again. `extend` swaps
+    the days a refresh re-read and solves again, without going back to the older rows.
+    """
+
+    def __init__(self, df, levels=None, base=None, recent=None):
+        if levels is None:
+            rows = fit_rows(df)
+            levels = {col: pd.Index(pd.unique(df[col].to_numpy()[rows])) for col in CATEGORICAL_FEATURES}
+            base, recent = daily_normal_equations(df, rows, levels)
+        self.levels = levels
+        self.base = base
+        self.recent = recent
+
+        xtx, xty = self.base[0].copy(), self.base[1].copy()
+        for day_xtx, day_xty in self.recent.values():
+            xtx += day_xtx
+            xty += day_xty
+        # the numeric coefficients are all but unpenalized, enough to solve when a feature is constant
+        penalty = np.full(len(xty), FAIR_PRICE_RIDGE)
+        penalty[:N_NUMERIC] = 1e-6
+        self.coefficients = solve(xtx + np.diag(penalty), xty, assume_a='pos')
+
+    def extend(self, df, new_rows):
+        # df and new_rows as in utilities.dataset.merge_rows
+        if not len(new_rows):
+            return PriceModel(df, self.levels, self.base, self.recent)
+        # every row read is replaced from this day on, including the days with no row to fit
+        first_day = new_rows['scraped_date'].min()
+        rows = fit_rows(new_rows)
+        if self.recent and first_day < min(self.recent):
+            # the refresh re-read days already summed in base
+            return PriceModel(df)
+
+        levels = {col: values.append(pd.Index(pd.unique(new_rows[col].to_numpy()[rows])).difference(values))
+                  for col, values in self.levels.items()}
+        new_base, new_recent = daily_normal_equations(new_rows, rows, levels)
+        recent = {day: pad(stats, levels, self.levels) for day, stats in self.recent.items() if day < first_day}
+        recent.update(new_recent)
+
+        # the days kept apart are the last two of the extended data, the older ones join base
+        (xtx, xty), (new_xtx, new_xty) = pad(self.base, levels, self.levels), new_base
+        xtx, xty = xtx + new_xtx, xty + new_xty
+        cutoff = max(recent) - timedelta(days=1) if recent else first_day
+        for day in [day for day in recent if day < cutoff]:
+            day_xtx, day_xty = recent.pop(day)
+            xtx, xty = xtx + day_xtx, xty + day_xty
+        return PriceModel(df, levels, (xtx, xty), recent)
+
+    def fair_price(self, df):
+        # One batch over every row, NaN where a numeric feature or the brand is missing
+        rows = np.arange(len(df))
+        log_price = numeric_features(df, rows) @ self.coefficients[:N_NUMERIC]
+        offset = N_NUMERIC
+        for col in CATEGORICAL_FEATURES:
+            # a missing or unseen value gets no effect of its own
+            effects = np.append(self.coefficients[offset:offset + len(self.levels[col])], 0)
+            log_price += effects[feature_codes(df, col, self.levels)]
+            offset += len(self.levels[col])
+        log_price[df['brand'].isna().to_numpy()] = np.nan
+        return np.exp(log_price)
+
+    def deal_score(self, df):
+        return 1 - df['price'].to_numpy(dtype=np.float64) / self.fair_price(df)
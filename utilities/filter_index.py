@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+# Filter state key -> column of each dropdown filter
+FILTER_COLUMNS = {'brand': 'brand', 'category': 'category', 'model': 'model', 'localisation': 'code_name'}
+CATEGORICAL_COLUMNS = list(FILTER_COLUMNS.values())
+NUMERIC_COLUMNS = ['engine_size', 'circulation_year', 'price']
+
+
+def scan_mask(df, brand=None, category=None, model=None, engine_size=None,
+              circulation_year=None, price=None, localisation=None):
+    # Reference full-scan implementation, kept for benchmarks and as a fallback
+    bool_lists = ((df['engine_size'] >= min(engine_size)) &
+                  (df['engine_size'] <= max(engine_size)) &
+                  (df['circulation_year'] >= min(circulation_year)) &
+                  (df['circulation_year'] <= max(circulation_year)) &
+                  (df['price'] >= min(price)) &
+                  (df['price'] <= max(price)))
+
+    if brand is not None:
+        bool_brand = df['brand'] == brand
+    else:
+        bool_brand = ~df['brand'].isnull()
+
+    if category is not None:
+        bool_category = df['category'] == category
+    else:
+        bool_category = ~df['category'].isnull()
+
+    if model is not None:
+        bool_model = df['model'].isin(model)
+    else:
+        bool_model = ~df['model'].isnull()
+
+    if localisation is not None:
+        bool_loc = df['code_name'] == localisation
+    else:
+        bool_loc = ~df['code_name'].isnull()
+
+    return bool_lists & bool_brand & bool_category & bool_model & bool_loc
+
+
+def selected_values(**filters):
+    # Values selected in each dropdown column, None where the dropdown is cleared; model takes a list
+    return {col: None if filters[key] is None else list(filters[key]) if key == 'model' else [filters[key]]
+            for key, col in FILTER_COLUMNS.items()}
+
+
+class FilterIndex:
+    """
+    Row index over df_clean_pro, built once at load time.
+
+    Categorical columns keep one posting list (sorted row positions) per value, numeric columns keep
+    their values sorted together with the matching row positions. Rows holding a null in any indexed
+    column are left out, which matches the isnull() / range semantics of scan_mask.
+    """
+
+    def __init__(self, df):
+        self.n_rows = len(df)
+
+        valid = np.ones(self.n_rows, dtype=bool)
+        for col in CATEGORICAL_COLUMNS + NUMERIC_COLUMNS:
+            valid &= df[col].notnull().to_numpy()
+        self.valid_rows = np.flatnonzero(valid).astype(np.int32)
+
+        self.codes = {}
+        self.uniques = {}
+        self.unique_values = {}
+        self.postings = {}
+        for col in CATEGORICAL_COLUMNS:
+            codes, uniques = pd.factorize(df[col].to_numpy()[self.valid_rows])
+            order = np.argsort(codes, kind='stable')
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(uniques)))])
+            rows = self.valid_rows[order]
+            self.postings[col] = {value: rows[offsets[k]:offsets[k + 1]] for k, value in enumerate(uniques)}
+            full_codes = np.full(self.n_rows, -1, dtype=np.int32)
+            full_codes[self.valid_rows] = codes
+            self.codes[col] = full_codes
+            self.uniques[col] = {value: k for k, value in enumerate(uniques)}
+            self.unique_values[col] = np.asarray(uniques, dtype=object)
+
+        self.values = {}
+        self.sorted_values = {}
+        self.sorted_rows = {}
+        for col in NUMERIC_COLUMNS:
+            values = df[col].to_numpy(dtype=np.float64)
+            order = np.argsort(values[self.valid_rows], kind='stable')
+            self.values[col] = values
+            self.sorted_values[col] = values[self.valid_rows][order]
+            self.sorted_rows[col] = self.valid_rows[order]
+
+        # (min, max) of each numeric column over the indexed rows
+        self.bounds = {col: (float(self.sorted_values[col][0]), float(self.sorted_values[col][-1]))
+                       for col in NUMERIC_COLUMNS if len(self.valid_rows)}
+
+    def _categorical_candidates(self, col, values):
+        empty = np.empty(0, dtype=np.int32)
+        if len(values) == 1:
+            return self.postings[col].get(values[0], empty)
+        # a value listed twice would return its rows twice
+        return np.sort(np.concatenate([self.postings[col].get(v, empty) for v in set(values)] + [empty]))
+
+    def _numeric_bounds(self, col, value_range):
+        sorted_values = self.sorted_values[col]
+        lo = np.searchsorted(sorted_values, min(value_range), side='left')
+        hi = np.searchsorted(sorted_values, max(value_range), side='right')
+        return lo, hi
+
+    def rows(self, brand=None, category=None, model=None, engine_size=None,
+             circulation_year=None, price=None, localisation=None):
+        # Returns the sorted row positions matching the filters
+        categorical = selected_values(brand=brand, category=category, model=model, localisation=localisation)
+        numeric = {'engine_size': engine_size,
+                   'circulation_year': circulation_year,
+                   'price': price}
+
+        # Each constraint is a candidate row set; start from the smallest one and probe the others
+        candidates = []
+        for col, values in categorical.items():
+            if values is None:
+                continue
+            rows = self._categorical_candidates(col, values)
+            codes = np.array([self.uniques[col][v] for v in values if v in self.uniques[col]], dtype=np.int32)
+            candidates.append((len(rows), 'cat', col, rows, codes))
+        for col, value_range in numeric.items():
+            lo, hi = self._numeric_bounds(col, value_range)
+            if lo == 0 and hi == len(self.sorted_values[col]):
+                continue  # range covers every indexed row
+            candidates.append((hi - lo, 'num', col, (lo, hi), value_range))
+
+        if not candidates:
+            return self.valid_rows
+
+        candidates.sort(key=lambda c: c[0])
+        size, kind, col, payload, _ = candidates[0]
+        if kind == 'cat':
+            rows = payload
+        else:
+            lo, hi = payload
+            rows = np.sort(self.sorted_rows[col][lo:hi])
+
+        for size, kind, col, payload, arg in candidates[1:]:
+            if len(rows) == 0:
+                break
+            if kind == 'cat':
+                codes = self.codes[col][rows]
+                keep = codes == arg[0] if len(arg) == 1 else np.isin(codes, arg)
+            else:
+                values = self.values[col][rows]
+                keep = (values >= min(arg)) & (values <= max(arg))
+            rows = rows[keep]
+
+        return rows
+
+    def distinct(self, col, rows):
+        # Sorted distinct values of a categorical column over row positions returned by rows()
+        present = np.bincount(self.codes[col][rows], minlength=len(self.unique_values[col])) > 0
+        return np.sort(self.unique_values[col][present])
+
+    def mask(self, **filters):
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.rows(**filters)] = True
+        return mask
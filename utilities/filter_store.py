@@ -0,0 +1,68 @@
+import json
+import threading
+from collections import OrderedDict
+
+FILTER_KEYS = ['brand', 'category', 'model', 'engine_size', 'circulation_year', 'price', 'localisation']
+
+
+def normalize_filters(filters, bounds=None):
+    # Same selection expressed differently (model order or repeats, reversed slider, slider beyond the data
+    # range) must map to the same key. bounds: (min, max) of the data per slider column.
+    normalized = {key: filters.get(key) for key in FILTER_KEYS}
+    if normalized['model'] is not None:
+        normalized['model'] = sorted(set(normalized['model']))
+    for key in ['engine_size', 'circulation_year', 'price']:
+        if normalized[key] is None:
+            continue
+        lo, hi = float(min(normalized[key])), float(max(normalized[key]))
+        if bounds is not None and key in bounds:
+            clamped_lo, clamped_hi = max(lo, bounds[key][0]), min(hi, bounds[key][1])
+            if clamped_lo <= clamped_hi:
+                lo, hi = clamped_lo, clamped_hi
+        normalized[key] = [lo, hi]
+    return normalized
+
+
+def filter_key(filters, bounds=None):
+    return json.dumps(normalize_filters(filters, bounds), sort_keys=True, default=str)
+
+
+class FilterStore:
+    """
+    Server-side LRU store of filtered row positions, keyed by the normalized filter state.
+
+    Every callback reading the same filter state shares one evaluation of `compute`; the store is
+    bounded both in number of entries and in bytes held.
+    """
+
+    def __init__(self, compute, bounds=None, max_entries=32, max_bytes=256 * 1024 ** 2):
+        self.compute = compute
+        self.bounds = bounds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.n_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, filters):
+        key = filter_key(filters, self.bounds)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        rows = self.compute(**normalize_filters(filters))
+
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = rows
+                self.n_bytes += rows.nbytes
+                while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.n_bytes > self.max_bytes):
+                    _, evicted = self.entries.popitem(last=False)
+                    self.n_bytes -= evicted.nbytes
+        return rows
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.n_bytes = 0
@@ -0,0 +1,174 @@
+import functools
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from dash.exceptions import PreventUpdate
+from flask_caching.backends.base import BaseCache
+
+from utilities.filter_store import filter_key
+
+
+class ByteLRUCache(BaseCache):
+    """
+    In-process cache evicting the least recently used entries once the pickled values exceed max_bytes.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 ** 2, default_timeout=300):
+        super().__init__(default_timeout=default_timeout)
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(max_bytes=int(config.get('CACHE_MAX_BYTES', 256 * 1024 ** 2)))
+        return cls(*args, **kwargs)
+
+    def _remove(self, key):
+        expires, value = self.entries.pop(key)
+        self.n_bytes -= len(value)
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            expires, value = self.entries[key]
+            if expires and expires < time.time():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=None):
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        timeout = self._normalize_timeout(timeout)
+        expires = time.time() + timeout if timeout else 0
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if len(value) > self.max_bytes:
+                return False
+            self.entries[key] = (expires, value)
+            self.n_bytes += len(value)
+            while self.n_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+        return True
+
+    def add(self, key, value, timeout=None):
+        if self.has(key):
+            return False
+        return self.set(key, value, timeout)
+
+    def delete(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return False
+            self._remove(key)
+        return True
+
+    def has(self, key):
+        return self.get(key) is not None
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.n_bytes = 0
+        return True
+
+
+def cache_config():
+    # CACHE_BACKEND selects where memoized callback results live:
+    #   filesystem (default), lru (in-process, bounded by CACHE_MAX_BYTES), redis (CACHE_REDIS_URL)
+    backend = os.environ.get('CACHE_BACKEND', 'filesystem')
+    if backend == 'lru':
+        return {'CACHE_TYPE': 'utilities.memo.ByteLRUCache',
+                'CACHE_MAX_BYTES': int(os.environ.get('CACHE_MAX_BYTES', 256 * 1024 ** 2))}
+    if backend == 'redis':
+        return {'CACHE_TYPE': 'RedisCache',
+                'CACHE_REDIS_URL': os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+                'CACHE_KEY_PREFIX': 'bike-price-dashboard:'}
+    return {'CACHE_TYPE': 'FileSystemCache',
+            'CACHE_DIR': 'cache-directory'}
+
+
+class FilterMemo:
+    """
+    Memoizes filter-driven callbacks in a Flask-Caching cache.
+
+    The key holds the callback name, the data version (so a refresh invalidates every entry), the
+    normalized filter state and the other callback arguments. `record`, when set, is called with the
+    callback name and `hit`, `miss` or `superseded` (a call dropped because `superseded` says the filter
+    state was already replaced), see CallbackMetrics.observe_cache.
+    """
+
+    def __init__(self, cache, version, bounds=None, timeout=60, superseded=None, record=None):
+        self.cache = cache
+        self.version = version
+        self.bounds = bounds
+        self.timeout = timeout
+        self.superseded = superseded
+        self.record = record or (lambda name, result: None)
+
+    def key(self, name, filter_state, args):
+        bounds = self.bounds() if self.bounds is not None else None
+        key = f"{name}:{self.version()}:{filter_key(filter_state, bounds)}:{json.dumps(args, default=str)}"
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(filter_state, *args):
+            if filter_state is None:
+                # not published before the data is loaded
+                raise PreventUpdate
+            if self.superseded is not None and self.superseded(filter_state):
+                self.record(func.__name__, 'superseded')
+                raise PreventUpdate
+            key = self.key(func.__name__, filter_state, args)
+            value = self.cache.get(key)
+            if value is not None:
+                self.record(func.__name__, 'hit')
+                return value
+            self.record(func.__name__, 'miss')
+            value = func(filter_state, *args)
+            self.cache.set(key, value, timeout=self.timeout)
+            return value
+
+        return wrapper
+
+
+class FilterSequencer:
+    """
+    Coalesces the filter states of a browser session: only the latest one is worth computing.
+
+    `publish` stamps a filter state with its session and a sequence number, and records it as the
+    session's latest in the cache. Only the redis backend shares it across processes and hosts: the
+    filesystem one is seen by the workers of a single host, the lru one by a single worker.
+    A filter-driven callback called with an older state is `superseded`: its result would be discarded by
+    the browser, it can stop before doing the work. The stamps are not part of the memoization key.
+    """
+
+    def __init__(self, cache, timeout=3600):
+        self.cache = cache
+        self.timeout = timeout
+
+    def key(self, session_id):
+        return f'filter-sequence:{session_id}'
+
+    def publish(self, filter_state, session_id):
+        if session_id is None:
+            return filter_state
+        sequence = time.time_ns()
+        self.cache.set(self.key(session_id), sequence, timeout=self.timeout)
+        return {**filter_state, 'session_id': session_id, 'sequence': sequence}
+
+    def superseded(self, filter_state):
+        if filter_state.get('session_id') is None:
+            return False
+        latest = self.cache.get(self.key(filter_state['session_id']))
+        return latest is not None and latest > filter_state['sequence']
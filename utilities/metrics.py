@@ -0,0 +1,191 @@
+import cProfile
+import functools
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+
+# Fraction of callback calls run under cProfile, 0 disables the sampling
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+# Directory where every gunicorn worker writes its figures (see gunicorn.conf.py), empty in a single process
+PROMETHEUS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+SECONDS_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+BYTES_BUCKETS = [1e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7]
+ROWS_BUCKETS = [10, 100, 1e3, 1e4, 1e5, 1e6]
+
+
+class CallbackMetrics:
+    """
+    Wall time, response size and filtered row count of every Dash callback, in Prometheus text format.
+
+    A call is split into phases: `filter` and `aggregate` are timed by the callbacks themselves with
+    `phase()`, `build` is the rest of the callback body (figures, components) and `serialize` the JSON
+    encoding Dash does once the callback returned. `instrument` must run before the callbacks are declared.
+    With `instrument_compression`, the `compress` phase and the bytes sent per encoding are added.
+    `observe_cache` counts the memoized calls per result (see utilities.memo.FilterMemo).
+    With PROMETHEUS_MULTIPROC_DIR set, the figures of every worker are added up on each scrape, whichever
+    worker serves it; without it, they only cover the process serving the scrape.
+    """
+
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, profile_dir=PROFILE_DIR):
+        self.sample_rate = sample_rate
+        self.profile_dir = profile_dir
+        self.registry = CollectorRegistry()
+        self.seconds = Histogram('dash_callback_seconds', 'Wall time of Dash callbacks per phase',
+                                 ['callback', 'phase'], buckets=SECONDS_BUCKETS, registry=self.registry)
+        self.bytes = Histogram('dash_callback_response_bytes', 'Size of the JSON response of Dash callbacks',
+                               ['callback'], buckets=BYTES_BUCKETS, registry=self.registry)
+        self.wire_bytes = Histogram('dash_callback_wire_bytes',
+                                    'Size of the response of Dash callbacks as sent, per encoding',
+                                    ['callback', 'encoding'], buckets=BYTES_BUCKETS, registry=self.registry)
+        self.rows = Histogram('dash_callback_rows', 'Rows of the filter selection read by Dash callbacks',
+                              ['callback'], buckets=ROWS_BUCKETS, registry=self.registry)
+        self.errors = Counter('dash_callback_exceptions', 'Dash callbacks ended by an exception',
+                              ['callback', 'exception'], registry=self.registry)
+        self.cache = Counter('dash_callback_cache', 'Memoized Dash callback calls per result',
+                             ['callback', 'result'], registry=self.registry)
+        self.local = threading.local()
+
+    @contextmanager
+    def phase(self, name):
+        call = getattr(self.local, 'call', None)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if call is not None:
+                call['phases'][name] += time.perf_counter() - start
+
+    def observe_rows(self, n_rows):
+        call = getattr(self.local, 'call', None)
+        if call is not None:
+            call['rows'] = n_rows
+
+    def instrument(self, app):
+        # Every callback declared with app.callback from now on is timed twice: the function itself, and
+        # the function Dash registers around it, which adds the serialization
+        register = app.callback
+
+        def callback(*args, **kwargs):
+            registered = set(app.callback_map)
+            decorator = register(*args, **kwargs)
+
+            def wrap(func):
+                decorator(self.timed(func))
+                for key in set(app.callback_map) - registered:
+                    app.callback_map[key]['callback'] = self.dispatched(app.callback_map[key]['callback'], func.__name__)
+                return func
+
+            return wrap
+
+        app.callback = callback
+
+    def instrument_compression(self, server, compress):
+        # after_request functions run last registered first: `compressing` sees the JSON Dash built,
+        # `compressed` what Flask-Compress made of it
+        server.after_request(self.compressed)
+        compress.init_app(server)
+        server.after_request(self.compressing)
+
+    def compressing(self, response):
+        if 'dash_callback' in g:
+            g.compress_start = time.perf_counter()
+        return response
+
+    def compressed(self, response):
+        if 'compress_start' in g:
+            seconds = time.perf_counter() - g.compress_start
+            encoding = response.headers.get('Content-Encoding', 'identity')
+            self.seconds.labels(g.dash_callback, 'compress').observe(seconds)
+            self.wire_bytes.labels(g.dash_callback, encoding).observe(response.content_length or 0)
+        return response
+
+    def timed(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            call = getattr(self.local, 'call', None)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if call is not None:
+                    call['callback'] = time.perf_counter() - start
+
+        return wrapper
+
+    def dispatched(self, func, name):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            self.local.call = call = {'phases': defaultdict(float), 'callback': 0.0, 'rows': None}
+            if has_request_context():
+                g.dash_callback = name
+            profile = self.profiler()
+            start = time.perf_counter()
+            try:
+                response = func(*args, **kwargs)
+            except Exception as e:
+                # PreventUpdate and friends end up here too, they are counted by type
+                self.errors.labels(name, type(e).__name__).inc()
+                raise
+            finally:
+                total = time.perf_counter() - start
+                self.local.call = None
+                if profile is not None:
+                    profile.disable()
+                    os.makedirs(self.profile_dir, exist_ok=True)
+                    profile.dump_stats(os.path.join(self.profile_dir, f'{name}-{time.time():.3f}.prof'))
+
+            phases = dict(call['phases'])
+            phases['build'] = max(call['callback'] - sum(phases.values()), 0)
+            phases['serialize'] = max(total - call['callback'], 0)
+            for phase, seconds in phases.items():
+                self.seconds.labels(name, phase).observe(seconds)
+            self.seconds.labels(name, 'total').observe(total)
+            self.bytes.labels(name).observe(len(response.encode()))
+            if call['rows'] is not None:
+                self.rows.labels(name).observe(call['rows'])
+            return response
+
+        return wrapper
+
+    def profiler(self):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return None  # another profiler is active in this process
+        return profile
+
+    def observe_cache(self, name, result):
+        self.cache.labels(name, result).inc()
+
+    def collected(self):
+        if not PROMETHEUS_MULTIPROC_DIR:
+            return self.registry
+        # the metrics written by every process to PROMETHEUS_MULTIPROC_DIR, live workers and exited ones
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry, path=PROMETHEUS_MULTIPROC_DIR)
+        return registry
+
+    def render(self):
+        return generate_latest(self.collected())
+
+    def cache_stats(self):
+        # The memoized calls per callback and result, as served on /cache-stats
+        stats = defaultdict(lambda: {'hits': 0, 'misses': 0, 'superseded': 0})
+        keys = {'hit': 'hits', 'miss': 'misses', 'superseded': 'superseded'}
+        for family in self.collected().collect():
+            for sample in family.samples:
+                if sample.name == 'dash_callback_cache_total':
+                    stats[sample.labels['callback']][keys[sample.labels['result']]] += int(sample.value)
+        return dict(sorted(stats.items()))
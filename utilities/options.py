@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from utilities.filter_index import CATEGORICAL_COLUMNS, FILTER_COLUMNS, NUMERIC_COLUMNS
+from utilities.filter_store import normalize_filters
+
+
+class OptionIndex:
+    """
+    Co-occurrence table of the dropdown columns, built once at load time from a FilterIndex: one entry per
+    (brand, category, model, code_name) combination of the indexed rows, with its row count and the
+    min/max of every slider column. Values are held as the FilterIndex codes.
+
+    The options left by a filter state are then found on the combinations alone: the categorical filters
+    are code lookups, a slider keeps a combination whose range it covers and drops one it misses. Only when
+    a slider cuts through a combination holding a value not reachable otherwise does `options` return
+    None, the caller reads the filtered rows instead.
+    """
+
+    def __init__(self, filter_index):
+        rows = filter_index.valid_rows
+        columns = {col: filter_index.codes[col][rows] for col in CATEGORICAL_COLUMNS}
+        columns.update({col: filter_index.values[col][rows] for col in NUMERIC_COLUMNS})
+        grouped = pd.DataFrame(columns).groupby(CATEGORICAL_COLUMNS, sort=False)
+        ranges = grouped[NUMERIC_COLUMNS].agg(['min', 'max'])
+
+        self.uniques = filter_index.uniques
+        self.unique_values = filter_index.unique_values
+        self.count = grouped.size().to_numpy()
+        self.codes = {col: ranges.index.get_level_values(col).to_numpy() for col in CATEGORICAL_COLUMNS}
+        self.lo = {col: ranges[(col, 'min')].to_numpy() for col in NUMERIC_COLUMNS}
+        self.hi = {col: ranges[(col, 'max')].to_numpy() for col in NUMERIC_COLUMNS}
+        self.n_combinations = len(self.count)
+
+    def options(self, filters, column):
+        # Sorted values of `column` over the rows matching filters, None when the rows must be read
+        filters = normalize_filters(filters)
+        keep = np.ones(self.n_combinations, dtype=bool)
+        for key, col in FILTER_COLUMNS.items():
+            if filters[key] is not None:
+                values = filters[key] if key == 'model' else [filters[key]]
+                codes = [self.uniques[col][value] for value in values if value in self.uniques[col]]
+                keep &= np.isin(self.codes[col], codes)
+
+        cut = np.zeros(self.n_combinations, dtype=bool)
+        for col in NUMERIC_COLUMNS:
+            if filters[col] is None:
+                continue
+            lo, hi = filters[col]
+            keep &= (self.hi[col] >= lo) & (self.lo[col] <= hi)
+            cut |= (self.lo[col] < lo) | (self.hi[col] > hi)
+
+        n_values = len(self.unique_values[column])
+        certain = np.bincount(self.codes[column][keep & ~cut], minlength=n_values) > 0
+        uncertain = np.bincount(self.codes[column][keep & cut], minlength=n_values) > 0
+        if (uncertain & ~certain).any():
+            return None
+        return np.sort(self.unique_values[column][certain])
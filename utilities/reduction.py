@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Most points drawn by the 3D scatter, the rest of the filtered listings are sampled out
+SCATTER_POINT_BUDGET = int(os.environ.get('SCATTER_POINT_BUDGET', 20000))
+
+
+def histogram(values, bins=50):
+    # Server-side binning: returns bar centers, counts and widths instead of the raw values
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return np.empty(0), np.empty(0, dtype=np.int64), np.empty(0)
+    counts, edges = np.histogram(values, bins=bins)
+    return (edges[:-1] + edges[1:]) / 2, counts, np.diff(edges)
+
+
+def value_counts(series):
+    # Bar heights of a categorical histogram, in order of first appearance as go.Histogram draws them
+    counts = series.value_counts(sort=False)
+    return counts.reindex(pd.unique(np.asarray(series.dropna())))
+
+
+def stratified_sample(df, group_col, budget, seed=0):
+    # Keeps at most `budget` rows: one row of each group of `group_col`, the rest of the budget shared in
+    # proportion to the rows left in each group. group_col=None, or more groups than `budget`, samples
+    # uniformly. The same frame always gives the same sample, so cached and fresh figures agree.
+    if len(df) <= budget:
+        return df
+    groups = np.zeros(len(df), dtype=np.int64)
+    if group_col is not None:
+        codes = pd.factorize(df[group_col].to_numpy())[0]
+        codes[codes == -1] = codes.max() + 1  # nulls form their own group
+        if codes.max() + 1 < budget:
+            groups = codes
+    sizes = np.bincount(groups)
+    extra, rest = budget - len(sizes), len(df) - len(sizes)
+
+    # random rank of each row inside its group, a group keeps 1 + floor((size - 1) * extra / rest) rows
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(len(df)), groups))
+    starts = np.cumsum(sizes) - sizes
+    ranks = np.empty(len(df), dtype=np.int64)
+    ranks[order] = np.arange(len(df)) - starts[groups[order]]
+    return df[ranks * rest <= (sizes[groups] - 1) * extra]
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from utilities.data import get_daily_count, get_table
+
+# Seconds between two incremental refreshes, 0 disables the background thread
+REFRESH_INTERVAL = int(os.environ.get('REFRESH_INTERVAL', 3600))
+# Load the data in the background thread instead of at import, the app serves its skeleton meanwhile
+LAZY_STARTUP = os.environ.get('LAZY_STARTUP', '0') == '1'
+# Seconds before a failed background load is tried again
+LOAD_RETRY = 30
+
+
+class DataRefresher:
+    """
+    Keeps `dataset` current by pulling only the rows scraped since the last load, in a background thread.
+
+    The last scraped day is read again on every refresh (a day can be scraped in several batches), the
+    new Dataset is built off to the side and then swapped in with a single assignment. `on_swap`, when
+    set, is called with the new Dataset after the swap.
+
+    A refresher can start without a dataset (`dataset` is None until `ready`), the thread then loads it
+    before refreshing.
+    """
+
+    def __init__(self, dataset, interval=REFRESH_INTERVAL, on_swap=None):
+        self.dataset = dataset
+        self.interval = interval
+        self.on_swap = on_swap
+        self.history = deque(maxlen=100)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def ready(self):
+        return self.dataset is not None
+
+    def load(self, load_dataset):
+        while self.dataset is None:
+            started_at = datetime.now().isoformat(timespec='seconds')
+            start = time.perf_counter()
+            try:
+                dataset = load_dataset()
+            except Exception as e:
+                self.history.append({'started_at': started_at, 'error': repr(e)})
+                print(f'Data load failed: {e!r}')
+                time.sleep(LOAD_RETRY)
+                continue
+            self.dataset = dataset
+            stats = {'started_at': started_at, 'loaded': True,
+                     'load_ms': round((time.perf_counter() - start) * 1000),
+                     'clean_pro_rows': dataset.n_rows, 'version': dataset.version}
+            self.history.append(stats)
+            print(f'Data load: {stats}')
+            if self.on_swap is not None:
+                self.on_swap(dataset)
+
+    def refresh(self):
+        with self.lock:
+            dataset = self.dataset
+            stats = {'started_at': datetime.now().isoformat(timespec='seconds'), 'swapped': False}
+
+            start = time.perf_counter()
+            since = {table: date - timedelta(days=1) for table, date in dataset.max_scraped_date.items()}
+            # master is only read as its counts per day and source
+            new_raw_daily_count = get_daily_count("master", by='source', max_scraped_date=since['master'])
+            new_clean_pro = get_table("master_clean_pro", max_scraped_date=since['master_clean_pro'], verbose=False)
+            stats['fetch_ms'] = round((time.perf_counter() - start) * 1000)
+            stats['raw_counts_fetched'] = len(new_raw_daily_count)
+            stats['clean_pro_rows_fetched'] = len(new_clean_pro)
+
+            if not dataset.is_current(new_raw_daily_count, new_clean_pro):
+                start = time.perf_counter()
+                new_dataset = dataset.extend(new_raw_daily_count, new_clean_pro)
+                stats['build_ms'] = round((time.perf_counter() - start) * 1000)
+                self.dataset = new_dataset
+                stats['swapped'] = True
+
+            stats['clean_pro_rows'] = self.dataset.n_rows
+            stats['version'] = self.dataset.version
+            self.history.append(stats)
+            print(f'Data refresh: {stats}')
+
+        if stats['swapped'] and self.on_swap is not None:
+            self.on_swap(self.dataset)
+        return stats
+
+    def run(self, load_dataset=None):
+        if load_dataset is not None:
+            self.load(load_dataset)
+        while self.interval > 0:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                # keep serving the current data, the next refresh will try again
+                self.history.append({'started_at': datetime.now().isoformat(timespec='seconds'), 'error': repr(e)})
+                print(f'Data refresh failed: {e!r}')
+
+    def start(self, load_dataset=None):
+        if self.thread is None and (self.interval > 0 or load_dataset is not None):
+            self.thread = threading.Thread(target=self.run, args=(load_dataset,), name='data-refresher', daemon=True)
+            self.thread.start()
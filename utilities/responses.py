@@ -0,0 +1,98 @@
+import decimal
+import os
+
+import dash
+import numpy as np
+import orjson
+import pandas as pd
+import plotly.io as pio
+from plotly.basedatatypes import BaseFigure
+
+# Responses below this many bytes are sent as they are, compressing them costs more than it saves
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1000))
+# Brotli quality (0-11) of the responses to browsers accepting it, gzip level for the others
+COMPRESS_BR_LEVEL = int(os.environ.get('COMPRESS_BR_LEVEL', 4))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def compress_config():
+    # Flask-Compress settings: Brotli or gzip as the browser accepts, JSON and the page assets only.
+    # Streamed responses are sent as they are produced, uncompressed.
+    return {'COMPRESS_ALGORITHM': ['br', 'gzip'],
+            'COMPRESS_MIN_SIZE': COMPRESS_MIN_SIZE,
+            'COMPRESS_BR_LEVEL': COMPRESS_BR_LEVEL,
+            'COMPRESS_LEVEL': COMPRESS_LEVEL,
+            'COMPRESS_MIMETYPES': ['application/json', 'text/html', 'text/css', 'application/javascript'],
+            'COMPRESS_STREAMS': False}
+
+
+def dates(array):
+    # orjson writes the NaT of a datetime64 array as 1970-01-01, an array holding one is sent as strings
+    # with null in its place, as plotly's encoder does
+    missing = np.isnat(array)
+    if not missing.any():
+        return array
+    strings = np.datetime_as_string(array).astype(object)
+    strings[missing] = None
+    return strings.tolist()
+
+
+def nat_as_null(value):
+    # The datetime64 arrays orjson would encode natively, found in the containers around them
+    if isinstance(value, dict):
+        return {key: nat_as_null(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [nat_as_null(item) for item in value]
+    if isinstance(value, np.ndarray) and value.dtype.kind == 'M':
+        return dates(value)
+    return value
+
+
+def default(value):
+    # What orjson does not encode natively. Numeric and boolean arrays, dates and numpy scalars never
+    # get here, nor datetime64 arrays without NaT.
+    if isinstance(value, BaseFigure):
+        # the figure's own dicts: to_dict would deep-copy every array first
+        figure = {'data': nat_as_null(value._data), 'layout': nat_as_null(value._layout)}
+        frames = [nat_as_null(frame._props) for frame in value._frame_objs]
+        if frames:
+            figure['frames'] = frames
+        return figure
+    if isinstance(value, np.ndarray):
+        # non-contiguous numeric arrays, strings and objects
+        if value.dtype.kind == 'M':
+            return dates(np.ascontiguousarray(value))
+        return np.ascontiguousarray(value) if value.dtype.kind in 'biuf' else value.tolist()
+    if isinstance(value, (pd.Series, pd.Index)):
+        return default(value.to_numpy())
+    if value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if hasattr(value, 'to_plotly_json'):
+        # Dash components and plotly objects
+        return value.to_plotly_json()
+    raise TypeError(f'Type is not JSON serializable: {type(value).__name__}')
+
+
+def to_json(value):
+    try:
+        return orjson.dumps(nat_as_null(value), default=default, option=OPTIONS).decode()
+    except TypeError:
+        # anything orjson rejects goes through plotly's json encoder, which raises if it cannot either. The
+        # engine is named: plotly's default (and the one use_orjson sets) is orjson again.
+        return pio.json.to_json_plotly(value, engine='json')
+
+
+def use_orjson():
+    # Dash 2.6 encodes callback responses and the layout with plotly's to_json_plotly, which copies every
+    # figure and walks object arrays in Python. Both call sites are pointed at to_json.
+    dash._callback.to_json = to_json
+    dash.dash.to_json = to_json
+    pio.json.config.default_engine = 'orjson'
@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# Listings returned by the similar listings lookup
+SIMILAR_K = int(os.environ.get('SIMILAR_K', 10))
+# Trees a (brand, category) may hold before a refresh merges them back into one
+SIMILAR_MAX_SEGMENTS = int(os.environ.get('SIMILAR_MAX_SEGMENTS', 8))
+
+SIMILAR_COLUMNS = ['mileage', 'bike_age', 'engine_size', 'price']
+GROUP_COLUMNS = ['brand', 'category']
+
+
+def similar_rows(df):
+    # Positions of the rows with a brand, a category and every feature set
+    return np.flatnonzero(df[GROUP_COLUMNS + SIMILAR_COLUMNS].notna().all(axis=1).to_numpy())
+
+
+def feature_scale(df, rows):
+    # Standard deviation of each feature over the indexed rows, distances are counted in these units
+    scale = np.array([df[col].to_numpy(dtype=np.float64)[rows].std() if len(rows) else 1.0
+                      for col in SIMILAR_COLUMNS])
+    return np.where(scale > 0, scale, 1.0)
+
+
+class SimilarIndex:
+    """
+    Nearest listings by (mileage, bike_age, engine_size, price), each divided by its standard deviation,
+    among the listings of the same brand and category.
+
+    A KD-tree per (brand, category) is built at load time. A refresh does not rebuild them: the rows it
+    read get trees of their own and the rows they replace stay in the older trees, skipped. Rows are
+    known by their position counted from the end of df_clean_pro, which merge_rows leaves unchanged for
+    the rows it keeps. Once a group holds SIMILAR_MAX_SEGMENTS trees, or more replaced rows than kept
+    ones, its trees are merged back into one.
+    """
+
+    def __init__(self, df, scale=None, groups=None):
+        self.n_rows = len(df)
+        rows = similar_rows(df) if groups is None else None
+        self.scale = feature_scale(df, rows) if scale is None else scale
+        # (brand, category) -> [(tree, keys, limit, n_stale)]: keys of the tree points, the points
+        # with a key above limit were replaced since
+        self.groups = groups if groups is not None else self.build(df, rows)
+        # positions sorted by id, to find a listing without scanning the ids
+        self.ids = df['id'].to_numpy()
+        self.id_order = np.argsort(self.ids, kind='stable')
+
+    def build(self, df, rows, only=None):
+        # One tree per group of `rows`, or of the groups in `only`
+        keys = len(df) - rows
+        grouped = pd.DataFrame({col: df[col].to_numpy()[rows] for col in GROUP_COLUMNS})
+        columns = [df[col].to_numpy(dtype=np.float64)[rows] / scale
+                   for col, scale in zip(SIMILAR_COLUMNS, self.scale)]
+        groups = {}
+        for group, positions in grouped.groupby(GROUP_COLUMNS, observed=True, sort=False).indices.items():
+            if only is None or group in only:
+                values = np.column_stack([column[positions] for column in columns])
+                tree = cKDTree(values, balanced_tree=False, compact_nodes=False)
+                groups[group] = [(tree, keys[positions], len(df), 0)]
+        return groups
+
+    def extend(self, df, new_rows):
+        # df: the extended frame, starting with the len(new_rows) rows read by the refresh (merge_rows)
+        n_kept = len(df) - len(new_rows)
+        groups = {}
+        for group, segments in self.groups.items():
+            groups[group] = [(tree, keys, min(limit, n_kept), int((keys > min(limit, n_kept)).sum()))
+                             for tree, keys, limit, _ in segments]
+        for group, segments in self.build(df, similar_rows(df.iloc[:len(new_rows)])).items():
+            groups[group] = groups.get(group, []) + segments
+
+        merged = {group for group, segments in groups.items()
+                  if len(segments) > SIMILAR_MAX_SEGMENTS or
+                  2 * sum(n_stale for *_, n_stale in segments) > sum(tree.n for tree, *_ in segments)}
+        if merged:
+            rebuilt = self.build(df, similar_rows(df), only=merged)
+            for group in merged:
+                del groups[group]
+            groups.update(rebuilt)
+        return SimilarIndex(df, self.scale, groups)
+
+    def nearest(self, group, point, k):
+        # Distances and positions of the k rows of `group` nearest to `point`, nearest first
+        point = np.asarray(point, dtype=np.float64) / self.scale
+        distances, keys = [], []
+        for tree, segment_keys, limit, n_stale in self.groups.get(group, []):
+            n = min(k + n_stale, tree.n)
+            if n == 0:
+                continue
+            d, i = tree.query(point, k=n)
+            d, found = np.atleast_1d(d), segment_keys[np.atleast_1d(i)]
+            distances.append(d[found <= limit])
+            keys.append(found[found <= limit])
+        if not distances:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        distances, keys = np.concatenate(distances), np.concatenate(keys)
+        order = np.argsort(distances, kind='stable')[:k]
+        return distances[order], self.n_rows - keys[order]
+
+    def similar(self, df, listing_id, k):
+        # Rows of the k listings nearest to listing_id in its brand and category, with their distance
+        positions = self.id_order[np.searchsorted(self.ids, listing_id, sorter=self.id_order):
+                                  np.searchsorted(self.ids, listing_id, side='right', sorter=self.id_order)]
+        if not len(positions):
+            return df.iloc[:0].assign(distance=np.empty(0))
+        listing = {col: df[col].iloc[positions[0]] for col in GROUP_COLUMNS + SIMILAR_COLUMNS}
+        if any(pd.isnull(value) for value in listing.values()):
+            return df.iloc[:0].assign(distance=np.empty(0))
+        group = tuple(listing[col] for col in GROUP_COLUMNS)
+        # the listing itself is among the nearest, once per row holding its id
+        point = [listing[col] for col in SIMILAR_COLUMNS]
+        distances, rows = self.nearest(group, point, k + len(positions))
+        other = self.ids[rows] != listing_id
+        return df.iloc[rows[other][:k]].assign(distance=distances[other][:k])
@@ -0,0 +1,385 @@
+import argparse
+import os
+from numbers import Number
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, inspect, text
+
+from utilities.calculation import cumulative_count
+from utilities.correlation import CORRELATION_EXCLUDED, correlation_from_moments
+from utilities.data import CHUNK_SIZE, get_daily_count, get_engine
+from utilities.dataset import extend_raw_daily_count, raw_daily_count_is_current, raw_min_date
+from utilities.datatable import parse_filter_query, value_text
+from utilities.dtypes import optimize_column, optimize_dtypes
+from utilities.filter_index import FILTER_COLUMNS
+from utilities.filter_store import normalize_filters
+from utilities.similar import GROUP_COLUMNS, SIMILAR_COLUMNS, SIMILAR_K
+
+# Where the filter-driven callbacks are answered: `memory` loads master_clean_pro in every worker,
+# `sql` sends each filter state to the database and only reads back aggregates and pages, `duckdb`
+# runs the same SQL on an embedded DuckDB (utilities.duck_engine)
+QUERY_ENGINE = os.environ.get('QUERY_ENGINE', 'memory')
+
+TABLE = 'master_clean_pro'
+NUMERIC = ['engine_size', 'circulation_year', 'price']
+
+# Indexes serving the filter predicates and the daily aggregates, see create_indexes
+INDEXES = [('ix_master_clean_pro_filters', TABLE, ['brand', 'category', 'model', 'code_name', 'scraped_date']),
+           ('ix_master_clean_pro_category', TABLE, ['category', 'model', 'scraped_date']),
+           ('ix_master_clean_pro_model', TABLE, ['model', 'scraped_date']),
+           ('ix_master_clean_pro_code_name', TABLE, ['code_name', 'scraped_date']),
+           ('ix_master_clean_pro_scraped_date', TABLE, ['scraped_date']),
+           ('ix_master_scraped_date', 'master', ['scraped_date'])]
+
+
+def where_clause(filters):
+    """
+    Parameterized WHERE clause of a filter state, selecting the rows FilterIndex.rows selects: a row
+    holding a null in any filtered column never matches. Returns the clause and its parameters.
+    """
+    filters = normalize_filters(filters)
+    clauses, params = [], {}
+    for key, col in FILTER_COLUMNS.items():
+        if filters[key] is None:
+            clauses.append(f'{col} IS NOT NULL')
+        elif key == 'model':
+            clauses.append(f'{col} IN :{key}')
+            params[key] = list(filters[key])
+        else:
+            clauses.append(f'{col} = :{key}')
+            params[key] = filters[key]
+    for col in NUMERIC:
+        if filters[col] is None:
+            clauses.append(f'{col} IS NOT NULL')
+        else:
+            clauses.append(f'{col} BETWEEN :{col}_lo AND :{col}_hi')
+            params[f'{col}_lo'], params[f'{col}_hi'] = filters[col]
+    return ' AND '.join(clauses), params
+
+
+def similar_where():
+    # Rows the similar listings are looked for in, as utilities.similar.similar_rows
+    return ' AND '.join(f'{col} IS NOT NULL' for col in GROUP_COLUMNS + SIMILAR_COLUMNS)
+
+
+def statement(sql, params):
+    # list parameters (the selected models) are expanded to one placeholder per value
+    expanding = [bindparam(name, expanding=True) for name, value in params.items() if isinstance(value, list)]
+    return text(sql).bindparams(*expanding) if expanding else text(sql)
+
+
+def read_sql(sql, params=None):
+    params = params or {}
+    with get_engine().connect() as connection:
+        return pd.read_sql(statement(sql, params), connection, params=params)
+
+
+def create_indexes(engine=None):
+    engine = engine or get_engine()
+    with engine.begin() as connection:
+        for name, table, columns in INDEXES:
+            connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+            print(f"{name} on {table} ({', '.join(columns)})")
+
+
+class SqlDataset:
+    """
+    Same query interface as utilities.dataset.Dataset, answered by the database: every call sends one or
+    two parameterized queries and reads back an aggregate, a sample or one DataTable page, never the
+    filtered rows. Neither table is loaded: the scraping panel only holds the daily counts of master.
+
+    Figures depending on the whole table (daily counts, slider bounds, dropdown lists) are read once per
+    Dataset, a refresh builds a new one.
+    """
+
+    def __init__(self, df_raw_daily_count):
+        self.df_raw_daily_count = df_raw_daily_count
+
+        schema = self.schema()
+        self.columns = list(schema)
+        self.numeric_columns = [col for col, kind in schema.items() if kind == 'number']
+        # bools are correlated as 0/1, as utilities.correlation.correlation_columns does
+        self.bool_columns = [col for col, kind in schema.items() if kind == 'bool']
+        self.correlation_columns = [col for col, kind in schema.items()
+                                    if kind in ('number', 'bool') and col not in CORRELATION_EXCLUDED]
+
+        daily = self.read(f"SELECT scraped_date, COUNT(url) AS url, COUNT(*) AS n_rows FROM {TABLE} "
+                         f"GROUP BY scraped_date ORDER BY scraped_date")
+        daily['scraped_date'] = optimize_column(daily['scraped_date'], 'date')
+        self.n_rows = int(daily['n_rows'].sum())
+        self.last_day_rows = int(daily['n_rows'].iloc[-1]) if len(daily) else 0
+        self.df_clean_pro_daily_count = cumulative_count(daily[['scraped_date', 'url']])
+
+        where, params = where_clause({})
+        ranges = self.read(f"SELECT {', '.join(f'MIN({col}) AS {col}_min, MAX({col}) AS {col}_max' for col in NUMERIC)} "
+                          f"FROM {TABLE} WHERE {where}", params).iloc[0]
+        # (min, max) of each numeric column over the rows a filter can select, as FilterIndex.bounds
+        self.bounds = {col: (float(ranges[f'{col}_min']), float(ranges[f'{col}_max']))
+                       for col in NUMERIC if pd.notnull(ranges[f'{col}_min'])}
+        self.dropdown_localisation = self.read(f"SELECT DISTINCT code_name FROM {TABLE} WHERE code_name IS NOT NULL "
+                                              f"ORDER BY code_name")['code_name'].to_numpy()
+        # the correlation sums are taken around the column means, to keep the sums of squares well conditioned
+        averages = ', '.join(f'AVG({self.number(col)}) AS {col}' for col in self.correlation_columns)
+        means = self.read(f"SELECT {averages} FROM {TABLE}").iloc[0] if self.correlation_columns else {}
+        self.shift = {col: float(np.nan_to_num(means[col])) for col in self.correlation_columns}
+        # standard deviations the similarity distances are counted in, as utilities.similar.feature_scale
+        averages = ', '.join(f'AVG({col}) AS {col}_mean, AVG(1.0 * {col} * {col}) AS {col}_square' for col in SIMILAR_COLUMNS)
+        moments = np.nan_to_num(self.read(f"SELECT {averages} FROM {TABLE} WHERE {similar_where()}")
+                                .to_numpy(dtype=np.float64)[0]).reshape(len(SIMILAR_COLUMNS), 2)
+        self.similar_scale = {col: np.sqrt(square - mean ** 2) if square - mean ** 2 > 0 else 1.0
+                              for col, (mean, square) in zip(SIMILAR_COLUMNS, moments)}
+
+        self.max_scraped_date = {'master': df_raw_daily_count['scraped_date'].max(),
+                                 'master_clean_pro': daily['scraped_date'].max() if len(daily) else None}
+        self.version = f"{self.max_scraped_date['master_clean_pro']}:{self.n_rows}"
+        self.derived = {}
+
+    def cached(self, name, func):
+        if name not in self.derived:
+            self.derived[name] = func(self)
+        return self.derived[name]
+
+    def extend(self, new_raw_daily_count, new_clean_pro):
+        # master_clean_pro is in the database already, only its summaries are read again
+        return SqlDataset(extend_raw_daily_count(self.df_raw_daily_count, new_raw_daily_count))
+
+    def is_current(self, new_raw_daily_count, new_clean_pro):
+        return (raw_daily_count_is_current(self.df_raw_daily_count, new_raw_daily_count,
+                                           self.max_scraped_date['master']) and
+                len(new_clean_pro) == self.last_day_rows)
+
+    # What differs from one database to the other: subclasses override these
+
+    def read(self, sql, params=None):
+        return read_sql(sql, params)
+
+    def read_chunks(self, sql, params=None):
+        # Server-side cursor, CHUNK_SIZE rows per round trip as utilities.data.get_table
+        params = params or {}
+        with get_engine().connect().execution_options(stream_results=True) as connection:
+            yield from pd.read_sql(statement(sql, params), connection, params=params, chunksize=CHUNK_SIZE)
+
+    def schema(self):
+        # column name -> 'number', 'bool' or None, in table order
+        return {col['name']: column_kind(col['type']) for col in inspect(get_engine()).get_columns(TABLE)}
+
+    def floor(self, expression):
+        # SQLite has no FLOOR, the truncation is the same for the non-negative values binned here
+        if get_engine().dialect.name == 'sqlite':
+            return f'CAST({expression} AS INTEGER)'
+        return f'FLOOR({expression})'
+
+    def position(self, haystack, needle):
+        if get_engine().dialect.name == 'sqlite':
+            return f'INSTR({haystack}, {needle})'
+        return f'STRPOS({haystack}, {needle})'
+
+    def quote(self, column):
+        if column not in self.columns:
+            raise KeyError(column)
+        return get_engine().dialect.identifier_preparer.quote(column)
+
+    def number(self, column):
+        # A column as a number, bools as 0/1
+        if column in self.bool_columns:
+            return f'CAST({self.quote(column)} AS INTEGER)'
+        return self.quote(column)
+
+    def select(self, filters):
+        where, params = where_clause(filters)
+        return int(self.read(f"SELECT COUNT(*) AS n FROM {TABLE} WHERE {where}", params)['n'].iloc[0])
+
+    def options(self, filters, column):
+        col = self.quote(column)
+        where, params = where_clause(filters)
+        return self.read(f"SELECT DISTINCT {col} AS value FROM {TABLE} WHERE {where} ORDER BY 1", params)['value'].to_numpy()
+
+    def daily_mean(self, filters, window=30):
+        where, params = where_clause(filters)
+        df_daily = self.read(f"SELECT scraped_date, SUM(price) AS sum, COUNT(price) AS count FROM {TABLE} "
+                            f"WHERE {where} GROUP BY scraped_date ORDER BY scraped_date", params)
+        df_daily['scraped_date'] = optimize_column(df_daily['scraped_date'], 'date')
+        df_daily['price'] = df_daily['sum'] / df_daily['count']
+        df_daily[f'SMA{window}'] = df_daily['price'].rolling(window).mean()
+        return df_daily
+
+    def histogram(self, filters, column, bins=50):
+        # Range first, then the count per bucket; np.histogram conventions (last bucket closed, a single
+        # value spread over [x - 0.5, x + 0.5])
+        col = self.quote(column)
+        where, params = where_clause(filters)
+        where = f'{where} AND {col} IS NOT NULL'
+        lo, hi = self.read(f"SELECT MIN({col}) AS lo, MAX({col}) AS hi FROM {TABLE} WHERE {where}", params).iloc[0]
+        if pd.isnull(lo):
+            return np.empty(0), np.empty(0, dtype=np.int64), np.empty(0)
+        lo, hi = float(lo), float(hi)
+        if lo == hi:
+            lo, hi = lo - 0.5, hi + 0.5
+        bucket = self.floor(f'({col} - :lo) * :scale')
+        df = self.read(f"SELECT {bucket} AS bucket, COUNT(*) AS n FROM {TABLE} WHERE {where} GROUP BY 1",
+                      {**params, 'lo': lo, 'scale': bins / (hi - lo)})
+        counts = np.bincount(np.clip(df['bucket'].to_numpy(dtype=np.int64), 0, bins - 1),
+                             weights=df['n'].to_numpy(), minlength=bins).astype(np.int64)
+        edges = np.linspace(lo, hi, bins + 1)
+        return (edges[:-1] + edges[1:]) / 2, counts, np.diff(edges)
+
+    def value_counts(self, filters, column):
+        col = self.quote(column)
+        where, params = where_clause(filters)
+        df = self.read(f"SELECT {col} AS value, COUNT(*) AS n FROM {TABLE} WHERE {where} AND {col} IS NOT NULL "
+                      f"GROUP BY {col} ORDER BY n DESC", params)
+        return pd.Series(df['n'].to_numpy(), index=df['value'].to_numpy(), name=column)
+
+    def correlation_matrix(self, filters):
+        # The moments of utilities.correlation for every column pair, summed by the database: for a pair
+        # only the rows where both values are set count
+        columns = self.correlation_columns
+        if self.selects_everything(filters):
+            where, params = '1 = 1', {}
+        else:
+            where, params = where_clause(filters)
+        params = {**params, **{f'shift_{i}': self.shift[col] for i, col in enumerate(columns)}}
+        x = [f'({self.number(col)} - :shift_{i})' for i, col in enumerate(columns)]
+        pairs = [(i, j) for i in range(len(columns)) for j in range(i, len(columns))]
+        aggregates = []
+        for i, j in pairs:
+            both = f'{self.quote(columns[i])} IS NOT NULL AND {self.quote(columns[j])} IS NOT NULL'
+            aggregates += [f'COUNT(CASE WHEN {both} THEN 1 END)',
+                           f'SUM(CASE WHEN {both} THEN {x[i]} END)', f'SUM(CASE WHEN {both} THEN {x[j]} END)',
+                           f'SUM(CASE WHEN {both} THEN {x[i]} * {x[i]} END)',
+                           f'SUM(CASE WHEN {both} THEN {x[j]} * {x[j]} END)',
+                           f'SUM({x[i]} * {x[j]})']
+        sums = np.nan_to_num(self.read(f"SELECT {', '.join(aggregates)} FROM {TABLE} WHERE {where}", params)
+                             .to_numpy(dtype=np.float64)[0]).reshape(len(pairs), 6)
+
+        stats = np.zeros((4, len(columns), len(columns)))
+        for (i, j), (n, sx_i, sx_j, sxx_i, sxx_j, sxy) in zip(pairs, sums):
+            stats[0, i, j] = stats[0, j, i] = n
+            stats[1, i, j], stats[1, j, i] = sx_i, sx_j
+            stats[2, i, j], stats[2, j, i] = sxx_i, sxx_j
+            stats[3, i, j] = stats[3, j, i] = sxy
+        return pd.DataFrame(correlation_from_moments(stats), index=columns, columns=columns)
+
+    def selects_everything(self, filters):
+        # The in-memory engine answers the unfiltered state from every row, nulls included
+        filters = normalize_filters(filters, self.bounds)
+        return (all(filters[key] is None for key in FILTER_COLUMNS) and
+                all(filters[col] is None or (col in self.bounds and filters[col] == list(self.bounds[col]))
+                    for col in NUMERIC))
+
+    def sample(self, filters, columns, group_col, budget):
+        # Same quotas as utilities.reduction.stratified_sample, ranked inside each group by a hash of the
+        # id so that a filter state always draws the same rows
+        where, params = where_clause(filters)
+        n_total = self.select(filters)
+        selected = ', '.join(self.quote(col) for col in columns)
+        if n_total <= budget:
+            df = self.read(f"SELECT {selected} FROM {TABLE} WHERE {where}", params)
+        else:
+            n_groups = 1
+            if group_col is not None:
+                n_groups = int(self.read(f"SELECT COUNT(*) AS n FROM (SELECT 1 FROM {TABLE} WHERE {where} "
+                                         f"GROUP BY {self.quote(group_col)}) grouped", params)['n'].iloc[0])
+            if n_groups >= budget:
+                group_col, n_groups = None, 1
+            partition = f'PARTITION BY {self.quote(group_col)} ' if group_col is not None else ''
+            # integer products: the same comparison in every database and in numpy
+            df = self.read(f"SELECT {selected} FROM ("
+                          f"SELECT {selected}, "
+                          f"ROW_NUMBER() OVER ({partition}ORDER BY (id * 2654435761) % 4294967296, id) AS rank_in_group, "
+                          f"COUNT(*) OVER ({partition.strip()}) AS group_size "
+                          f"FROM {TABLE} WHERE {where}) ranked "
+                          f"WHERE (rank_in_group - 1) * :rest <= (group_size - 1) * :extra",
+                          {**params, 'extra': budget - n_groups, 'rest': n_total - n_groups})
+        return optimize_dtypes(df, TABLE), n_total
+
+    def page(self, filters, sort_by, filter_query, page_current, page_size):
+        where, params = where_clause(filters)
+        for k, (column, operator, value, case_sensitive) in enumerate(parse_filter_query(filter_query)):
+            if column in self.columns:
+                condition, condition_params = self.condition_sql(column, operator, value, case_sensitive, f'q{k}')
+                where = f'{where} AND {condition}'
+                params.update(condition_params)
+
+        n_rows = int(self.read(f"SELECT COUNT(*) AS n FROM {TABLE} WHERE {where}", params)['n'].iloc[0])
+        page_count = max(1, -(-n_rows // page_size))
+        page_current = min(page_current or 0, page_count - 1)
+
+        # nulls sort last ascending and first descending, as SortIndex ranks them; newest rows first otherwise
+        order = [f"{self.quote(s['column_id'])} {'ASC NULLS LAST' if s['direction'] == 'asc' else 'DESC NULLS FIRST'}"
+                 for s in (sort_by or []) if s['column_id'] in self.columns]
+        order.append('scraped_date DESC')
+        df_page = self.read(f"SELECT * FROM {TABLE} WHERE {where} ORDER BY {', '.join(order)} "
+                           f"LIMIT :limit OFFSET :offset",
+                           {**params, 'limit': page_size, 'offset': page_current * page_size})
+        return optimize_dtypes(df_page, TABLE), page_current, page_count
+
+    def similar(self, listing_id, k=SIMILAR_K):
+        # utilities.similar.SimilarIndex answered by an ORDER BY distance over the listing's brand and
+        # category, which the (brand, category, ...) index narrows down to
+        listing = self.read(f"SELECT {', '.join(GROUP_COLUMNS + SIMILAR_COLUMNS)} FROM {TABLE} WHERE id = :id",
+                            {'id': int(listing_id)})
+        if not len(listing) or listing.iloc[0].isnull().any():
+            df = self.read(f"SELECT * FROM {TABLE} WHERE 1 = 0")
+            return optimize_dtypes(df, TABLE).assign(distance=np.empty(0))
+        params = {'id': int(listing_id), 'k': k, **{col: listing.iloc[0][col] for col in GROUP_COLUMNS}}
+        terms = []
+        for col in SIMILAR_COLUMNS:
+            params.update({f'{col}_value': float(listing.iloc[0][col]), f'{col}_scale': self.similar_scale[col]})
+            term = f'(({col} - :{col}_value) / :{col}_scale)'
+            terms.append(f'{term} * {term}')
+        df = self.read(f"SELECT *, {' + '.join(terms)} AS distance FROM {TABLE} "
+                      f"WHERE {similar_where()} AND brand = :brand AND category = :category AND id <> :id "
+                      f"ORDER BY distance, id LIMIT :k", params)
+        df['distance'] = np.sqrt(df['distance'].to_numpy(dtype=np.float64))
+        return optimize_dtypes(df.drop(columns='distance'), TABLE).assign(distance=df['distance'])
+
+    def export(self, filters, columns, limit):
+        # The selected rows newest first, streamed from the database CHUNK_SIZE at a time
+        where, params = where_clause(filters)
+        yield from self.read_chunks(f"SELECT {', '.join(self.quote(col) for col in columns)} FROM {TABLE} "
+                                    f"WHERE {where} ORDER BY scraped_date DESC LIMIT :limit",
+                                    {**params, 'limit': int(limit)})
+
+    def condition_sql(self, column, operator, value, case_sensitive, name):
+        # SQL of one utilities.datatable.condition_mask condition
+        col = self.quote(column)
+        as_text = f'CAST({col} AS VARCHAR)'
+        if operator in ('is blank', 'is not blank'):
+            blank = f"({col} IS NULL OR {as_text} = '')"
+            return (blank if operator == 'is blank' else f'NOT {blank}'), {}
+        if operator == 'datestartswith':
+            return f"{as_text} LIKE :{name}", {name: value_text(value) + '%'}
+        if operator == 'contains':
+            if case_sensitive:
+                return f'{self.position(as_text, ":" + name)} > 0', {name: value_text(value)}
+            return f'{self.position(f"LOWER({as_text})", ":" + name)} > 0', {name: value_text(value).lower()}
+
+        sql_operator = '<>' if operator == '!=' else operator
+        if isinstance(value, float) and column in self.numeric_columns:
+            return f'{col} {sql_operator} :{name}', {name: value}
+        value = value_text(value)
+        if not case_sensitive:
+            return f'LOWER({as_text}) {sql_operator} :{name}', {name: value.lower()}
+        return f'{as_text} {sql_operator} :{name}', {name: value}
+
+
+def column_kind(column_type):
+    try:
+        python_type = column_type.python_type
+    except NotImplementedError:
+        return None
+    if python_type is bool:
+        return 'bool'
+    return 'number' if issubclass(python_type, Number) else None
+
+
+def load_sql_dataset():
+    return SqlDataset(get_daily_count("master", by='source', max_scraped_date=raw_min_date()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create the indexes used by QUERY_ENGINE=sql')
+    parser.parse_args()
+    create_indexes()